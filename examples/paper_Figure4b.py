@@ -72,6 +72,20 @@ if __name__ == '__main__':
     total_pc_opt = np.sum([x*y for (x,y) in zip(pop_pc, list_x0R_opt)])
     total_pc_worst = np.sum([x*y for (x,y) in zip(pop_pc, list_x0R_worst)])
 
+    # the allocations above were found offline for the paper. optimise_allocation minimises
+    # the final size of this model instead, which for these contact rates fills the two
+    # oldest groups first, so it does not reproduce them (see mitepid.analysis.vaccination).
+    # It takes well under a second, e.g. for another country.
+    recalculate_allocations = False
+    if recalculate_allocations:
+        from mitepid.analysis.vaccination import optimise_allocation
+        x0_alloc = [1e-5]*Ng + [0]*Ng + [1e-5]*Ng
+        dict_alloc = dict(model_type=model_type, x0=x0_alloc, B=B_opt_country, Gamma=Gamma,
+                          Sigma=Sigma, total=total_pc_opt, country=country, policy=1.5,
+                          objective='final_size', R_min=0.05, R_max=0.95)
+        list_x0R_opt = list(optimise_allocation(**dict_alloc)['x0R'])
+        list_x0R_worst = list(optimise_allocation(worst=True, **dict_alloc)['x0R'])
+
     list_labels = ['uniform', 'optimised', 'worst']
     list_labels = ['uniform', 'optimised',]
     x0I = 1e-5
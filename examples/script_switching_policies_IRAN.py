@@ -97,49 +97,17 @@ if __name__ == '__main__':
     epid_obj.plot_strat()
     epid_obj.plot_strat_multiax()
 
-    # %%
+    # %% extending the previous simulation: the first 271 days are not simulated again
     t_end = 541
     t_s = 60
-    list_t_switch = [0] + list(np.arange(t_s, t_s + 30 * 8, 30))
     str_ts = '_start_' + str(t_s) + 'D'
-    all_containment_list = ['Uncontained',
-                            1.5,
-                            1.2,
-                            1.5,
-                            1.2,
-                            1.5,
-                            1.2,
-                            1.5,
-                            'Uncontained',
-                           ]
     policy_name = 'Iran_future_estimate_uncontained_' + str_ts
 
-
-    ref_obj = epid_sim(model_type=model_type,
-                    B=B_opt_country,
-                    Gamma=Gamma,
-                    Sigma=Sigma,
-                    dir_save_plots_main=dir_save_plots,
-                    country='Iran',
-                    policy_list=['Uncontained'],
-                    policy_switch_times=[0],
-                    x0=x0_vec,
+    ref_obj.extend(t_end=t_end)
+    epid_obj.extend(new_switch_times=[t_s + 30 * 7],
+                    new_policies=['Uncontained'],
                     t_end=t_end,
-                    str_policy='Uncontained',
-                    group_labels=age_groups,)
-    epid_obj = epid_sim(model_type=model_type,
-                        B=B_opt_country,
-                        Gamma=Gamma,
-                        Sigma=Sigma,
-                        dir_save_plots_main=dir_save_plots,
-                        country=country,
-                        policy_list=all_containment_list,
-                        policy_switch_times=list_t_switch,
-                        x0=x0_vec,
-                        t_end=t_end,
-                        str_policy=policy_name,
-                        group_labels=age_groups,
-                        ref_class=ref_obj)
+                    str_policy=policy_name)
     epid_obj.plot_agg()
     epid_obj.plot_strat()
     epid_obj.plot_strat_multiax()
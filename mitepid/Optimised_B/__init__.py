@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Catalog of the optimised contact rates in this folder.
+
+File names are parsed once into an index of model type, infectious period (Ti), R0 of the
+optimisation and variant. The contents of each file are parsed once, on first use:
+
+    from mitepid.Optimised_B import catalog
+    B_opt = catalog.get(Ti=5, R0=2.95)['B_opt']
+
+The files are read from mat_bundle.npy/mat_bundle.json, a memory-mapped pack of all of them,
+so scipy.io is not needed. The bundle is built with the package (see setup.py). In a checkout,
+or after adding or changing a mat file, build it with:
+
+    catalog.build_bundle()
+
+Without an up-to-date bundle, the mat files are parsed with scipy.io.
+
+@author: MiTepid contributors
+"""
+
+
+class optimised_B_catalog:
+    """A queryable index of the mat files holding optimised contact rates."""
+
+    ###
+    def __init__(self, dir_B_opt=None):
+        """
+        Scan the folder and parse the file names.
+
+        Parameters
+        ----------
+        dir_B_opt : pathlib.Path, optional
+            folder of the mat files. The default is None, i.e. this folder.
+
+        Returns
+        -------
+        None.
+
+        """
+        from pathlib import Path
+
+        if dir_B_opt is None:
+            dir_B_opt = Path(__file__).parent
+        self.dir_B_opt = Path(dir_B_opt)
+        self.list_entries = [self.parse_filename(file)
+                             for file in sorted(self.dir_B_opt.glob('B_opt_*.mat'))]
+
+    @staticmethod
+    def parse_filename(file):
+        """
+        Parse the name of a file of optimised contact rates.
+
+        Two naming schemes are used:
+            B_opt_SEIR_Ti_5_R0_2.95.mat, B_opt_SEIR_Ti_15_R0_2.95_b.mat
+            B_opt_SEIR_I5_E4p6.mat, B_opt_SIR_I9p6.mat (older files, R0 is not in the name)
+
+        Parameters
+        ----------
+        file : pathlib.Path
+            the mat file.
+
+        Returns
+        -------
+        entry : dict
+            'file', 'model_type', 'Ti' (infectious period), 'Te' (incubation period, None if
+            not in the name), 'R0' (None if not in the name) and 'variant' ('' for the main
+            file).
+
+        """
+        import re
+
+        entry = {'file': file, 'model_type': None, 'Ti': None, 'Te': None, 'R0': None,
+                 'variant': ''}
+        match = re.fullmatch(r'B_opt_([A-Z]+)_Ti_([\d.]+)_R0_([\d.]+?)(?:_(\w+))?', file.stem)
+        if match:
+            entry['model_type'] = match.group(1)
+            entry['Ti'] = float(match.group(2))
+            entry['R0'] = float(match.group(3))
+            entry['variant'] = match.group(4) or ''
+            return entry
+        match = re.fullmatch(r'B_opt_([A-Z]+)_I([\dp]+)(?:_E([\dp]+))?', file.stem)
+        if match:
+            entry['model_type'] = match.group(1)
+            entry['Ti'] = float(match.group(2).replace('p', '.'))
+            if match.group(3):
+                entry['Te'] = float(match.group(3).replace('p', '.'))
+            return entry
+        entry['variant'] = file.stem
+        return entry
+
+    def find(self, model_type=None, Ti=None, R0=None, Te=None, variant=''):
+        """
+        Return all entries matching the query. Arguments which are None are not checked.
+
+        Parameters
+        ----------
+        model_type : str, optional
+            'SIS', 'SIR' or 'SEIR'. The default is None.
+        Ti : float, optional
+            infectious period, in days. The default is None.
+        R0 : float, optional
+            R0 used in the optimisation. The default is None.
+        Te : float, optional
+            incubation period, in days. The default is None.
+        variant : str, optional
+            variant suffix in the file name. The default is '', i.e. the main file.
+
+        Returns
+        -------
+        list_entries : list of dict
+            see parse_filename.
+
+        """
+        import numpy as np
+
+        dict_query = {'model_type': model_type, 'Ti': Ti, 'R0': R0, 'Te': Te,
+                      'variant': variant}
+        list_entries = []
+        for entry in self.list_entries:
+            is_match = True
+            for key, value in dict_query.items():
+                if value is None:
+                    continue
+                if isinstance(value, str):
+                    is_match = is_match and entry[key] == value
+                else:
+                    is_match = is_match and entry[key] is not None and \
+                        bool(np.isclose(entry[key], value))
+            if is_match:
+                list_entries.append(entry)
+        return list_entries
+
+    def get(self, model_type=None, Ti=None, R0=None, Te=None, variant='', var_name=None):
+        """
+        Return the contents of the unique file matching the query.
+
+        Parameters
+        ----------
+        model_type, Ti, R0, Te, variant :
+            the query, see find.
+        var_name : str, optional
+            variable to return, e.g. 'B_opt', 'Gamma' or 'Sigma'. The default is None, i.e.
+            all variables.
+
+        Raises
+        ------
+        ValueError
+            if no file or more than one file match the query.
+
+        Returns
+        -------
+        data : dict or numpy array
+            variables of the file, or only var_name. Arrays are read-only and shared, copy
+            them before changing them.
+
+        """
+        data = self.load(self.get_file(model_type=model_type, Ti=Ti, R0=R0, Te=Te,
+                                       variant=variant))
+        if var_name is None:
+            return data
+        return data[var_name]
+
+    def get_file(self, model_type=None, Ti=None, R0=None, Te=None, variant=''):
+        """Return the path of the unique file matching the query, see get."""
+        list_entries = self.find(model_type=model_type, Ti=Ti, R0=R0, Te=Te, variant=variant)
+        if len(list_entries) != 1:
+            list_files = [entry['file'].name for entry in list_entries]
+            raise ValueError('Query should match exactly one file, it matches: '
+                             + str(list_files))
+        return list_entries[0]['file']
+
+    def build_bundle(self, ):
+        """Pack all files of the folder into one bundle, see utils.build_mat_bundle."""
+        from mitepid.utils import build_mat_bundle
+
+        return build_mat_bundle(self.dir_B_opt)
+
+    @staticmethod
+    def load(file):
+        """Return the variables of a mat file, parsed only once, see utils.load_mat_dict."""
+        from mitepid.utils import load_mat_dict
+
+        data_struct = load_mat_dict(file)
+        return {key: value for key, value in data_struct.items() if '__' not in key}
+
+
+catalog = optimised_B_catalog()
@@ -0,0 +1,445 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+R0 of many policies at once, for policy design loops.
+
+A policy scales the rows of the contact matrix, B_policy = diag(s) @ B, see utils.scale_B_opt,
+so R0 is the spectral radius of the next generation matrix
+    K(s) = diag(s * q) @ B,
+with q = 1 / (gamma + mu) for SIS and SIR and q = sigma / ((sigma + mu) * (gamma + mu)) for
+SEIR (for Mu = 0 the same as policies.spectral_radius). R0_engine evaluates it for a batch of
+scale vectors (N_batch x Ng) with power iterations on the whole batch, which are a few small
+matrix products each, instead of one LAPACK call per matrix:
+
+    engine = R0_engine(B, 'SEIR', Gamma, Sigma=Sigma)
+    rho = engine.R0(arr_scales)  # (N_batch)
+    rho, grad = engine.gradient(arr_scales)  # grad: d rho / d s, (N_batch x Ng)
+
+If B is similar to a symmetric matrix by a diagonal scaling, i.e. B = diag(h)^(1/2) @ A @
+diag(h)^(-1/2) with A symmetric (e.g. for reciprocal contacts, B_ij * p_i = B_ji * p_j), then
+K(s) is similar to the symmetric diag(v)^(1/2) @ A @ diag(v)^(1/2), v = s * q, and one
+eigenvector gives both R0 and its gradient. Otherwise left and right eigenvectors are iterated.
+The iterations stop on the Collatz-Wielandt bounds and start from the eigenvectors of the
+previous call, which are good guesses in optimisation loops. Rows which do not converge fall
+back to numpy.linalg.eig.
+
+The gradient is d rho / d s_k = q_k * l_k * (B @ r)_k / (l . r), for left and right Perron
+vectors l and r; in the symmetric form it is rho * w_k^2 / s_k for the Perron vector w.
+
+@author: MiTepid contributors
+"""
+
+
+def next_generation_factors(model_type, Gamma, Mu=None, Sigma=None):
+    """
+    Return q, the factors of the next generation matrix diag(s * q) @ B.
+
+    Parameters
+    ----------
+    model_type : str
+        'SIS', 'SIR' or 'SEIR'.
+    Gamma : numpy array
+        diagonal matrix of recovery rates, or its diagonal.
+    Mu : numpy array, optional
+        birth/death rates, as Gamma. The default is None.
+    Sigma : numpy array, optional
+        inhibition rates, as Gamma, needed for SEIR. The default is None.
+
+    Returns
+    -------
+    q : numpy array
+        (Ng), expected infectious time times the chance to become infectious.
+
+    """
+    import numpy as np
+    from mitepid.analysis.equilibrium import _diag_rates
+
+    gamma = np.asarray(_diag_rates(Gamma, np.shape(Gamma)[-1]), dtype=float)
+    Ng = gamma.shape[-1]
+    mu = _diag_rates(Mu, Ng)
+    q = 1 / (gamma + mu)
+    if model_type == 'SEIR':
+        sigma = _diag_rates(Sigma, Ng)
+        q = q * sigma / (sigma + mu)
+    return q
+
+
+class R0_engine:
+    """Batched spectral radii of diag(s * q) @ B and their gradients with respect to s."""
+
+    def __init__(self, B, model_type='SIR', Gamma=None, Mu=None, Sigma=None, q=None,
+                 rtol=1e-10, max_iter=500):
+        """
+        Initialise the engine.
+
+        Parameters
+        ----------
+        B : numpy 2D array
+            matrix of contact rates, without any policy.
+        model_type : str, optional
+            'SIS', 'SIR' or 'SEIR'. The default is 'SIR'.
+        Gamma, Mu, Sigma : numpy array, optional
+            rates, see next_generation_factors. Gamma is needed unless q is given.
+        q : numpy array, optional
+            factors of the next generation matrix, instead of the rates. The default is None.
+        rtol : float, optional
+            relative tolerance of R0. The default is 1e-10.
+        max_iter : int, optional
+            maximum number of power iterations, before falling back to numpy.linalg.eig.
+            The default is 500.
+
+        Returns
+        -------
+        None.
+
+        """
+        import numpy as np
+
+        self.B = np.array(B, dtype=float)
+        self.Ng = self.B.shape[0]
+        if q is None:
+            q = next_generation_factors(model_type, Gamma, Mu, Sigma)
+        self.q = np.broadcast_to(np.asarray(q, dtype=float), (self.Ng,)).copy()
+        self.rtol = rtol
+        self.max_iter = max_iter
+        self.A, self.sqrt_h = self.symmetrise(self.B)
+        self.is_symmetric = self.A is not None
+        # eigenvectors of the last call, to start the next one
+        self.right_last = None
+        self.left_last = None
+
+    @staticmethod
+    def symmetrise(B, rtol=1e-10):
+        """
+        Find A symmetric and h > 0 with B = diag(h)^(1/2) @ A @ diag(h)^(-1/2).
+
+        Parameters
+        ----------
+        B : numpy 2D array
+            matrix of contact rates.
+        rtol : float, optional
+            relative tolerance of the symmetry of A. The default is 1e-10.
+
+        Returns
+        -------
+        A : numpy 2D array or None
+            the symmetric matrix, None if B cannot be symmetrised.
+        sqrt_h : numpy array or None
+            square root of h.
+
+        """
+        import numpy as np
+
+        if np.any(B < 0) or np.any(B[0] <= 0) or np.any(B[:, 0] <= 0):
+            return None, None
+        # h_i / h_j = B_ij / B_ji
+        sqrt_h = np.sqrt(B[:, 0] / B[0, :])
+        A = B * (sqrt_h[None, :] / sqrt_h[:, None])
+        if np.max(np.abs(A - A.T)) > rtol * np.max(np.abs(A)):
+            return None, None
+        return 0.5 * (A + A.T), sqrt_h
+
+    def R0(self, list_scales):
+        """
+        Return R0 of policies.
+
+        Parameters
+        ----------
+        list_scales : numpy array
+            scales of the rows of B, (... x Ng), or (... x 1) for the same scale in all rows.
+
+        Returns
+        -------
+        rho : numpy array
+            (...), spectral radius of diag(s * q) @ B for each scale vector s.
+
+        """
+        return self.solve(list_scales)[0]
+
+    def gradient(self, list_scales):
+        """
+        Return R0 of policies and its gradient with respect to the scales.
+
+        Parameters
+        ----------
+        list_scales : numpy array
+            scales of the rows of B, (... x Ng).
+
+        Returns
+        -------
+        rho : numpy array
+            (...), spectral radius of diag(s * q) @ B for each scale vector s.
+        grad : numpy array
+            (... x Ng), d rho / d s.
+
+        """
+        import numpy as np
+
+        rho, right, left = self.solve(list_scales)
+        if self.is_symmetric:
+            # w_k = sqrt(v_k) * y_k / rho, with y = A @ (sqrt(v) * w), so rho * w_k^2 / v_k
+            # = y_k^2 / rho, which also holds for v_k = 0
+            v = self._v(list_scales)
+            y = (np.sqrt(v) * right) @ self.A
+            grad = self.q * y**2 / np.where(rho > 0, rho, 1)[..., None]
+        else:
+            Br = right @ self.B.T
+            lr = np.sum(left * right, axis=-1)
+            grad = self.q * left * Br / np.where(lr > 0, lr, 1)[..., None]
+        return rho, grad
+
+    def solve(self, list_scales):
+        """
+        Return R0 and the Perron vectors of policies, see R0.
+
+        Returns
+        -------
+        rho : numpy array
+            (...), spectral radii.
+        right : numpy array
+            (... x Ng), unit right Perron vectors, of the symmetric form if is_symmetric.
+        left : numpy array or None
+            (... x Ng), left Perron vectors with left . right = 1, None if is_symmetric.
+
+        """
+        import numpy as np
+
+        v = self._v(list_scales)
+        shape = v.shape
+        v = v.reshape(-1, self.Ng)
+        # right Perron vectors are zero where v is zero, left ones are not
+        x_right = self._start(self.right_last, v) * (v > 0)
+        if self.is_symmetric:
+            sqrt_v = np.sqrt(v)
+            matvec = lambda x, idx: sqrt_v[idx] * ((sqrt_v[idx] * x) @ self.A)
+            rho, right, is_conv = self._power(matvec, x_right)
+            left = None
+        else:
+            matvec = lambda x, idx: v[idx] * (x @ self.B.T)
+            rmatvec = lambda x, idx: (v[idx] * x) @ self.B
+            rho, right, is_conv = self._power(matvec, x_right)
+            _, left, is_conv_left = self._power(rmatvec, self._start(self.left_last, v))
+            is_conv = is_conv & is_conv_left
+        if not np.all(is_conv):
+            idx = np.flatnonzero(~is_conv)
+            rho[idx], right[idx], left_idx = self._eig(v[idx])
+            if left is not None:
+                left[idx] = left_idx
+        self.right_last = right
+        self.left_last = left
+        if left is not None:
+            lr = np.sum(left * right, axis=-1, keepdims=True)
+            left = left / np.where(lr > 0, lr, 1)
+            left = left.reshape(shape)
+        return rho.reshape(shape[:-1]), right.reshape(shape), left
+
+    # %% helpers
+    def _v(self, list_scales):
+        """Return s * q, (... x Ng)."""
+        import numpy as np
+
+        scales = np.asarray(list_scales, dtype=float)
+        return np.broadcast_to(scales * self.q, scales.shape[:-1] + (self.Ng,))
+
+    def _start(self, x_last, v):
+        """Start vectors, the last ones if the batch has the same size."""
+        import numpy as np
+
+        if x_last is not None and x_last.shape == v.shape:
+            return np.abs(x_last) + 1e-3 * np.max(np.abs(x_last), axis=-1, keepdims=True)
+        return np.ones(v.shape)
+
+    def _power(self, matvec, x):
+        """
+        Power iterations on a batch of non-negative matrices.
+
+        Returns
+        -------
+        rho : numpy array
+            (N_batch), midpoint of the Collatz-Wielandt bounds.
+        x : numpy array
+            (N_batch x Ng), unit Perron vectors.
+        is_conv : numpy array of bool
+            (N_batch), if the bounds agree within rtol.
+
+        """
+        import numpy as np
+
+        N_batch = x.shape[0]
+        rho = np.zeros(N_batch)
+        is_conv = np.zeros(N_batch, dtype=bool)
+        idx_active = np.arange(N_batch)
+        x = x / np.maximum(np.linalg.norm(x, axis=-1, keepdims=True), 1e-300)
+        for it in np.arange(self.max_iter):
+            x_act = x[idx_active]
+            y = matvec(x_act, idx_active)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ratios = np.where(x_act > 0, y / x_act, np.nan)
+            lo = np.nanmin(np.where(np.isnan(ratios), np.inf, ratios), axis=-1)
+            hi = np.nanmax(np.where(np.isnan(ratios), -np.inf, ratios), axis=-1)
+            norm_y = np.linalg.norm(y, axis=-1)
+            # zero matrices have zero spectral radius
+            is_zero = norm_y == 0
+            lo[is_zero] = 0
+            hi[is_zero] = 0
+            is_done = (hi - lo <= self.rtol * hi) | is_zero
+            rho[idx_active] = 0.5 * (lo + hi)
+            x[idx_active] = np.where(is_zero[:, None], x_act,
+                                     y / np.where(is_zero, 1, norm_y)[:, None])
+            is_conv[idx_active[is_done]] = True
+            idx_active = idx_active[~is_done]
+            if len(idx_active) == 0:
+                break
+        return rho, x, is_conv
+
+    def _eig(self, v):
+        """Perron root and vectors with numpy.linalg.eig, for rows which did not converge."""
+        import numpy as np
+
+        if self.is_symmetric:
+            sqrt_v = np.sqrt(v)
+            M = sqrt_v[:, :, None] * self.A * sqrt_v[:, None, :]
+            w, V = np.linalg.eigh(M)
+            return w[:, -1], np.abs(V[:, :, -1]), None
+        K = v[:, :, None] * self.B
+        w, V = np.linalg.eig(K)
+        idx = np.argmax(w.real, axis=-1)
+        right = np.abs(np.take_along_axis(V, idx[:, None, None], axis=-1)[..., 0].real)
+        wl, VL = np.linalg.eig(np.swapaxes(K, -1, -2))
+        idx_l = np.argmax(wl.real, axis=-1)
+        left = np.abs(np.take_along_axis(VL, idx_l[:, None, None], axis=-1)[..., 0].real)
+        rho = np.take_along_axis(w.real, idx[:, None], axis=-1)[:, 0]
+        return rho, right / np.linalg.norm(right, axis=-1, keepdims=True), left
+
+
+
+# %% policies with a target R0
+# the solutions of target_R0_scales, keyed on a hash of B and D, the target and the weights,
+# the least recently used is evicted first
+target_R0_cache_size = 1024
+dict_target_R0_cache = {}
+
+
+def target_R0_scales(B, D, R0_target, weights=None, scale_min=1e-6, tol=1e-9):
+    """
+    Return the scales of the rows of B with the least disruption, which reach a target R0.
+
+    The scales s minimise the weighted squared log reductions, sum(weights * log(s)^2) / 2,
+    subject to the spectral radius of inv(D) @ diag(s) @ B being at most R0_target and
+    scale_min <= s <= 1. The spectral radius is log-convex in log(s), so this is a convex
+    problem, solved with SLSQP and the analytic gradient of R0, see R0_engine.gradient.
+    The solution is then scaled to hit the target exactly. If SLSQP fails, or its solution
+    costs more than the uniform scales, the uniform scales are used with a warning.
+    Results are cached, the returned array is read-only.
+
+    Parameters
+    ----------
+    B : numpy 2D array
+        matrix of contact rates, without any policy.
+    D : numpy 2D array
+        diagonal matrix of recovery and death rates, Gamma + Mu.
+    R0_target : float
+        the target R0.
+    weights : numpy array, optional
+        cost of reducing the contacts of each group, (Ng). The default is None, i.e. equal.
+    scale_min : float, optional
+        smallest allowed scale. The default is 1e-6.
+    tol : float, optional
+        tolerance of SLSQP. The default is 1e-9.
+
+    Returns
+    -------
+    list_scales : numpy array
+        (Ng), scales of the rows of B, read-only. All ones if R0 of B is below the target.
+
+    """
+    import warnings
+    import numpy as np
+    from scipy.optimize import minimize
+    from mitepid.policies import hash_arrays
+
+    B = np.asarray(B, dtype=float)
+    D = np.asarray(D, dtype=float)
+    Ng = B.shape[0]
+    if weights is None:
+        weights = np.ones(Ng)
+    weights = np.broadcast_to(np.asarray(weights, dtype=float), (Ng,))
+    key = (hash_arrays(B, D, weights), float(R0_target), scale_min)
+    if key in dict_target_R0_cache:
+        # move it to the end, as the most recently used
+        list_scales = dict_target_R0_cache.pop(key)
+        dict_target_R0_cache[key] = list_scales
+        return list_scales
+
+    engine = R0_engine(B, q=1 / np.diag(D))
+    R0_full = float(engine.R0(np.ones(Ng)))
+    if R0_target >= R0_full:
+        list_scales = np.ones(Ng)
+    elif R0_target <= scale_min * R0_full:
+        warnings.warn('Target R0 is below R0 with all scales at scale_min.', RuntimeWarning)
+        list_scales = np.full(Ng, scale_min)
+    else:
+        log_target = np.log(R0_target)
+
+        def _constraint(x):
+            return log_target - np.log(engine.R0(np.exp(x)))
+
+        def _constraint_jac(x):
+            s = np.exp(x)
+            rho, grad = engine.gradient(s)
+            return -grad * s / rho
+
+        # uniform scaling is on the boundary of the feasible set
+        x_uniform = np.full(Ng, np.log(R0_target / R0_full))
+        res = minimize(lambda x: 0.5 * np.sum(weights * x**2), x_uniform,
+                       jac=lambda x: weights * x, method='SLSQP',
+                       bounds=[(np.log(scale_min), 0)] * Ng,
+                       constraints=[{'type': 'ineq', 'fun': _constraint,
+                                     'jac': _constraint_jac}],
+                       options={'ftol': tol, 'maxiter': 200})
+        # SLSQP often stops close to the optimum with a failed line search, so its solution
+        # is used whenever it is better than uniform scaling. The constraint holds up to the
+        # tolerance of SLSQP, the target is hit after scaling.
+        is_optimised = np.all(np.isfinite(res.x))
+        if is_optimised:
+            list_scales = _scale_to_target(engine, np.exp(res.x), R0_target, scale_min)
+            is_optimised = np.sum(weights * np.log(list_scales)**2) \
+                <= np.sum(weights * x_uniform**2)
+        if not is_optimised:
+            list_scales = np.exp(x_uniform)
+            warnings.warn('Target R0 was not optimised (' + str(res.message) + '), the '
+                          'contacts of all groups are scaled uniformly.', RuntimeWarning)
+    list_scales.setflags(write=False)
+    if len(dict_target_R0_cache) >= target_R0_cache_size:
+        # dicts keep insertion order, the first item is the least recently used
+        dict_target_R0_cache.pop(next(iter(dict_target_R0_cache)))
+    dict_target_R0_cache[key] = list_scales
+    return list_scales
+
+
+def _scale_to_target(engine, list_scales, R0_target, scale_min):
+    """
+    Scale all rows by a common factor, clipped to [scale_min, 1], to hit R0_target.
+
+    R0 is non-decreasing in the factor, from R0 with all scales at scale_min to R0 with all
+    scales at 1, and the target is between them, so the factor is found by root finding.
+    """
+    import numpy as np
+    from scipy.optimize import brentq
+
+    list_scales = np.clip(list_scales, scale_min, 1)
+
+    def _g(log_c):
+        return np.log(engine.R0(np.clip(list_scales * np.exp(log_c), scale_min, 1))) \
+            - np.log(R0_target)
+
+    g0 = _g(0.)
+    if abs(g0) <= engine.rtol:
+        # on the target, up to the accuracy of R0
+        return list_scales
+    if g0 > 0:
+        log_c_bound = np.log(scale_min / np.max(list_scales))
+    else:
+        log_c_bound = np.log(1 / np.min(list_scales))
+    log_c = brentq(_g, min(0., log_c_bound), max(0., log_c_bound), xtol=engine.rtol)
+    return np.clip(list_scales * np.exp(log_c), scale_min, 1)
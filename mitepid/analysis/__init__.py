@@ -0,0 +1,17 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Analysis of the models without time integration.
+
+    from mitepid.analysis import final_size, endemic_equilibrium
+    R_inf = final_size('SEIR', x0, B, Gamma, Sigma=Sigma)
+
+@author: MiTepid contributors
+"""
+from mitepid.analysis.equilibrium import final_size, endemic_equilibrium
+from mitepid.analysis.R0 import R0_engine, next_generation_factors
+from mitepid.analysis.schedule import optimise_schedule
+from mitepid.analysis.vaccination import optimise_allocation
+
+__all__ = ['final_size', 'endemic_equilibrium', 'R0_engine', 'next_generation_factors',
+           'optimise_schedule', 'optimise_allocation']
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Final size of an epidemic and endemic equilibria, found directly from the model parameters.
+
+Both are found with Newton's method, vectorised over any leading (batch) dimensions of the
+inputs, e.g. many contact matrices (N_batch x Ng x Ng) or initial conditions
+(N_batch x N_states) at once.
+
+Final size (SIR and SEIR, Mu = 0). With S = 1 - I - R - E, dS/dt = -S * (B @ I) and
+dR/dt = Gamma * I, the susceptible ratio at the end of the epidemic solves
+    log(S_inf) = log(S_0) - B @ ((1 - S_inf - R_0) / gamma),
+where S_0 and R_0 are the initial ratios. Then R_inf = 1 - S_inf.
+
+Endemic equilibrium. In equilibrium R = gamma / mu * I and E = (mu + gamma) / sigma * I, so
+for all three models the infectious ratio solves
+    (1 - c * I) * (B @ I) = a * I,
+with c = 1, a = gamma + mu for SIS; c = 1 + gamma / mu, a = gamma + mu for SIR and
+c = 1 + gamma / mu + (mu + gamma) / sigma, a = (mu + sigma) * (mu + gamma) / sigma for SEIR.
+There is an endemic equilibrium if the spectral radius of B / a is larger than 1.
+
+@author: MiTepid contributors
+"""
+
+
+def final_size(model_type, x0, B, Gamma, Mu=None, Sigma=None, country=None, policy=None,
+               tol=1e-12, max_iter=50):
+    """
+    Return the final ratio of recovered in each group, without integrating the model.
+
+    Parameters
+    ----------
+    model_type : str
+        'SIR' or 'SEIR'.
+    x0 : list of float, or numpy array
+        initial condition, as in epid_sim, or (... x N_states).
+    B : numpy array
+        matrix of contact rates, (... x Ng x Ng).
+    Gamma : numpy array
+        diagonal matrix of recovery rates, (... x Ng x Ng), or their diagonal (... x Ng).
+    Mu : numpy array, optional
+        birth/death rates, as Gamma. Only zero is allowed. The default is None.
+    Sigma : numpy array, optional
+        inhibition rates of SEIR. They do not change the final size. The default is None.
+    country : str, optional
+        country of the policy. The default is None.
+    policy : str or float, optional
+        if given, the contact rates of this policy are used, see policies.get_B_policy.
+        The default is None, i.e. B.
+    tol : float, optional
+        tolerance of the Newton steps. The default is 1e-12.
+    max_iter : int, optional
+        maximum number of Newton steps. The default is 50.
+
+    Raises
+    ------
+    ValueError
+        for SIS, for nonzero Mu or for nonpositive recovery rates.
+
+    Returns
+    -------
+    R_inf : numpy array
+        (... x Ng), final ratio of recovered in each group, including the initial R.
+
+    """
+    import numpy as np
+
+    if model_type not in ['SIR', 'SEIR']:
+        raise ValueError('Final size is only defined for SIR and SEIR models.')
+    B, gamma, mu, _ = _sort_out_rates(B, Gamma, Mu, Sigma, country, policy)
+    if np.any(mu != 0):
+        raise ValueError('Final size is only defined for Mu = 0, see endemic_equilibrium.')
+    if np.any(gamma <= 0):
+        raise ValueError('Final size needs positive recovery rates.')
+    Ng = B.shape[-1]
+    x0 = _sort_out_x0(x0, model_type, Ng)
+    I_0 = x0[..., :Ng]
+    R_0 = x0[..., Ng:2*Ng]
+    E_0 = x0[..., 2*Ng:3*Ng] if model_type == 'SEIR' else np.zeros_like(I_0)
+    S_0 = 1 - I_0 - R_0 - E_0
+    shape = np.broadcast_shapes(B.shape[:-2], gamma.shape[:-1], x0.shape[:-1]) + (Ng,)
+    B = np.broadcast_to(B, shape + (Ng,))
+    gamma = np.broadcast_to(gamma, shape)
+    S_0 = np.broadcast_to(S_0, shape)
+    R_0 = np.broadcast_to(R_0, shape)
+
+    # Newton in y = log(S_inf). Starting from the lower bound S_0 * exp(-B @ ((1 - R_0) / gamma)),
+    # the iterates increase monotonically to the root, as the equations are concave in y.
+    log_S_0 = np.log(S_0)
+    y = log_S_0 - _matvec(B, (1 - R_0) / gamma)
+    Id = np.eye(Ng)
+    for _ in np.arange(max_iter):
+        s_gamma = np.exp(y) / gamma
+        F = y - log_S_0 + _matvec(B, (1 - R_0) / gamma - s_gamma)
+        J = Id - B * s_gamma[..., None, :]
+        step = np.linalg.solve(J, F[..., None])[..., 0]
+        y = np.minimum(y - step, log_S_0)
+        if np.max(np.abs(step), initial=0) < tol:
+            break
+    R_inf = 1 - np.exp(y)
+    # without infections there is no epidemic
+    no_infection = np.all(np.broadcast_to(I_0 + E_0, shape) == 0, axis=-1)
+    R_inf[no_infection] = R_0[no_infection]
+    return R_inf
+
+
+def endemic_equilibrium(model_type, B, Gamma, Mu=None, Sigma=None, country=None, policy=None,
+                        tol=1e-12, max_iter=100):
+    """
+    Return the endemic equilibrium, or the disease-free one if there is no endemic equilibrium.
+
+    Parameters
+    ----------
+    model_type : str
+        'SIS', 'SIR' or 'SEIR'.
+    B : numpy array
+        matrix of contact rates, (... x Ng x Ng).
+    Gamma : numpy array
+        diagonal matrix of recovery rates, (... x Ng x Ng), or their diagonal (... x Ng).
+    Mu : numpy array, optional
+        birth/death rates, as Gamma. They should be positive for SIR and SEIR.
+        The default is None.
+    Sigma : numpy array, optional
+        inhibition rates, as Gamma, needed for SEIR. The default is None.
+    country : str, optional
+        country of the policy. The default is None.
+    policy : str or float, optional
+        if given, the contact rates of this policy are used, see policies.get_B_policy.
+        The default is None, i.e. B.
+    tol : float, optional
+        tolerance of the Newton steps. The default is 1e-12.
+    max_iter : int, optional
+        maximum number of Newton steps. The default is 100.
+
+    Raises
+    ------
+    ValueError
+        for SIR and SEIR with zero Mu, where every state without infections is an equilibrium.
+
+    Returns
+    -------
+    x_eq : numpy array
+        (... x N_states), the equilibrium, with the states in the same order as in epid_sim.
+
+    """
+    import numpy as np
+
+    B, gamma, mu, sigma = _sort_out_rates(B, Gamma, Mu, Sigma, country, policy)
+    if model_type == 'SIS':
+        c = np.ones_like(gamma)
+        a = gamma + mu
+    else:
+        if np.any(mu <= 0):
+            raise ValueError('Endemic equilibrium of ' + model_type + ' needs positive Mu.')
+        c = 1 + gamma / mu
+        a = gamma + mu
+        if model_type == 'SEIR':
+            c = c + (mu + gamma) / sigma
+            a = (mu + sigma) * (mu + gamma) / sigma
+    Ng = B.shape[-1]
+    shape = np.broadcast_shapes(B.shape[:-2], a.shape[:-1]) + (Ng,)
+    B = np.broadcast_to(B, shape + (Ng,))
+    a = np.broadcast_to(a, shape)
+    c = np.broadcast_to(c, shape)
+
+    # Newton from the upper bound 1 / c, the iterates decrease monotonically to the root
+    I = 1 / c
+    for _ in np.arange(max_iter):
+        BI = _matvec(B, I)
+        F = (1 - c * I) * BI - a * I
+        J = (1 - c * I)[..., None] * B
+        J[..., np.arange(Ng), np.arange(Ng)] -= c * BI + a
+        step = np.linalg.solve(J, F[..., None])[..., 0]
+        I = np.clip(I - step, 0, 1 / c)
+        if np.max(np.abs(step), initial=0) < tol:
+            break
+    # below the threshold the iterates only converge slowly to the disease-free equilibrium
+    R0 = np.max(np.abs(np.linalg.eigvals(B / a[..., None, :])), axis=-1)
+    I[R0 <= 1] = 0
+
+    if model_type == 'SIS':
+        return I
+    list_states = [I, gamma / mu * I]
+    if model_type == 'SEIR':
+        list_states.append((mu + gamma) / sigma * I)
+    return np.concatenate(np.broadcast_arrays(*list_states), axis=-1)
+
+
+# %% helpers
+def _diag_rates(Rates, Ng):
+    """Return the diagonal of rates given as (... x Ng x Ng) matrices, as (... x Ng)."""
+    import numpy as np
+
+    if Rates is None:
+        return np.zeros(Ng)
+    Rates = np.asarray(Rates, dtype=float)
+    if Rates.ndim >= 2 and Rates.shape[-2:] == (Ng, Ng):
+        return np.diagonal(Rates, axis1=-2, axis2=-1)
+    return Rates
+
+
+def _sort_out_rates(B, Gamma, Mu, Sigma, country, policy):
+    """Return B of the policy and the diagonal rates, see final_size."""
+    import numpy as np
+    from mitepid.policies import get_B_policy_R0
+
+    B = np.asarray(B, dtype=float)
+    Ng = B.shape[-1]
+    gamma = _diag_rates(Gamma, Ng)
+    mu = _diag_rates(Mu, Ng)
+    sigma = _diag_rates(Sigma, Ng)
+    if policy is not None:
+        B, _ = get_B_policy_R0(B=B, D=np.diag(gamma + mu), country=country, policy=policy)
+    return B, gamma, mu, sigma
+
+
+def _sort_out_x0(x0, model_type, Ng):
+    """Return the initial conditions as (... x N_states), see utils.correct_x0."""
+    import numpy as np
+    from mitepid.utils import correct_x0
+
+    x0 = np.asarray(x0, dtype=float)
+    if x0.ndim == 1:
+        x0 = np.asarray(correct_x0(x0, model_type, Ng), dtype=float)
+    return x0
+
+
+def _matvec(A, x):
+    """Batched A @ x, with A (... x N x N) and x (... x N)."""
+    return (A @ x[..., None])[..., 0]
@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: MiTepid contributors
+"""
+
+
+class epid_ensemble:
+    """
+    A class to simulate many variants of an epidemilogical model at once.
+
+    Initial conditions, contact matrices and policy schedules can differ between the members
+    of the ensemble. All members are stacked into one (N_scenarios x N_states) state and
+    integrated together with the vectorised models, so the solver overhead is paid once.
+    Each member follows the same trajectory as the corresponding epid_sim object (exactly with
+    the 'RK4' backend, up to solver tolerances with adaptive ones).
+    """
+
+    ###
+    def __init__(self,
+                 model_type,
+                 country,
+                 x0,
+                 B,
+                 t_end,
+                 policy_list=['Uncontained'],
+                 policy_switch_times=[0],
+                 Gamma=None,
+                 Mu=None,
+                 Sigma=None,
+                 t_step=0.1,
+                 xternal_inputs={},
+                 integrator='odeint',
+                 output=None,
+                 output_dt=None,
+                 rtol=None,
+                 atol=None,
+                 reducers=None,
+                 summary_only=False,
+                 ):
+        """
+        Initilise the class and calculate the solution.
+
+        Any of x0, B, policy_switch_times and xternal_inputs can be given either once, in
+        which case it is shared by all members, or once per member of the ensemble. Policies
+        can be lists of scales themselves, so policy_list is per member if and only if
+        policy_switch_times is; to use different policies at the same times, give both per
+        member.
+
+        Parameters
+        ----------
+        model_type : str
+            'SIS', 'SIR' or 'SEIR'.
+        country : str
+            one of the countries whose population density is defined in policies module.
+        x0 : list of float, or list of lists of float
+            initial condition(s), as in epid_sim.
+        B : numpy array
+            matrix of contact rates, (Ng x Ng), or one per member, (N_scenarios x Ng x Ng).
+        t_end : float
+            final time for simulation.
+        policy_list : list of str, or list of lists of str
+            list of policies to be applied at each time step in policy_switch_times, or one
+            such list per member if policy_switch_times is per member.
+        policy_switch_times : list of float, or list of lists of float
+            switching instances, starting with 0.
+        Gamma : numpy array, optional
+            diagonal matrix of recovery rates for each groups, or one per member.
+        Mu : numpy array, optional
+            diagonal matrix of birth/death rates for each group, or one per member.
+        Sigma : numpy array, optional
+            diagonal matrix of inhibition rates for each group, or one per member.
+        t_step : float, optional
+            simulation time-step. The default is 0.1.
+        xternal_inputs : dict, or list of dict, optional
+            external input at swithcing instances, as in epid_sim. The default is {}.
+        integrator : str, optional
+            solver backend, see mitepid.integrators. The default is 'odeint'. Adaptive backends
+            integrate the flattened state with its block-diagonal Jacobian, in banded format,
+            so their few steps are shared by all members. 'RK4' steps the stacked state on the
+            time grid: it matches epid_sim with 'RK4' exactly, but it is much slower, e.g.
+            about 7 times for 60 SEIR members over 540 days on the 0.1-day grid.
+        output : pathlib.Path, optional
+            .npy file to hold the solution of all members as a memory-mapped array,
+            (N_scenarios x Nt x N_states). The default is None, i.e. in memory.
+        output_dt : float, optional
+            time-step of the stored solution, as in epid_sim. The default is None, i.e. t_step.
+        rtol : float, optional
+            relative tolerance of adaptive solvers. The default is None, i.e. solver default.
+        atol : float, optional
+            absolute tolerance of adaptive solvers. The default is None, i.e. solver default.
+        reducers : dict of reducers, optional
+            summary statistics calculated while integrating, see mitepid.reducers. Each one
+            gets (N_scenarios x N_time x Ng) pieces, and its result is per member.
+            The default is None.
+        summary_only : bool, optional
+            only calculate the reducers, without keeping the trajectories. Then sol_dict and
+            sol_agg_dict are not available. The default is False.
+
+        Returns
+        -------
+        None.
+
+        """
+        import numpy as np
+
+        self.model_type = model_type
+        self.country = country
+        self.t_end = t_end
+        self.t_step = t_step
+        self.integrator = integrator
+        self.output = output
+        self.output_dt = output_dt
+        self.rtol = rtol
+        self.atol = atol
+        self.reducers = {} if reducers is None else reducers
+        self.summary_only = summary_only
+
+        B = np.asarray(B, dtype=float)
+        if B.ndim == 2:
+            B = B[None, :, :]
+        self.Ng = B.shape[-1]
+
+        list_x0 = self._as_list(x0, is_single=all(np.ndim(x) == 0 for x in x0))
+        # switching times are numbers, so a list of lists is unambiguous, unlike policies
+        is_single = all(np.ndim(x) == 0 for x in policy_switch_times)
+        list_switch_times = self._as_list(policy_switch_times, is_single=is_single)
+        list_policy_list = self._as_list(policy_list, is_single=is_single)
+        if not is_single and not all(isinstance(x, (list, tuple)) for x in list_policy_list):
+            raise ValueError('With switching times per member, policy_list should be a list '
+                             'of lists of policies, one per member.')
+        list_xternal = self._as_list(xternal_inputs, is_single=isinstance(xternal_inputs, dict))
+        list_sizes = [len(x) for x in [list_x0, list_policy_list, list_switch_times,
+                                       list_xternal]] + [B.shape[0]]
+        self.N_scenarios = max(list_sizes)
+        if any(size not in [1, self.N_scenarios] for size in list_sizes):
+            raise ValueError('Inconsistent number of scenarios: x0, policy_list, '
+                             'policy_switch_times, xternal_inputs and B have %s members.'
+                             % list_sizes)
+
+        def _broadcast(list_in):
+            if len(list_in) == 1:
+                return list_in * self.N_scenarios
+            return list_in
+
+        self.B = np.broadcast_to(B, (self.N_scenarios, self.Ng, self.Ng))
+        self.list_x0 = [self.correct_x0(x) for x in _broadcast(list_x0)]
+        self.list_policy_list = _broadcast(list_policy_list)
+        self.list_policy_switch_times = _broadcast(list_switch_times)
+        self.list_xternal_inputs = _broadcast(list_xternal)
+        for idx, (times, policies) in enumerate(zip(self.list_policy_switch_times,
+                                                     self.list_policy_list)):
+            if len(times) != len(policies):
+                raise ValueError('Member %d has %d switching times but %d policies.'
+                                 % (idx, len(times), len(policies)))
+            if len(times) == 0 or min(times) != 0:
+                raise ValueError('The first switching time of member %d is not 0.' % idx)
+
+        self.gamma = self._diag_rates(Gamma)
+        self.mu = self._diag_rates(Mu)
+        self.sigma = self._diag_rates(Sigma)
+        self.t = np.arange(0, t_end+.1e-5, step=t_step if output_dt is None else output_dt)
+        self.list_policy_info = [[] for _ in np.arange(self.N_scenarios)]
+
+        self.calc_sol()
+
+    # %% helpers
+    @staticmethod
+    def _as_list(var, is_single):
+        """Wrap var in a list if it is given once for all members."""
+        if is_single:
+            return [var]
+        return list(var)
+
+    def _diag_rates(self, Rates):
+        """Return diagonal rates as a (N_scenarios x Ng) array."""
+        import numpy as np
+        if Rates is None:
+            return np.zeros((self.N_scenarios, self.Ng))
+        Rates = np.asarray(Rates, dtype=float)
+        if Rates.ndim == 2:
+            rates = np.diag(Rates)
+        else:
+            rates = np.diagonal(Rates, axis1=1, axis2=2)
+        return np.broadcast_to(rates, (self.N_scenarios, self.Ng)).copy()
+
+    def correct_x0(self, x0):
+        """Correct the size of vextor x0, see mitepid.utils.correct_x0."""
+        import numpy as np
+        from mitepid.utils import correct_x0
+        return np.array(correct_x0(x0, self.model_type, self.Ng), dtype=float)
+
+    # %% calculate solution
+    def calc_sol(self, ):
+        """
+        Calculate the solution of all members of the ensemble.
+
+        The union of all switching times splits the time axis into segments. In each segment
+        every member uses its own active policy, and all members are integrated together.
+
+        Returns
+        -------
+        self.sol_dict: dict, keys are 'I', 'R', 'E', etc, values are numpy array
+            (N_scenarios x Nt x Ng), solutions for each member, group and compartment.
+        self.sol_agg_dict: dict, keys are 'I', 'R', 'E', etc, values are numpy array
+            (N_scenarios x Nt), aggregate solution for each member and compartment.
+        self.summary: dict
+            results of the reducers, with the same keys as self.reducers.
+        self.list_solver_info: list of dict
+            solver statistics for each segment, see mitepid.integrators.
+
+        """
+        import numpy as np
+
+        from mitepid.utils import sort_out_t_policy_x0, alloc_output, sol_aggregate_batch
+        from mitepid.models import get_model, get_compartments
+        from mitepid.integrators import integrate, sample_hermite
+        from mitepid.policies import get_B_policy_R0
+
+        N_scenarios = self.N_scenarios
+        Ng = self.Ng
+        model, model_jac = get_model(self.model_type)
+
+        # schedule of each member, as in epid_sim
+        list_schedules = []
+        for idx in np.arange(N_scenarios):
+            policy_definition = dict(zip(self.list_policy_switch_times[idx],
+                                         self.list_policy_list[idx]))
+            list_t1, _, list_policies, list_x0_xtrnl, _, _ = \
+                sort_out_t_policy_x0(policy_definition,
+                                     dict(self.list_xternal_inputs[idx]),
+                                     self.t_end,
+                                     Ng)
+            list_schedules.append((list_t1, list_policies, list_x0_xtrnl))
+
+        list_T = sorted(set(t for schedule in list_schedules for t in schedule[0]))
+        list_T2 = list_T[1:] + [self.t_end + 1e-10]
+        list_t_seg = [np.arange(t1, t2, step=self.t_step) for t1, t2 in zip(list_T, list_T2)]
+        eps_t = 1e-6 * self.t_step
+        if self.output_dt is None:
+            list_t_out = list_t_seg
+        else:
+            list_t_out = []
+            for t1, t2 in zip(list_T, list_T2):
+                t_right = t2 - eps_t if t2 <= self.t_end else self.t_end + eps_t
+                list_t_out.append(self.t[np.searchsorted(self.t, t1 - eps_t):
+                                         np.searchsorted(self.t, t_right)])
+        Nt = int(np.sum([len(t_out) for t_out in list_t_out]))
+        N_states = len(self.list_x0[0])
+        list_compartments = get_compartments(self.model_type)
+        if not self.summary_only:
+            sol_all = alloc_output((N_scenarios, Nt, N_states), self.output)
+        for reducer in self.reducers.values():
+            reducer.reset()
+
+        # model with flattened states, for backends which cannot step a stacked state
+        def model_flat(states, t, *args, out=None):
+            if out is None:
+                out = np.empty(states.shape)
+            model(states.reshape(N_scenarios, N_states), t, *args,
+                  out=out.reshape(N_scenarios, N_states))
+            return out
+
+        # its Jacobian is block-diagonal, one block per member, in the banded format of
+        # models.jac_to_banded: jac[i, j] of a block is in row i - j + N_states - 1
+        ind_col = np.arange(N_states)
+        ind_row = ind_col[None, :] + np.arange(2*N_states - 1)[:, None] - (N_states - 1)
+        is_band = (ind_row >= 0) & (ind_row < N_states)
+        ind_row = np.clip(ind_row, 0, N_states - 1)
+
+        def jac_flat(states, t, *args):
+            states = states.reshape(N_scenarios, N_states)
+            jac_all = np.stack([model_jac(states[idx], t, *[arg[idx] for arg in args])
+                                for idx in np.arange(N_scenarios)])
+            jac_banded = np.where(is_band, jac_all[:, ind_row, ind_col], 0)
+            return np.reshape(np.swapaxes(jac_banded, 0, 1), (2*N_states - 1, -1))
+
+        D = self.gamma + self.mu
+        B_step = np.zeros((N_scenarios, Ng, Ng))
+        x_last = np.array(self.list_x0)  # state at the start of the segment
+        x_grid = x_last.copy()  # last stored state, i.e. on the grid
+        self.list_solver_info = []
+        idx_t = 0
+        for idx_seg, t_seg in enumerate(list_t_seg):
+            t_switch1 = list_T[idx_seg]
+            x0_step = x_last.copy()
+            for idx in np.arange(N_scenarios):
+                list_t1, list_policies, list_x0_xtrnl = list_schedules[idx]
+                if t_switch1 not in list_t1:
+                    continue
+                # members switching here start from the last stored state, as in epid_sim
+                ind_switch = list_t1.index(t_switch1)
+                policy = list_policies[ind_switch]
+                B_step[idx], rho = get_B_policy_R0(B=self.B[idx], D=np.diag(D[idx]),
+                                                   country=self.country, policy=policy, )
+                self.list_policy_info[idx].append((t_switch1, policy, rho))
+                x0_step[idx] = x_grid[idx] + self.correct_x0(list_x0_xtrnl[ind_switch])
+
+            t_int = t_seg
+            if idx_seg < len(list_t_seg) - 1:
+                # integrate up to the next switching time, to continue members not switching
+                t_int = np.append(t_seg, list_T2[idx_seg])
+            if self.model_type == 'SEIR':
+                args = (B_step, self.gamma, self.mu, self.sigma)
+            else:
+                args = (B_step, self.gamma, self.mu)
+            if self.integrator == 'RK4':
+                sol_step, solver_info = integrate('RK4', model, x0_step, t_int, args=args)
+            else:
+                sol_step, solver_info = integrate(self.integrator, model_flat, x0_step.ravel(),
+                                                  t_int, args=args, model_jac=jac_flat,
+                                                  rtol=self.rtol, atol=self.atol,
+                                                  jac_band=(N_states - 1, N_states - 1))
+                sol_step = sol_step.reshape(len(t_int), N_scenarios, N_states)
+            solver_info['t_switch'] = t_switch1
+            self.list_solver_info.append(solver_info)
+
+            Nt_seg = len(t_seg)
+            t_out = list_t_out[idx_seg]
+            if self.output_dt is None:
+                sol_out = sol_step[:Nt_seg]
+            else:
+                sol_out = sample_hermite(t_int, sol_step, t_out, model, args, eps_t=eps_t)
+                # as in epid_sim, members switching at the next switching time keep the last
+                # state on the grid after it
+                if idx_seg < len(list_t_seg) - 1:
+                    is_gap = t_out > t_seg[-1] + eps_t
+                    for idx in np.arange(N_scenarios):
+                        if list_T2[idx_seg] in list_schedules[idx][0]:
+                            sol_out[is_gap, idx] = sol_step[Nt_seg-1, idx]
+            sol_out = np.swapaxes(sol_out, 0, 1)
+            if not self.summary_only:
+                sol_all[:, idx_t:idx_t+len(t_out), :] = sol_out
+            if self.reducers and len(t_out) > 0:
+                sol_dict_step = {}
+                sol_agg_dict_step = {}
+                for idx, key in enumerate(list_compartments):
+                    sol_dict_step[key] = sol_out[:, :, idx*Ng:(idx+1)*Ng]
+                    sol_agg_dict_step[key] = sol_aggregate_batch(sol_dict_step[key],
+                                                                 self.country)
+                for reducer in self.reducers.values():
+                    reducer.update(t_out, sol_dict_step, sol_agg_dict_step)
+            idx_t = idx_t + len(t_out)
+            x_grid = sol_step[Nt_seg-1]
+            x_last = sol_step[-1]
+
+        self.summary = {key: reducer.result() for key, reducer in self.reducers.items()}
+        if self.summary_only:
+            return
+        if isinstance(sol_all, np.memmap):
+            sol_all.flush()
+        sol_dict = {}
+        sol_agg_dict = {}
+        for idx, key in enumerate(list_compartments):
+            sol_dict[key] = sol_all[:, :, idx*Ng:(idx+1)*Ng]
+            sol_agg_dict[key] = sol_aggregate_batch(sol_dict[key], self.country)
+
+        self.sol_dict = sol_dict
+        self.sol_agg_dict = sol_agg_dict
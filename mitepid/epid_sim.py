@@ -36,6 +36,20 @@ class epid_sim:
                  t_step=0.1,
                  ref_class=None,
                  xternal_inputs={},
+                 jac='dense',
+                 integrator='odeint',
+                 verbose=True,
+                 lazy=False,
+                 output=None,
+                 output_dt=None,
+                 rtol=None,
+                 atol=None,
+                 dtype=None,
+                 reducers=None,
+                 summary_only=False,
+                 events=None,
+                 steady_tol=None,
+                 steady_tol_I=1e-7,
                  ):
         """
         Initilise the class.
@@ -71,11 +85,68 @@ class epid_sim:
         Sigma : numpy array, optional
             diagonal matrix of inhibition rates for each group.
         t_step : float, optional
-            simulation time-step. The default is 0.1.
+            simulation time-step, i.e. the time grid of the solver. The default is 0.1.
         ref_class : epid_sim class, optional
             used to generate reference diagrams in each plot. The default is None.
         xternal_inputs : dictionary of x0 type.
             in case there is external input in each swithcing instance.
+        jac : str or None, optional
+            Jacobian passed to the ODE solver. 'dense' for the analytic Jacobian, 'banded' for
+            the analytic Jacobian in banded storage, None to let the solver estimate it by
+            finite differences. 'banded' only helps if B is banded, e.g. contacts between
+            neighbouring age groups only, otherwise the dense Jacobian is used, see
+            integrators.banded_ordering. The default is 'dense'.
+        integrator : str, optional
+            solver backend, see mitepid.integrators. 'odeint', a method of solve_ivp
+            ('LSODA', 'RK45', 'BDF', ...), 'RK4' for fixed-step Runge-Kutta on the time grid or
+            'linearised' for exact steps of the linearised model on the time grid. 'RK4' and
+            'linearised' are for accuracy, they are much slower than 'odeint'.
+            The default is 'odeint'.
+        verbose : bool, optional
+            print the policy table while calculating the solution. The default is True.
+        lazy : bool, optional
+            if True, the solution is not calculated in the constructor, but on first access to
+            sol_dict or sol_agg_dict, or by calling run(). The default is False.
+        output : pathlib.Path, optional
+            .npy file to hold the solution as a memory-mapped array, for long horizons which
+            should not be kept in memory. The default is None, i.e. in memory.
+        output_dt : float, optional
+            time-step of the stored solution, e.g. 1 for daily values. Grid points of the
+            solver are copied, other points are interpolated, see integrators.sample_hermite.
+            The default is None, i.e. the solution is stored on the solver grid.
+        rtol : float, optional
+            relative tolerance of adaptive solvers. The default is None, i.e. solver default.
+        atol : float, optional
+            absolute tolerance of adaptive solvers. The default is None, i.e. solver default.
+        dtype : numpy dtype, optional
+            data type of the stored solution, e.g. np.float32 to halve the memory. The model is
+            always integrated in float64, see precision_report for the rounding error.
+            The default is None, i.e. float64.
+        reducers : dict of reducers, optional
+            summary statistics calculated while integrating, see mitepid.reducers. Results are
+            in self.summary, with the same keys. The default is None.
+        summary_only : bool, optional
+            do not keep the trajectories, only the results of the reducers. sol_dict and
+            sol_agg_dict are not available then. The default is False.
+        events : dict of events, optional
+            state-triggered events, which terminate the simulation or switch to a new policy,
+            see mitepid.events. Triggered events are listed in self.list_events.
+            The default is None.
+        steady_tol : float, optional
+            if given, the integration stops when the epidemic reaches a steady state after the
+            last switching time, i.e. max |dx/dt| < steady_tol and all infected and exposed
+            states are < steady_tol_I and not increasing. The last state is held until t_end
+            and the stopping time is in self.t_steady. The last segment is integrated in pieces
+            of steady_check_dt days to check this. Only with integrator='RK4': adaptive
+            backends already take long steps once the solution is flat, and each piece would
+            restart them. The default is None.
+        steady_tol_I : float, optional
+            tolerance of the infected and exposed states for steady_tol. The default is 1e-7.
+
+        Raises
+        ------
+        ValueError
+            if steady_tol is given with another integrator than 'RK4'.
 
         Returns
         -------
@@ -86,6 +157,9 @@ class epid_sim:
         from pathlib import Path
         from mitepid.policies import N_pop
 
+        if steady_tol is not None and integrator != 'RK4':
+            raise ValueError("steady_tol is only supported with integrator='RK4'.")
+
         # main variables
         self.B = B
         self.Ng = self.B.shape[0]  # number of age groups
@@ -115,16 +189,92 @@ class epid_sim:
 
         self.x0 = self.correct_x0(x0)
         self.xternal_inputs = xternal_inputs
+        self.jac = jac
+        self.integrator = integrator
+        self.verbose = verbose
         self.t_end = t_end
         self.t_step = t_step
-        self.t = np.arange(0, t_end+.1e-5, step=t_step)
+        self.output_dt = output_dt
+        self.rtol = rtol
+        self.atol = atol
+        self.dtype = np.dtype(float if dtype is None else dtype)
+        self.reducers = {} if reducers is None else reducers
+        self.summary_only = summary_only
+        self.events = {} if events is None else events
+        self.list_events = []  # (time, name, action) of triggered events
+        self.t_stop = None  # time of a terminating event
+        self.steady_tol = steady_tol
+        self.steady_tol_I = steady_tol_I
+        self.steady_check_dt = 10.  # days integrated between checks of the steady state
+        self.t = np.arange(0, t_end+.1e-5, step=self.dt_out)
         self.model_type = model_type
         self.policy_definition = dict(zip(policy_switch_times, policy_list))
         self.list_policy_info = []
+        self.list_solver_info = []
 
         self.N_pop = N_pop(self.country)
+        self.lazy = lazy
+        self.output = output
+        self.sol_all = None
+        self.sens_params = None  # parameters of the forward sensitivities, see calc_sol
+        self.sens_layout = None
+        self.sort_out_policies()
+        self.reset_sol()
         # calc the solytion
-        self.calc_sol()
+        if not lazy:
+            self.calc_sol()
+
+    @property
+    def dt_out(self):
+        """float, time-step of the stored solution."""
+        if self.output_dt is None:
+            return self.t_step
+        return self.output_dt
+
+    # %% solution, calculated on first access in lazy mode
+    @property
+    def sol_dict(self):
+        """dict, keys are 'I', 'R', 'E', etc, values are numpy array (Nt x Ng)."""
+        if self.summary_only:
+            raise ValueError('Trajectories are not kept with summary_only, see summary.')
+        if self._sol_dict is None:
+            self.run()
+        return self._sol_dict
+
+    @sol_dict.setter
+    def sol_dict(self, sol_dict):
+        self._sol_dict = sol_dict
+
+    @property
+    def sol_agg_dict(self):
+        """dict, keys are 'I', 'R', 'E', etc, values are numpy array (Nt x 1)."""
+        if self.summary_only:
+            raise ValueError('Trajectories are not kept with summary_only, see summary.')
+        if self._sol_agg_dict is None:
+            self.run()
+        return self._sol_agg_dict
+
+    @sol_agg_dict.setter
+    def sol_agg_dict(self, sol_agg_dict):
+        self._sol_agg_dict = sol_agg_dict
+
+    @property
+    def summary(self):
+        """dict, results of the reducers, integrating the rest of the segments in lazy mode."""
+        if self.lazy and self.idx_segment < len(self.list_segments):
+            self.run()
+        return {key: reducer.result() for key, reducer in self.reducers.items()}
+
+    @property
+    def sol_sens(self):
+        """structured numpy array (Nt x N_states), forward sensitivities, see calc_sol."""
+        from mitepid.sensitivity import to_structured
+
+        if self.sens_params is None:
+            raise ValueError('Sensitivities are calculated with calc_sol(sensitivity=...).')
+        if self.lazy and self.idx_segment < len(self.list_segments):
+            self.run()
+        return to_structured(self.sens_all[:self.n_rows], self.sens_layout)
 
 
     # write a text file to disk including the detailed information on policy
@@ -137,8 +287,202 @@ class epid_sim:
                 my_tex.write('\n %10.1f    --->  %s (R0 = %2.2f)'%(t_switch1, policy, rho))
 
 
+    # %% policies of each segment
+    def sort_out_policies(self, ):
+        """
+        epid_calss method.
+
+        Sorts out the policy segments and calculates the contact matrix and R0 of each policy.
+        No integration is needed, so it is done in the constructor, also in lazy mode.
+
+        Returns
+        -------
+        self.list_policy_info: list of (float, str, float)
+            switching time, policy and R0 of the policy for each segment.
+        self.list_scales: list of numpy arrays
+            scales of the rows of B of the policy of each segment, (Ng), for sensitivities.
+
+        """
+        import numpy as np
+
+        from mitepid.utils import sort_out_t_policy_x0
+        from mitepid.policies import get_B_policy_R0
+
+        list_t1, list_t2, list_policies, list_x0, list_t_switch, list_all_policies = \
+                    sort_out_t_policy_x0(self.policy_definition,
+                                         self.xternal_inputs,
+                                         self.t_end,
+                                         self.Ng)
+        self.list_segments = []
+        self.list_policy_info = []
+        self.list_scales = []
+        self.N_rows = 0  # number of rows of the solution, over all segments
+        for idx in np.arange(len(list_t1)):
+            policy = list_policies[idx]
+            # contact rates and spectral radius of the policy, cached
+            B_step, rho, scales = get_B_policy_R0(B=self.B, D=self.D, country=self.country,
+                                                  policy=policy, return_scales=True)
+            self.list_policy_info.append((list_t1[idx], policy, rho))
+            self.list_scales.append(scales)
+            self.list_segments.append((list_t1[idx], list_t2[idx], B_step, list_x0[idx]))
+            self.N_rows = self.N_rows + len(self.t_out_segment(list_t1[idx], list_t2[idx]))
+
+    def reset_sol(self, ):
+        """Discard the solution calculated so far and allocate the arrays for the solution."""
+        import numpy as np
+
+        from mitepid.utils import alloc_output
+        from mitepid.sensitivity import sensitivity_layout, initial_sensitivity
+
+        self.list_solver_info = []
+        self.idx_segment = 0  # segment to be integrated next
+        self.t_last = None  # last time integrated in a partially integrated segment
+        self.x_last = self.x0  # last calculated state
+        self.t_x_last = None  # time of x_last
+        # switches triggered by events are in the policies, a termination is not
+        self.list_events = [x for x in self.list_events if x[2] != 'terminate']
+        self.t_stop = None
+        self.t_steady = None  # time the steady state is reached, held afterwards
+        # the solution of all segments is written in place into preallocated arrays,
+        # the first n_rows rows are calculated
+        shape = (self.N_rows, len(self.x0))
+        if self.summary_only:
+            self.sol_all = None
+            self.t_sol = None
+        else:
+            if self.sol_all is None or self.sol_all.shape != shape:
+                self.sol_all = alloc_output(shape, self.output, dtype=self.dtype)
+            self.t_sol = np.empty(self.N_rows)
+        # forward sensitivities of all states, (N_rows x N_states x P), see mitepid.sensitivity
+        self.sens_all = None
+        if self.sens_params is not None:
+            self.sens_layout = sensitivity_layout(self.model_type, self.Ng,
+                                                  len(self.list_segments), self.sens_params)
+            self.V_last = initial_sensitivity(len(self.x0), self.sens_layout)
+            self.sens_all = np.empty((self.N_rows,) + self.V_last.shape)
+        self.n_rows = 0
+        self.t_out_last = -np.inf  # time of the last row
+        for reducer in self.reducers.values():
+            reducer.reset()
+        # largest absolute value and rounding error of each state, if not stored in float64
+        self.max_abs = np.zeros(len(self.x0))
+        self.max_error = np.zeros(len(self.x0))
+        self._sol_dict = None
+        self._sol_agg_dict = None
+
+    def resize_sol(self, ):
+        """Resize the arrays for the solution to the current segments, keeping n_rows rows."""
+        from mitepid.utils import resize_output
+
+        self._sol_dict = None
+        self._sol_agg_dict = None
+        self.sol_all = resize_output(self.sol_all, self.N_rows, self.output)
+        self.t_sol = resize_output(self.t_sol, self.N_rows)
+
+    def t_grid_segment(self, t_switch1, t_switch2):
+        """
+        Return the solver grid of a segment.
+
+        Parameters
+        ----------
+        t_switch1 : float
+            start of the segment.
+        t_switch2 : float
+            end of the segment.
+
+        Returns
+        -------
+        t_grid : numpy array
+            the multiples of t_step in [t_switch1, t_switch2), as in self.t. If the segment
+            starts between them, i.e. after a switch triggered by an event, t_switch1 comes
+            first.
+
+        """
+        import numpy as np
+
+        eps_t = 1e-6 * self.t_step
+        t_first = np.ceil(t_switch1 / self.t_step - 1e-6) * self.t_step
+        if t_first - t_switch1 <= eps_t:
+            return np.arange(t_switch1, t_switch2, step=self.t_step)
+        return np.concatenate(([t_switch1], np.arange(t_first, t_switch2, step=self.t_step)))
+
+    def t_out_segment(self, t_switch1, t_switch2):
+        """
+        Return the times of the stored solution in a segment.
+
+        Parameters
+        ----------
+        t_switch1 : float
+            start of the segment.
+        t_switch2 : float
+            end of the segment.
+
+        Returns
+        -------
+        t_out : numpy array
+            the points of the solver grid of the segment on the grid of self.t, i.e. without
+            the start of a segment after a switch triggered by an event, or the points of
+            self.t in [t_switch1, t_switch2) if output_dt is given, up to t_end.
+
+        """
+        import numpy as np
+
+        eps_t = 1e-6 * self.t_step
+        if self.output_dt is None:
+            t_out = self.t_grid_segment(t_switch1, t_switch2)
+            is_grid = np.abs(np.round(t_out / self.t_step) * self.t_step - t_out) <= eps_t
+            return t_out[is_grid & (t_out <= self.t_end + eps_t)]
+        t_right = t_switch2 - eps_t if t_switch2 <= self.t_end else self.t_end + eps_t
+        return self.t[np.searchsorted(self.t, t_switch1 - eps_t):np.searchsorted(self.t, t_right)]
+
+    def sample_segment(self, t_step, sol_step, t_out, B_step):
+        """Sample the solution of a segment on the grid t_step at times t_out."""
+        from mitepid.integrators import sample_hermite
+
+        model, _, args = self.segment_model(B_step)
+        return sample_hermite(t_step, sol_step, t_out, model, args, eps_t=1e-6*self.t_step)
+
+    def write_rows(self, sol_step, t_step):
+        """Write the solution of a (part of a) segment after the rows calculated so far."""
+        import numpy as np
+
+        from mitepid.models import get_compartments
+        from mitepid.utils import sol_aggregate_batch
+
+        n_new = len(t_step)
+        if n_new == 0:
+            return
+        if self.sens_params is not None:
+            N_states = len(self.x0)
+            self.sens_all[self.n_rows:self.n_rows+n_new] = np.swapaxes(
+                np.reshape(sol_step[:, N_states:], (n_new, -1, N_states)), 1, 2)
+            sol_step = sol_step[:, :N_states]
+        if not self.summary_only:
+            self.sol_all[self.n_rows:self.n_rows+n_new] = sol_step
+            if self.dtype != np.float64:
+                sol_stored = self.sol_all[self.n_rows:self.n_rows+n_new]
+                np.maximum(self.max_abs, np.max(np.abs(sol_step), axis=0), out=self.max_abs)
+                np.maximum(self.max_error, np.max(np.abs(sol_stored - sol_step), axis=0),
+                           out=self.max_error)
+            self.t_sol[self.n_rows:self.n_rows+n_new] = t_step
+        self.n_rows = self.n_rows + n_new
+        self.t_out_last = t_step[-1]
+
+        if self.reducers:
+            list_compartments = get_compartments(self.model_type)
+            Ng = self.Ng
+            sol_agg_step = sol_aggregate_batch(
+                np.reshape(sol_step, (n_new, len(list_compartments), Ng)), self.country)
+            sol_dict = {}
+            sol_agg_dict = {}
+            for idx, key in enumerate(list_compartments):
+                sol_dict[key] = sol_step[:, idx*Ng:(idx+1)*Ng]
+                sol_agg_dict[key] = sol_agg_step[:, idx]
+            for reducer in self.reducers.values():
+                reducer.update(t_step, sol_dict, sol_agg_dict)
+
     # %% calculate solution
-    def calc_sol(self, ):
+    def calc_sol(self, sensitivity=None):
         """
         epid_calss method.
 
@@ -149,7 +493,11 @@ class epid_sim:
 
         Parameters
         ----------
-        None.
+        sensitivity : list of str or bool, optional
+            parameters whose forward sensitivities are integrated together with the model,
+            e.g. ['B', 'Gamma', 'x0'], or True for all of them, see mitepid.sensitivity. They
+            are in self.sol_sens, see also gradient. Not available with summary_only, events
+            or steady_tol. The default is None, i.e. no sensitivities.
 
 
         Returns
@@ -158,84 +506,611 @@ class epid_sim:
             a dictionary inlcuding solutions for each group and each compartment
         self.sol_agg_dict: dict, keys are 'I', 'R', 'E', etc, values are numpy array (Nt x 1)
             a dictionary inlcuding aggregate solution for each compartment
+        self.list_solver_info: list of dict
+            solver statistics for each policy segment, see mitepid.integrators
 
         """
-        from pathlib import Path
-        import numpy as np
-        from numpy.linalg import inv, eigvals
-        from scipy.integrate import odeint
+        from mitepid.sensitivity import sensitivity_layout
+
+        self.sens_params = None
+        if sensitivity is not None and sensitivity is not False:
+            if self.summary_only or self.events or self.steady_tol is not None:
+                raise ValueError('Sensitivities are not available with summary_only, events '
+                                 'or steady_tol.')
+            list_params = None if sensitivity is True else list(sensitivity)
+            layout = sensitivity_layout(self.model_type, self.Ng, len(self.list_segments),
+                                        list_params)
+            self.sens_params = [key for key, _ in layout]
+        self.reset_sol()
+        self.run()
+
+    def run(self, until=None):
+        """
+        epid_calss method.
 
-        from mitepid.utils import sort_out_t_policy_x0
-        from mitepid.models import SIS, SIR, SEIR
-        from mitepid.utils import sol_aggregate
-        from mitepid.policies import get_B_policy, get_pop_distr
+        Calculates the solution, continuing from where a previous call stopped.
 
-        list_t1, list_t2, list_policies, list_x0, list_t_switch, list_all_policies = \
-                    sort_out_t_policy_x0(self.policy_definition,
-                                         self.xternal_inputs,
-                                         self.t_end,
-                                         self.Ng)
-        print('*************************************************************')
-        print('time (days)   --->  policy (R0 of policy)')
-        print('---------------------------------------------')
-        x0_step = self.x0
-        for idx in np.arange(len(list_t1)):
-            t_switch1 = list_t1[idx]
-            t_switch2 =  list_t2[idx]
-            policy = list_policies[idx]
-            x0_xtrnal = list_x0[idx]
-            B_step = get_B_policy(B=self.B, country=self.country,
-                      policy=policy, )
+        Parameters
+        ----------
+        until : float, optional
+            integrate only up to this time. The default is None, i.e. up to t_end.
 
-            rho = np.max(np.abs(eigvals(np.matmul(-inv(self.D), B_step))))  # spectral radius
-            self.list_policy_info.append((t_switch1, policy, rho))
+        Returns
+        -------
+        self : epid_sim
+            the object itself, with the solution so far in sol_dict and sol_agg_dict.
 
-            #%% R_0 policy
-            print('%10.1f    --->  %s (R0 = %2.2f)'%(t_switch1, policy, rho))
+        """
+        import numpy as np
 
-            t_step = np.arange(t_switch1, t_switch2, step=self.t_step)
-            x0_xtrnal = self.correct_x0(x0_xtrnal)
-            x0_step = np.array(x0_step) + x0_xtrnal
+        if until is None or until > self.t_end:
+            until = self.t_end
+        if self.verbose and self.idx_segment == 0 and self.t_last is None:
+            print('*************************************************************')
+            print('time (days)   --->  policy (R0 of policy)')
+            print('---------------------------------------------')
+        eps_t = 1e-6 * self.t_step
+        while self.idx_segment < len(self.list_segments):
+            t_switch1, t_switch2, B_step, x0_xtrnal = self.list_segments[self.idx_segment]
+            if t_switch1 > until + eps_t:
+                break
+            t_full = self.t_grid_segment(t_switch1, t_switch2)
+            t_out = self.t_out_segment(t_switch1, t_switch2)
+            t_step = t_full
+            if self.t_last is None:
+                x0_xtrnal = self.correct_x0(x0_xtrnal)
+                x0_step = np.array(self.x_last, dtype=float) + x0_xtrnal
+                # events whose condition already holds at the start of the segment
+                name = self.find_event_start(x0_step)
+                if name is not None:
+                    action = self.events[name].action
+                    self.list_events.append((t_switch1, name, action))
+                    if action != 'terminate':
+                        self.switch_policy(t_switch1, action)
+                        continue
+                    t_out = t_out[t_out <= t_switch1 + eps_t]
+                    self.write_rows(np.broadcast_to(x0_step, (len(t_out), len(x0_step))), t_out)
+                    self.x_last = x0_step
+                    self.t_x_last = t_switch1
+                    self.t_last = None
+                    self.terminate(t_switch1, name)
+                    break
+                #%% R_0 policy
+                if self.verbose:
+                    print('%10.1f    --->  %s (R0 = %2.2f)'%self.list_policy_info[self.idx_segment])
+                ind_first = 0
+                t_out = t_out[t_out >= t_switch1 - eps_t]
+            else:
+                # continue a partially integrated segment from its last time point
+                t_step = t_step[t_step > self.t_last + eps_t]
+                t_step = np.concatenate(([self.t_last], t_step))
+                x0_step = self.x_last
+                ind_first = 1
+                t_out = t_out[t_out > max(self.t_last, self.t_out_last) + eps_t]
+            if self.sens_params is not None:
+                x0_step = np.concatenate((x0_step, self.V_last.T.ravel()))
+            t_step = t_step[t_step <= until + eps_t]
+            if len(t_step) <= ind_first:
+                break
+            is_piece = False
+            is_last = self.idx_segment == len(self.list_segments) - 1
+            if self.steady_tol is not None and is_last:
+                # integrate in pieces, to check the steady state after each one
+                is_piece = t_step[-1] > t_step[0] + self.steady_check_dt + eps_t
+                t_step = t_step[t_step <= t_step[0] + self.steady_check_dt + eps_t]
             # solve the ODE
-            if self.model_type == 'SIS':
-                sol_step = odeint(SIS, x0_step, t_step, args=(B_step, self.Gamma, self.Mu))
-            elif self.model_type == 'SIR':
-                sol_step = odeint(SIR, x0_step, t_step, args=(B_step, self.Gamma, self.Mu))
-            elif self.model_type == 'SEIR':
-                sol_step = odeint(SEIR, x0_step, t_step, args=(B_step, self.Gamma, self.Mu,
-                                                               self.Sigma))
+            sol_step, solver_info = self.integrate_segment(x0_step, t_step, B_step)
+            solver_info['t_switch'] = t_switch1
+            self.list_solver_info.append(solver_info)
+            is_finished = t_step[-1] >= t_full[-1] - eps_t
+            if not is_finished:
+                t_out = t_out[t_out <= t_step[-1] + eps_t]
+            t_event, x_event, name = self.find_event(t_step, sol_step, B_step)
+            if t_event is not None:
+                action = self.events[name].action
+                self.list_events.append((t_event, name, action))
+                if action == 'terminate':
+                    t_out = t_out[t_out <= t_event + eps_t]
+                else:
+                    # rows from t_event on belong to the segment of the new policy
+                    t_out = t_out[t_out < t_event - eps_t]
+                self.write_rows(self.sample_segment(t_step, sol_step, t_out, B_step), t_out)
+                self.x_last = x_event
+                self.t_x_last = t_event
+                self.t_last = None
+                if action == 'terminate':
+                    self.terminate(t_event, name)
+                    break
+                self.switch_policy(t_event, action)
+                continue
+            self.write_rows(self.sample_segment(t_step, sol_step, t_out, B_step), t_out)
 
             # update x0
-            x0_step = sol_step[-1]
+            self.x_last = sol_step[-1, :len(self.x0)]
+            if self.sens_params is not None:
+                self.V_last = np.reshape(sol_step[-1, len(self.x0):], self.V_last.T.shape).T
+            self.t_x_last = t_step[-1]
+            if not is_finished and is_last and self.is_steady(self.x_last, B_step):
+                # hold the last state until t_end
+                t_hold = t_full[(t_full > self.t_x_last + eps_t) & (t_full <= until + eps_t)]
+                t_out = self.t_out_segment(t_switch1, t_switch2)
+                t_out = t_out[(t_out > self.t_out_last + eps_t) & (t_out <= until + eps_t)]
+                self.write_rows(np.broadcast_to(self.x_last, (len(t_out), len(self.x_last))),
+                                t_out)
+                if len(t_hold) > 0:
+                    self.t_steady = self.t_x_last
+                    self.t_x_last = t_hold[-1]
+                    is_finished = t_hold[-1] >= t_full[-1] - eps_t
+                    is_piece = False
+            if not is_finished:
+                # stopped before the end of the segment
+                self.t_last = self.t_x_last
+                if is_piece:
+                    continue
+                break
+            self.t_last = None
+            self.idx_segment = self.idx_segment + 1
+
+        self.update_sol_dict()
+        return self
+
+    def is_steady(self, x, B_step):
+        """Check if state x is a steady state, see steady_tol."""
+        import numpy as np
+
+        from mitepid.models import get_compartments
+
+        if self.steady_tol is None:
+            return False
+        model, _, args = self.segment_model(B_step)
+        dxdt = model(x, self.t_x_last, *args)
+        for idx, key in enumerate(get_compartments(self.model_type)):
+            ind = slice(idx*self.Ng, (idx+1)*self.Ng)
+            # infections should be few and not growing any more
+            if key in ['I', 'E'] and (np.max(np.abs(x[ind])) >= self.steady_tol_I or
+                                      np.max(dxdt[ind]) > 0):
+                return False
+        return np.max(np.abs(dxdt)) < self.steady_tol
+
+    def terminate(self, t_event, name):
+        """Stop the simulation at t_event, after a terminating event."""
+        if self.verbose:
+            print('%10.1f    --->  terminated by event %s' % (t_event, name))
+        self.t_stop = t_event
+        self.idx_segment = len(self.list_segments)
+
+    def find_event_start(self, x0_step):
+        """
+        Return the first event, among those not triggered yet, whose condition holds at the
+        start of a segment, in state x0_step, or None.
+        """
+        from mitepid.models import get_compartments
+
+        list_compartments = get_compartments(self.model_type)
+        list_triggered = [x[1] for x in self.list_events]
+        for key, event in self.events.items():
+            if key not in list_triggered and \
+                    event.condition(x0_step, list_compartments, self.country) >= 0:
+                return key
+        return None
+
+    def find_event(self, t_step, sol_step, B_step):
+        """
+        epid_calss method.
+
+        Finds the first event triggered in a piece of the solution, among the events which
+        have not been triggered yet.
+
+        Parameters
+        ----------
+        t_step : numpy array
+            time grid.
+        sol_step : numpy array
+            solution, (N_time x N_states).
+        B_step : numpy 2D array
+            matrix of contact rates of the policy.
+
+        Returns
+        -------
+        t_event : float or None
+            time of the event, None if no event is triggered.
+        x_event : numpy array or None
+            state at t_event.
+        name : str or None
+            key of the event in self.events.
+
+        """
+        from mitepid.models import get_compartments
+
+        t_event, x_event, name = None, None, None
+        if not self.events:
+            return t_event, x_event, name
+        model, _, args = self.segment_model(B_step)
+        list_compartments = get_compartments(self.model_type)
+        list_triggered = [x[1] for x in self.list_events]
+        for key, event in self.events.items():
+            if key in list_triggered:
+                continue
+            t_key, x_key = event.locate(t_step, sol_step, model, args, list_compartments,
+                                        self.country)
+            if t_key is not None and (t_event is None or t_key < t_event):
+                t_event, x_event, name = t_key, x_key, key
+        return t_event, x_event, name
+
+    def switch_policy(self, t_switch, policy):
+        """
+        epid_calss method.
+
+        Adds a policy switch at t_switch, when the solution is calculated up to t_switch and
+        x_last is the state at t_switch. The integration continues with the new policy.
 
-            if idx == 0:
-                sol_all = sol_step
+        Parameters
+        ----------
+        t_switch : float
+            switching time.
+        policy : str or float
+            the new policy, as in policy_list.
+
+        Returns
+        -------
+        None.
+
+        """
+        import numpy as np
+
+        policy_definition = dict(self.policy_definition)
+        policy_definition[t_switch] = policy
+        self.policy_definition = dict(sorted(policy_definition.items()))
+        self.policy_switch_times = list(self.policy_definition.keys())
+        self.policy_list = list(self.policy_definition.values())
+        self.sort_out_policies()
+        if not self.summary_only:
+            self.resize_sol()
+        list_t1 = [x[0] for x in self.list_segments]
+        self.idx_segment = int(np.argmin(np.abs(np.array(list_t1) - t_switch)))
+
+    def integrate_segment(self, x0_step, t_step, B_step):
+        """
+        epid_calss method.
+
+        Integrates the model with a fixed contact matrix on a time grid.
+
+        Parameters
+        ----------
+        x0_step : numpy array
+            initial condition, at t_step[0].
+        t_step : numpy array
+            time grid.
+        B_step : numpy 2D array
+            matrix of contact rates of the policy.
+
+        Returns
+        -------
+        sol_step : numpy array
+            solution, (N_time x N_states).
+        solver_info : dict
+            solver statistics, see mitepid.integrators.
+
+        """
+        from mitepid.integrators import integrate
+
+        model, model_jac, args = self.segment_model(B_step)
+        jac_band = None
+        if self.sens_params is not None:
+            jac_band = (len(self.x0) - 1, len(self.x0) - 1)
+        return integrate(self.integrator, model, x0_step, t_step, args=args,
+                         model_jac=model_jac, jac=self.jac, rtol=self.rtol, atol=self.atol,
+                         jac_band=jac_band)
+
+    def segment_model(self, B_step):
+        """
+        Return the vectorised model, its Jacobian and their arguments for a segment.
+
+        With forward sensitivities, the model is augmented with the sensitivity equations of
+        the current segment, see sensitivity.sensitivity_model, and its Jacobian is banded,
+        see sensitivity.sensitivity_jac.
+        """
+        from mitepid.models import get_model
+        from mitepid.sensitivity import sensitivity_model, sensitivity_jac
+
+        args = self.segment_args(B_step)
+        model, model_jac = get_model(self.model_type)
+        if self.sens_params is not None:
+            model = sensitivity_model(self.model_type, self.B, self.list_scales[self.idx_segment],
+                                      self.idx_segment, self.sens_layout)
+            model_jac = sensitivity_jac(self.model_type, self.sens_layout)
+        return model, model_jac, args
+
+    def segment_args(self, B_step):
+        """Return the arguments of the vectorised model for the contact matrix B_step."""
+        import numpy as np
+
+        # diagonal rates as 1-D vectors, as expected by the vectorised models
+        gamma = np.diag(self.Gamma).astype(float)
+        mu = np.diag(self.Mu).astype(float)
+        if self.model_type == 'SEIR':
+            sigma = np.diag(self.Sigma).astype(float)
+            return (B_step, gamma, mu, sigma)
+        return (B_step, gamma, mu)
+
+    def extend(self, new_switch_times=[], new_policies=[], t_end=None, xternal_inputs={},
+               str_policy=None):
+        """
+        epid_calss method.
+
+        Extend the simulation with new policies and/or a later final time, without integrating
+        the part of the solution which does not change again.
+
+        The solution is kept up to the first new switching time (or up to the current final
+        time if that comes first) and the integration continues from the last state kept.
+
+        Parameters
+        ----------
+        new_switch_times : list of float, optional
+            switching instances of the new policies. Policies defined at or after the first of
+            them are replaced. The default is [].
+        new_policies : list of str, optional
+            policies to be applied at each time in new_switch_times. The default is [].
+        t_end : float, optional
+            new final time for simulation. The default is None, i.e. unchanged.
+        xternal_inputs : dictionary of x0 type, optional
+            additional external inputs, after the solution kept. The default is {}.
+        str_policy : str, optional
+            new string used to create the subfolder for plots. The default is None.
+
+        Returns
+        -------
+        self : epid_sim
+            the object itself.
+
+        """
+        import numpy as np
+        from pathlib import Path
+
+        t_cut = np.inf
+        list_t_new = list(new_switch_times) + list(xternal_inputs.keys())
+        if len(list_t_new) > 0:
+            t_cut = min(list_t_new)
+        if t_end is not None:
+            self.t_end = t_end
+            self.t = np.arange(0, t_end+.1e-5, step=self.dt_out)
+        if str_policy is not None:
+            self.str_policy = str_policy
+            self.dir_save_plots = Path(self.dir_save_plots.parent, Path(str_policy))
+
+        policy_definition = {t: p for t, p in self.policy_definition.items() if t < t_cut}
+        self.list_events = [x for x in self.list_events if x[0] < t_cut and
+                            x[2] != 'terminate']
+        self.t_stop = None
+        policy_definition.update(dict(zip(new_switch_times, new_policies)))
+        self.policy_definition = dict(sorted(policy_definition.items()))
+        self.policy_switch_times = list(self.policy_definition.keys())
+        self.policy_list = list(self.policy_definition.values())
+        self.xternal_inputs = dict(self.xternal_inputs)
+        self.xternal_inputs.update(xternal_inputs)
+        self.sort_out_policies()
+
+        # keep the solution up to t_cut
+        eps_t = 1e-6 * self.t_step
+        if self.sens_params is not None:
+            self.resize_sensitivities()
+        if self.summary_only:
+            # nothing to keep, unless no row has to be discarded
+            if self.n_rows == 0 or self.t_x_last >= t_cut - eps_t or \
+                    self.t_out_last > self.t_end + eps_t:
+                self.reset_sol()
+                return self.continue_after_extend()
+            return self.continue_from(self.t_x_last)
+        t_sol = self.t_sol[:self.n_rows]
+        n_keep = int(np.sum(t_sol < t_cut - eps_t))
+        n_keep = min(n_keep, int(np.sum(t_sol <= self.t_end + eps_t)))
+        if n_keep == 0:
+            self.reset_sol()
+            return self.continue_after_extend()
+        self.n_rows = n_keep
+        # with a reduced precision dtype, this continues from the rounded state
+        self.x_last = np.array(self.sol_all[n_keep-1], dtype=float)
+        if self.sens_params is not None:
+            self.V_last = np.array(self.sens_all[n_keep-1])
+        t_kept = t_sol[n_keep - 1]
+        self.t_out_last = t_kept
+        self.resize_sol()
+        return self.continue_from(t_kept)
+
+    def resize_sensitivities(self, ):
+        """
+        Resize the forward sensitivities to the current segments, keeping n_rows rows.
+
+        Segments are only added or replaced after the rows kept, so the sensitivities to the
+        scales of the new segments are zero there.
+        """
+        import numpy as np
+
+        from mitepid.sensitivity import sensitivity_layout, to_structured, _size
+
+        layout_old = self.sens_layout
+        self.sens_layout = sensitivity_layout(self.model_type, self.Ng, len(self.list_segments),
+                                              self.sens_params)
+        sens_all = np.zeros((self.N_rows, len(self.x0), _size(self.sens_layout)))
+        n_rows = min(self.n_rows, self.N_rows)
+        sens_old = to_structured(self.sens_all[:n_rows], layout_old)
+        sens_new = to_structured(sens_all[:n_rows], self.sens_layout)
+        for key, shape in self.sens_layout:
+            if key == 'scales':
+                N_segments = min(shape[0], dict(layout_old)[key][0])
+                sens_new[key][..., :N_segments, :] = sens_old[key][..., :N_segments, :]
             else:
-                sol_all = np.concatenate((sol_all, sol_step))
+                sens_new[key] = sens_old[key]
+        self.sens_all = sens_all
+
+    def continue_from(self, t_kept):
+        """Set the segment where the integration continues from x_last at time t_kept."""
+        import numpy as np
+
+        eps_t = 1e-6 * self.t_step
+        for idx, (t_switch1, t_switch2, _, _) in enumerate(self.list_segments):
+            if t_switch1 - eps_t <= t_kept < t_switch2:
+                break
+        t_full = self.t_grid_segment(t_switch1, t_switch2)
+        if t_kept < t_full[-1] - eps_t:
+            self.idx_segment = idx
+            self.t_last = t_kept
+        else:
+            self.idx_segment = idx + 1
+            self.t_last = None
+        return self.continue_after_extend()
+
+    def continue_after_extend(self, ):
+        """Integrate the new segments, or in lazy mode leave it to the next access."""
+        if self.lazy:
+            self._sol_dict = None
+            self._sol_agg_dict = None
+            return self
+        return self.run()
+
+    def update_sol_dict(self, ):
+        """Build sol_dict and sol_agg_dict from the solution calculated so far."""
+        import numpy as np
+
+        from mitepid.models import get_compartments
+        from mitepid.utils import sol_aggregate_batch
+
+        if self.n_rows == 0 or self.summary_only:
+            return
+        if isinstance(self.sol_all, np.memmap):
+            self.sol_all.flush()
+        sol_all = self.sol_all[:self.n_rows]
 
-        country = self.country
+        list_compartments = get_compartments(self.model_type)
+        Ng = self.Ng
+        # all compartments aggregated in one product, (N_time x N_compartments)
+        sol_agg_all = sol_aggregate_batch(
+            sol_all.reshape(self.n_rows, len(list_compartments), Ng), self.country)
         sol_dict = {}
         sol_agg_dict = {}
-        Ng = self.Ng
-        if self.model_type == 'SIS':
-            sol_dict['I'] = sol_all[:,:Ng]
-            sol_agg_dict['I'] = sol_aggregate(sol_dict['I'], get_pop_distr(country))
-        elif self.model_type == 'SIR':
-            sol_dict['I'] = sol_all[:,:Ng]
-            sol_agg_dict['I'] = sol_aggregate(sol_dict['I'], get_pop_distr(country))
-            sol_dict['R'] = sol_all[:,Ng:2*Ng]
-            sol_agg_dict['R'] = sol_aggregate(sol_dict['R'], get_pop_distr(country))
-        elif self.model_type == 'SEIR':
-            sol_dict['I'] = sol_all[:,:Ng]
-            sol_agg_dict['I'] = sol_aggregate(sol_dict['I'], get_pop_distr(country))
-            sol_dict['R'] = sol_all[:,Ng:2*Ng]
-            sol_agg_dict['R'] = sol_aggregate(sol_dict['R'], get_pop_distr(country))
-            sol_dict['E'] = sol_all[:,2*Ng:3*Ng]
-            sol_agg_dict['E'] = sol_aggregate(sol_dict['E'], get_pop_distr(country))
+        for idx, key in enumerate(list_compartments):
+            sol_dict[key] = sol_all[:, idx*Ng:(idx+1)*Ng]
+            sol_agg_dict[key] = sol_agg_all[:, idx:idx+1]
 
         self.sol_dict = sol_dict
         self.sol_agg_dict = sol_agg_dict
 
+    def precision_report(self, ):
+        """
+        epid_calss method.
+
+        Rounding error of the stored solution against the float64 solution of the solver,
+        see dtype. Only rows calculated since the last reset_sol are included.
+
+        Returns
+        -------
+        dict_report : dict, keys are 'I', 'R', 'E', etc, values are dict
+            'max_abs_error': largest absolute error over all groups and times,
+            'max_rel_error': largest absolute error of each group divided by the largest
+            absolute value of that group, maximum over groups.
+
+        """
+        import numpy as np
+
+        from mitepid.models import get_compartments
+
+        Ng = self.Ng
+        dict_report = {}
+        for idx, key in enumerate(get_compartments(self.model_type)):
+            max_error = self.max_error[idx*Ng:(idx+1)*Ng]
+            max_abs = self.max_abs[idx*Ng:(idx+1)*Ng]
+            rel_error = np.divide(max_error, max_abs, out=np.zeros(Ng), where=max_abs > 0)
+            dict_report[key] = {'max_abs_error': float(np.max(max_error)),
+                                'max_rel_error': float(np.max(rel_error))}
+        return dict_report
+
+    # %% gradients
+    def gradient(self, objective='peak', compartment='I', weights=None, params=None, mode=None):
+        """
+        epid_calss method.
+
+        Gradient of a scalar objective of the solution with respect to the parameters of the
+        model, see mitepid.sensitivity.
+
+        Parameters
+        ----------
+        objective : str, optional
+            'peak': largest value of the aggregate compartment on the stored grid,
+            'final': its value at the last stored time.
+            The default is 'peak'.
+        compartment : str, optional
+            'I', 'R', 'E', etc. The default is 'I'.
+        weights : numpy array, optional
+            weights of the groups in the aggregate, (Ng). The default is None, i.e. the
+            population distribution, as in sol_agg_dict.
+        params : list of str, optional
+            the parameters, see sensitivity.list_all_params. The default is None, i.e. those of
+            the forward sensitivities if calculated, otherwise all of them.
+        mode : str, optional
+            'forward' from the forward sensitivities of calc_sol, 'adjoint' by integrating the
+            adjoint equations backwards along the solution. The default is None, i.e.
+            'forward' if the sensitivities of all params are available, otherwise 'adjoint'.
+
+        Raises
+        ------
+        ValueError
+            if the sensitivities are not available, or for the adjoint mode with summary_only,
+            events, steady_tol or output_dt.
+
+        Returns
+        -------
+        grad : numpy array
+            structured array with one field for each parameter, e.g. grad['B'] is (Ng x Ng).
+
+        """
+        import numpy as np
+
+        from mitepid.models import get_compartments
+        from mitepid.policies import get_pop_weights
+        from mitepid.sensitivity import sensitivity_layout, to_structured, adjoint_gradient
+
+        if self.summary_only:
+            raise ValueError('Gradients need the solution, they are not available with '
+                             'summary_only.')
+        Ng = self.Ng
+        N_states = len(self.x0)
+        if weights is None:
+            weights = get_pop_weights(self.country)
+        idx = get_compartments(self.model_type).index(compartment)
+        c = np.zeros(N_states)
+        c[idx*Ng:(idx+1)*Ng] = weights
+        sol_all = self.sol_dict[compartment]  # calculated on first access in lazy mode
+        if objective == 'peak':
+            idx_obj = int(np.argmax(sol_all @ np.asarray(weights, dtype=float)))
+        elif objective == 'final':
+            idx_obj = self.n_rows - 1
+        else:
+            raise ValueError('Objective was not recognized: ' + str(objective))
+        if params is None and self.sens_params is not None:
+            params = self.sens_params
+        layout = sensitivity_layout(self.model_type, Ng, len(self.list_segments), params)
+        if mode is None:
+            is_forward = self.sens_params is not None and \
+                all(key in self.sens_params for key, _ in layout)
+            mode = 'forward' if is_forward else 'adjoint'
+
+        if mode == 'forward':
+            sens = to_structured(np.tensordot(c, self.sens_all[idx_obj], axes=1),
+                                 self.sens_layout)
+            grad = np.zeros((), dtype=[(key, float, shape) for key, shape in layout])
+            for key, _ in layout:
+                grad[key] = sens[key]
+            return grad
+        if self.events or self.steady_tol is not None or self.output_dt is not None:
+            raise ValueError('The adjoint needs the solution on the solver grid, without '
+                             'events or steady_tol.')
+        grad = adjoint_gradient(self.model_type, self.t_sol[:self.n_rows],
+                                self.sol_all[:self.n_rows], self.list_segments,
+                                self.list_scales, self.B,
+                                self.segment_args, idx_obj, c,
+                                layout)
+        return to_structured(grad, layout)
+
     #################################################################################################
     # %% correct_x0
     def correct_x0(self, x0):
@@ -262,36 +1137,8 @@ class epid_sim:
             initial consitions with corrected length.
 
         """
-        import numpy as np
-        model_type = self.model_type
-        Ng = self.Ng
-
-        if model_type == 'SIS':
-            if len(x0) == 1:
-                x0 = np.ones(Ng)*x0
-            elif len(x0) == Ng:
-                x0 = x0
-            else:
-                raise('Something wrong with initial conditions vector!')
-        elif model_type == 'SIR':
-            if len(x0) == 1:
-                x0 = np.concatenate((np.ones(Ng)*x0, np.zeros(Ng)))
-            elif len(x0) == Ng:
-                x0 = np.concatenate((x0, np.zeros(Ng)))
-            elif len(x0) == 2*Ng:
-                x0 = x0
-            else:
-                raise('Something wrong with initial conditions vector!')
-        elif model_type == 'SEIR':
-            if len(x0) == 1:
-                x0 = np.concatenate((np.ones(Ng)*x0, np.zeros(Ng), np.zeros(Ng)))
-            elif len(x0) == Ng:
-                x0 = np.concatenate((x0, np.zeros(Ng), np.zeros(Ng)))
-            elif len(x0) == 3*Ng:
-                x0 = x0
-            else:
-                raise('Something wrong with initial conditions vector!')
-        return x0
+        from mitepid.utils import correct_x0
+        return correct_x0(x0, self.model_type, self.Ng)
 
     # %% plot_strat
     def plot_strat(self, suptitle = '', cmap='viridis',
@@ -327,7 +1174,7 @@ class epid_sim:
             str_file_name = self.model_type + '_' + key + '_groups'
             filesave = Path(self.dir_save_plots, str_file_name + '_' +
                             self.str_policy+'_tf_'+str(int(self.t_end))+'.png')
-            bplot_strat(self.t,
+            bplot_strat(self.t[:sol_plot.shape[0]],
                       sol_plot,
                       Ng=self.Ng,
                       filesave=filesave,
@@ -376,7 +1223,7 @@ class epid_sim:
             filesave = Path(self.dir_save_plots, str_file_name + '_' +
                             self.str_policy+'_tf_'+str(int(self.t_end))+'.png')
             suptitle = 'Compartment ' + key
-            bplot_strat_multiax(self.t,
+            bplot_strat_multiax(self.t[:sol_plot[-1].shape[0]],
                                 sol_plot,
                                 Ng=self.Ng,
                                 filesave=filesave,
@@ -446,7 +1293,7 @@ class epid_sim:
             else:
                 suptitle_text = suptitle
 
-            t_plot = self.t
+            t_plot = self.t[:sol_plot.shape[0]]
             if not t_end is None:
                 ind_t = [idx for idx, x in enumerate(t_plot) if x<=t_end][-1]
                 t_plot = t_plot[:ind_t]
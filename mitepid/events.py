@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Events are triggered by the state of the model, instead of a fixed time.
+
+epid_sim checks its events on each newly integrated piece of the solution. The exact time of
+the first crossing is found by root finding on the cubic Hermite interpolant between the two
+grid points around it (see integrators.sample_hermite). Then the event either terminates the
+simulation, or switches to a new policy from that time on, until the next scheduled switch:
+
+    dict_events = {'lockdown': event('I', 0.01, action='Lockdown'),
+                   'died_out': event('I', 1e-7, direction='down', action='terminate')}
+    epid_obj = epid_sim(..., events=dict_events)
+    epid_obj.list_events  # [(time, name, action), ...]
+
+An event whose condition already holds at the start of a segment, e.g. at t=0, is triggered
+there. Each event is triggered at most once. A switch at a time between the points of the grid
+of t_step only adds that time to the solver grid, the stored rows stay on the grid of epid_sim.t.
+
+@author: MiTepid contributors
+"""
+
+
+class event:
+    """A threshold on a (weighted) aggregate compartment."""
+
+    def __init__(self, compartment='I', threshold=0.01, direction='up', action='terminate',
+                 weights=None):
+        """
+        Initialise the event.
+
+        Parameters
+        ----------
+        compartment : str, optional
+            'I', 'R', 'E', etc. The default is 'I'.
+        threshold : float, optional
+            the threshold, for the aggregate of the compartment over all groups, as in
+            sol_agg_dict. The default is 0.01.
+        direction : str, optional
+            'up' to trigger when the value reaches the threshold from below, 'down' when it
+            falls to the threshold from above. The default is 'up'.
+        action : str or float, optional
+            'terminate' to stop the simulation, otherwise the policy to switch to, as in
+            policy_list. The default is 'terminate'.
+        weights : numpy array, optional
+            weights of each group, (Ng), used instead of the population distribution to
+            aggregate the groups, e.g. for the load on ICU beds. The default is None.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.compartment = compartment
+        self.threshold = threshold
+        self.direction = direction
+        self.action = action
+        self.weights = weights
+
+    def condition(self, sol, list_compartments, country):
+        """
+        Return the signed distance to the threshold, which is non-negative after the event.
+
+        Parameters
+        ----------
+        sol : numpy array
+            states, (... x N_states).
+        list_compartments : list of str
+            compartments of the model, in the order of the states.
+        country : str
+            country of the population distribution.
+
+        Returns
+        -------
+        g : numpy array
+            (...), value - threshold for 'up', threshold - value for 'down'.
+
+        """
+        import numpy as np
+        from mitepid.policies import get_pop_weights
+
+        Ng = sol.shape[-1] // len(list_compartments)
+        idx = list_compartments.index(self.compartment)
+        if self.weights is None:
+            weights = get_pop_weights(country)
+        else:
+            weights = np.asarray(self.weights, dtype=float)
+        value = sol[..., idx*Ng:(idx+1)*Ng] @ weights
+        if self.direction == 'down':
+            return self.threshold - value
+        return value - self.threshold
+
+    def locate(self, t, sol, model, args, list_compartments, country):
+        """
+        Find the first time the event is triggered in a piece of the solution.
+
+        Parameters
+        ----------
+        t : numpy array
+            time grid of the solution.
+        sol : numpy array
+            solution, (N_time x N_states).
+        model : function
+            vectorised model, used for the Hermite interpolant.
+        args : tuple
+            extra arguments passed to model.
+        list_compartments : list of str
+            compartments of the model, in the order of the states.
+        country : str
+            country of the population distribution.
+
+        Returns
+        -------
+        t_event : float or None
+            time of the event, in (t[0], t[-1]], None if it is not triggered.
+        x_event : numpy array or None
+            state at t_event.
+
+        """
+        import numpy as np
+        from scipy.optimize import brentq
+        from mitepid.integrators import sample_hermite
+
+        g = self.condition(sol, list_compartments, country)
+        is_cross = (g[1:] >= 0) & (g[:-1] < 0)
+        if not np.any(is_cross):
+            return None, None
+        idx = int(np.argmax(is_cross))
+        t_pair = t[idx:idx+2]
+        sol_pair = sol[idx:idx+2]
+        if g[idx+1] == 0:
+            return float(t_pair[1]), np.array(sol_pair[1])
+
+        def _g(t_in):
+            x = sample_hermite(t_pair, sol_pair, [t_in], model, args, eps_t=0)[0]
+            return self.condition(x, list_compartments, country)
+
+        t_event = brentq(_g, t_pair[0], t_pair[1], xtol=1e-12)
+        x_event = sample_hermite(t_pair, sol_pair, [t_event], model, args, eps_t=0)[0]
+        return t_event, x_event
@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Solver backends used to integrate the compartmental models.
+
+Each backend takes a vectorised model from mitepid.models (e.g. SEIR_vec) and its Jacobian
+(e.g. SEIR_jac), integrates it on a time grid and returns the solution on that grid together
+with a dictionary of solver statistics:
+    'integrator': name of the backend,
+    'nfev': number of evaluations of the right-hand side,
+    'njev': number of evaluations of the Jacobian,
+    'wall_time': wall time in seconds.
+
+@author: MiTepid contributors
+"""
+
+
+def integrate(integrator, model, x0, t, args=(), model_jac=None, jac='dense', rtol=None,
+              atol=None, jac_band=None):
+    """
+    Integrate a model with the chosen backend.
+
+    Parameters
+    ----------
+    integrator : str
+        'odeint' for scipy.integrate.odeint,
+        'LSODA', 'RK45', 'BDF' (or any other method of scipy.integrate.solve_ivp),
+        'RK4' for the fixed-step Runge-Kutta scheme on the grid t,
+        'linearised' for exact integration of the model linearised on each interval of t.
+        The fixed-step backends are accuracy options, not speed options: they evaluate the
+        model four times (RK4), or the model, its Jacobian and a matrix exponential (linearised)
+        on every interval of t, in a Python loop. On the 0.1-day grids they are several tens of
+        times slower than 'odeint', whose adaptive steps are much longer than the grid.
+    model : function
+        vectorised model, f(states, t, *args, out=None).
+    x0 : numpy array
+        initial condition.
+    t : numpy array
+        time grid. t[0] is the initial time, solution is returned on all points of t.
+    args : tuple, optional
+        extra arguments passed to model and model_jac. The default is ().
+    model_jac : function, optional
+        Jacobian of the model, with the same signature. The default is None.
+    jac : str or None, optional
+        'dense', 'banded' or None, see epid_sim. The default is 'dense'.
+    rtol : float, optional
+        relative tolerance of adaptive backends. The default is None, i.e. solver default.
+    atol : float, optional
+        absolute tolerance of adaptive backends. The default is None, i.e. solver default.
+    jac_band : tuple, optional
+        (ml, mu) if model_jac returns the Jacobian already in the banded format of
+        models.jac_to_banded, e.g. for the model augmented with sensitivities. It is then
+        used as it is for any jac other than None. The default is None.
+
+    Returns
+    -------
+    sol : numpy array
+        solution, (N_time x N_states).
+    info : dict
+        solver statistics.
+
+    """
+    import time
+
+    if model_jac is None:
+        jac = None
+    time_start = time.perf_counter()
+    if integrator == 'odeint':
+        sol, info = integrate_odeint(model, x0, t, args, model_jac, jac, rtol=rtol, atol=atol,
+                                     jac_band=jac_band)
+    elif integrator == 'RK4':
+        sol, info = integrate_rk4(model, x0, t, args)
+    elif integrator == 'linearised':
+        if model_jac is None or jac_band is not None:
+            raise ValueError("The 'linearised' integrator needs the dense Jacobian of the "
+                             "model.")
+        sol, info = integrate_linearised(model, x0, t, args, model_jac)
+    else:
+        sol, info = integrate_solve_ivp(model, x0, t, args, model_jac, jac, method=integrator,
+                                        rtol=rtol, atol=atol, jac_band=jac_band)
+    info['integrator'] = integrator
+    info['wall_time'] = time.perf_counter() - time_start
+    return sol, info
+
+
+def structural_bandwidth(model_jac, args, N, perm=None):
+    """
+    Bandwidths of the Jacobian of a model, based on the sparsity of the contact matrix.
+
+    Parameters
+    ----------
+    model_jac : function
+        Jacobian of the model.
+    args : tuple
+        arguments of the model, (B, gamma, mu, ...).
+    N : int
+        number of states.
+    perm : numpy array, optional
+        order of the states, see banded_ordering. The default is None, i.e. as in the model.
+
+    Returns
+    -------
+    ml : int
+        lower bandwidth.
+    mu : int
+        upper bandwidth.
+
+    """
+    import numpy as np
+    from mitepid.models import jac_bandwidth
+
+    B = args[0]
+    Ng = B.shape[0]
+    args_struct = ((B != 0) * 1.0,) + tuple(np.ones(Ng) for _ in args[1:])
+    jac_struct = model_jac(np.full(N, 0.1), 0, *args_struct)
+    if perm is not None:
+        jac_struct = jac_struct[np.ix_(perm, perm)]
+    return jac_bandwidth(jac_struct)
+
+
+def banded_ordering(model_jac, args, N):
+    """
+    Order of the states for a banded Jacobian, or None if the band would be full.
+
+    The models store the states by compartment, [I_1..I_Ng, R_1..R_Ng, ...], so each group is
+    coupled to itself at offsets of Ng and the band is never narrower than the state vector.
+    Ordered by group, [I_1, R_1, E_1, I_2, ...], the bandwidth only depends on how far the
+    contacts in B reach, e.g. a few groups for contacts between neighbouring age groups.
+
+    Parameters
+    ----------
+    model_jac : function
+        Jacobian of the model.
+    args : tuple
+        arguments of the model, (B, gamma, mu, ...).
+    N : int
+        number of states.
+
+    Returns
+    -------
+    band : tuple or None
+        (perm, ml, mu): the states of the model in the new order are x[perm], and the lower
+        and upper bandwidths. None if the band is full, e.g. for a dense B.
+
+    """
+    import numpy as np
+
+    Ng = args[0].shape[0]
+    perm = np.arange(N).reshape(N // Ng, Ng).T.ravel()
+    ml_band, mu_band = structural_bandwidth(model_jac, args, N, perm)
+    if ml_band + mu_band + 1 >= N:
+        return None
+    return perm, ml_band, mu_band
+
+
+def integrate_odeint(model, x0, t, args=(), model_jac=None, jac='dense', rtol=None, atol=None,
+                     jac_band=None):
+    """
+    Integrate with scipy.integrate.odeint (LSODA).
+
+    Parameters are as in integrate.
+
+    Returns
+    -------
+    sol : numpy array
+        solution, (N_time x N_states).
+    info : dict
+        solver statistics.
+
+    """
+    from functools import partial
+    import numpy as np
+    from scipy.integrate import odeint
+    from mitepid.models import jac_to_banded
+
+    N = len(x0)
+    # odeint copies the returned derivative, so the same buffers can be reused
+    rhs = partial(model, out=np.empty(N))
+    band = None
+    if jac == 'banded' and jac_band is None:
+        # with a full band, e.g. for a dense B, the dense Jacobian is cheaper
+        band = banded_ordering(model_jac, args, N)
+        jac = 'dense' if band is None else jac
+    if jac is not None and jac_band is not None:
+        ml_band, mu_band = jac_band
+        sol, infodict = odeint(rhs, x0, t, args=args, Dfun=model_jac, ml=ml_band, mu=mu_band,
+                               full_output=True, rtol=rtol, atol=atol)
+    elif band is not None:
+        perm, ml_band, mu_band = band
+        inv = np.argsort(perm)
+        rhs_buf = np.empty(N)
+        jac_buf = np.empty((N, N))
+        band_buf = np.empty((ml_band + mu_band + 1, N))
+        rhs_perm = lambda z, t, *args: model(z[inv], t, *args, out=rhs_buf)[perm]
+        Dfun = lambda z, t, *args: jac_to_banded(
+            model_jac(z[inv], t, *args, out=jac_buf)[np.ix_(perm, perm)], ml_band, mu_band,
+            out=band_buf)
+        sol, infodict = odeint(rhs_perm, np.asarray(x0, dtype=float)[perm], t, args=args,
+                               Dfun=Dfun, ml=ml_band, mu=mu_band, full_output=True, rtol=rtol,
+                               atol=atol)
+        sol = sol[:, inv]
+    elif jac == 'dense':
+        Dfun = partial(model_jac, out=np.empty((N, N)))
+        sol, infodict = odeint(rhs, x0, t, args=args, Dfun=Dfun, full_output=True, rtol=rtol,
+                               atol=atol)
+    else:
+        sol, infodict = odeint(rhs, x0, t, args=args, full_output=True, rtol=rtol, atol=atol)
+
+    info = {}
+    if len(t) > 1:
+        info['nfev'] = int(infodict['nfe'][-1])
+        info['njev'] = int(infodict['nje'][-1])
+    else:
+        info['nfev'] = 0
+        info['njev'] = 0
+    return sol, info
+
+
+def integrate_solve_ivp(model, x0, t, args=(), model_jac=None, jac='dense', method='LSODA',
+                        rtol=None, atol=None, jac_band=None):
+    """
+    Integrate with scipy.integrate.solve_ivp, using its dense output on the grid t.
+
+    Parameters are as in integrate, method is passed to solve_ivp.
+
+    Returns
+    -------
+    sol : numpy array
+        solution, (N_time x N_states).
+    info : dict
+        solver statistics.
+
+    """
+    import warnings
+    import numpy as np
+    from scipy.integrate import solve_ivp
+    from scipy.sparse import dia_matrix
+    from mitepid.models import jac_to_banded
+
+    x0 = np.asarray(x0, dtype=float)
+    info = {'nfev': 0, 'njev': 0}
+    if len(t) < 2:
+        return np.atleast_2d(x0).copy(), info
+
+    # solve_ivp keeps references to the returned arrays, so no shared buffers here
+    fun = lambda t, y: model(y, t, *args)
+    options = {}
+    if rtol is not None:
+        options['rtol'] = rtol
+    if atol is not None:
+        options['atol'] = atol
+    perm = None
+    if jac is not None and jac_band is not None and method in ['LSODA', 'BDF', 'Radau']:
+        ml_band, mu_band = jac_band
+        if method == 'LSODA':
+            options['jac'] = lambda t, y: model_jac(y, t, *args)
+            options['lband'] = ml_band
+            options['uband'] = mu_band
+        else:
+            # BDF and Radau take sparse matrices, band row k is the diagonal at offset mu - k
+            offsets = mu_band - np.arange(ml_band + mu_band + 1)
+            options['jac'] = lambda t, y: dia_matrix((model_jac(y, t, *args), offsets),
+                                                     shape=(len(y), len(y))).tocsc()
+    elif jac is not None and method in ['LSODA', 'BDF', 'Radau']:
+        band = None
+        if jac == 'banded' and method == 'LSODA':
+            band = banded_ordering(model_jac, args, len(x0))
+        if band is not None:
+            perm, ml_band, mu_band = band
+            inv = np.argsort(perm)
+            fun = lambda t, z: model(z[inv], t, *args)[perm]
+            options['jac'] = lambda t, z: jac_to_banded(
+                model_jac(z[inv], t, *args)[np.ix_(perm, perm)], ml_band, mu_band)
+            options['lband'] = ml_band
+            options['uband'] = mu_band
+            x0 = x0[perm]
+        else:
+            options['jac'] = lambda t, y: model_jac(y, t, *args)
+
+    res = solve_ivp(fun, (t[0], t[-1]), x0, method=method, dense_output=True, **options)
+    if not res.success:
+        warnings.warn('solve_ivp did not succeed: ' + res.message, RuntimeWarning)
+    sol = res.sol(t).T
+    if perm is not None:
+        sol = sol[:, inv]
+    info['nfev'] = int(res.nfev)
+    info['njev'] = int(res.njev)
+    return sol, info
+
+
+def integrate_rk4(model, x0, t, args=()):
+    """
+    Integrate with the classic fixed-step Runge-Kutta scheme, stepping on the grid t.
+
+    x0 can have leading batch dimensions, (... x N_states), e.g. for ensembles.
+
+    Parameters are as in integrate.
+
+    Returns
+    -------
+    sol : numpy array
+        solution, (N_time x ... x N_states).
+    info : dict
+        solver statistics.
+
+    """
+    import numpy as np
+
+    x0 = np.asarray(x0, dtype=float)
+    Nt = len(t)
+    sol = np.empty((Nt,) + x0.shape)
+    sol[0] = x0
+    k1 = np.empty_like(x0)
+    k2 = np.empty_like(x0)
+    k3 = np.empty_like(x0)
+    k4 = np.empty_like(x0)
+    for idx in np.arange(Nt - 1):
+        x = sol[idx]
+        t1 = t[idx]
+        h = t[idx + 1] - t1
+        model(x, t1, *args, out=k1)
+        model(x + 0.5 * h * k1, t1 + 0.5 * h, *args, out=k2)
+        model(x + 0.5 * h * k2, t1 + 0.5 * h, *args, out=k3)
+        model(x + h * k3, t1 + h, *args, out=k4)
+        sol[idx + 1] = x + h / 6 * (k1 + 2 * k2 + 2 * k3 + k4)
+    info = {'nfev': 4 * (Nt - 1), 'njev': 0}
+    return sol, info
+
+
+def integrate_linearised(model, x0, t, args=(), model_jac=None):
+    """
+    Integrate exactly the model linearised at the start of each interval of the grid t.
+
+    This is the exponential Rosenbrock-Euler scheme,
+        x(t + h) = x(t) + h * phi_1(h * J) @ f(x(t)),    phi_1(z) = (exp(z) - 1) / z,
+    with J the Jacobian at x(t), which is exact for linear models, e.g. the early phase of an
+    epidemic, whatever the step, and second order otherwise. h * phi_1(h * J) @ f is the
+    last column of the exponential of h * [[J, f], [0, 0]].
+
+    Parameters are as in integrate, model_jac is needed (dense).
+
+    Returns
+    -------
+    sol : numpy array
+        solution, (N_time x N_states).
+    info : dict
+        solver statistics.
+
+    """
+    import numpy as np
+    from scipy.linalg import expm
+
+    x0 = np.asarray(x0, dtype=float)
+    N = len(x0)
+    Nt = len(t)
+    sol = np.empty((Nt, N))
+    sol[0] = x0
+    M = np.zeros((N + 1, N + 1))
+    for idx in np.arange(Nt - 1):
+        x = sol[idx]
+        h = t[idx + 1] - t[idx]
+        M[:N, :N] = model_jac(x, t[idx], *args)
+        M[:N, N] = model(x, t[idx], *args)
+        sol[idx + 1] = x + expm(h * M)[:N, N]
+    info = {'nfev': Nt - 1, 'njev': Nt - 1}
+    return sol, info
+
+
+def sample_hermite(t, sol, t_out, model, args=(), eps_t=1e-9):
+    """
+    Sample a solution calculated on a grid at other time points.
+
+    Points of t_out on the grid (within eps_t) are copied. Points in between are interpolated
+    with cubic Hermite polynomials, using the model derivatives at the two neighbouring grid
+    points, which is consistent with the fourth order of the RK4 backend. Points after t[-1]
+    get the last state.
+
+    Parameters
+    ----------
+    t : numpy array
+        time grid of the solution.
+    sol : numpy array
+        solution, (N_time x ... x N_states).
+    t_out : numpy array
+        time points to sample, sorted.
+    model : function
+        vectorised model, f(states, t, *args, out=None).
+    args : tuple, optional
+        extra arguments passed to model. The default is ().
+    eps_t : float, optional
+        tolerance to match time points. The default is 1e-9.
+
+    Returns
+    -------
+    sol_out : numpy array
+        solution at t_out, (len(t_out) x ... x N_states).
+
+    """
+    import numpy as np
+
+    t = np.asarray(t, dtype=float)
+    t_out = np.asarray(t_out, dtype=float)
+    idx = np.minimum(np.searchsorted(t, t_out - eps_t), len(t) - 1)
+    sol_out = sol[idx]
+    is_interp = (np.abs(t[idx] - t_out) > eps_t) & (t_out < t[-1]) & (idx > 0)
+    if np.any(is_interp):
+        idx1 = idx[is_interp]
+        idx0 = idx1 - 1
+        h = t[idx1] - t[idx0]
+        s = (t_out[is_interp] - t[idx0]) / h
+        shape = (-1,) + (1,) * (sol.ndim - 1)
+        h = h.reshape(shape)
+        s = s.reshape(shape)
+        x0 = sol[idx0]
+        x1 = sol[idx1]
+        f0 = model(x0, t[idx0], *args)
+        f1 = model(x1, t[idx1], *args)
+        sol_out[is_interp] = (2*s**3 - 3*s**2 + 1) * x0 + (s**3 - 2*s**2 + s) * h * f0 \
+            + (-2*s**3 + 3*s**2) * x1 + (s**3 - s**2) * h * f1
+    return sol_out
@@ -132,3 +132,514 @@ def SIS(I, t, B, Gamma, Mu):
     return dIdt
 
 
+
+
+# %% vectorised right-hand sides
+# The functions above are kept as the reference implementations. The ones below compute
+# the force of infection as B @ I, take the diagonal rates as 1-D vectors (e.g. np.diag(Gamma))
+# and write into a preallocated output buffer, which is what calc_sol passes to the solver.
+# States may carry leading batch dimensions, in which case B can be shared (Ng x Ng) or
+# one matrix per batch member (... x Ng x Ng).
+def _force_of_infection(B, I):
+    """Return the force of infection B @ I, for a single state or a batch of states."""
+    import numpy as np
+    if I.ndim == 1:
+        return B @ I
+    return np.matmul(B, I[..., None])[..., 0]
+
+
+def SEIR_vec(states, t, B, gamma, mu, sigma, out=None):
+    """
+    Vectorised right-hand side of the SEIR compartmental model.
+
+    Parameters
+    ----------
+    states : numpy array
+        array of size 3*Ng for Infective (I), Recovered (R) and Exposed (E) states.
+    t : float
+        time, not used since the model is autonomous.
+    B : numpy 2D array
+        matrix of contact rates. b_{ij} describes the influence of group j on group i.
+    gamma : numpy array
+        1-D array of recovery rates, diagonal of Gamma.
+    mu : numpy array
+        1-D array of birth/death rates, diagonal of Mu.
+    sigma : numpy array
+        1-D array of inhibition rates, diagonal of Sigma.
+    out : numpy array, optional
+        buffer of the same shape as states to write the result into. The default is None.
+
+    Returns
+    -------
+    dsdt : numpy array
+        time derivative of the states.
+
+    """
+    import numpy as np
+    Ng = B.shape[-1]
+    if out is None:
+        out = np.empty_like(states)
+    I = states[..., :Ng]
+    R = states[..., Ng:2*Ng]
+    E = states[..., 2*Ng:3*Ng]
+    Sum_j_x = _force_of_infection(B, I)
+    out[..., :Ng] = sigma * E - (mu + gamma) * I
+    out[..., Ng:2*Ng] = gamma * I - mu * R
+    out[..., 2*Ng:3*Ng] = (1 - I - R - E) * Sum_j_x - (mu + sigma) * E
+    return out
+
+
+def SIR_vec(states, t, B, gamma, mu, out=None):
+    """
+    Vectorised right-hand side of the SIR compartmental model.
+
+    Parameters
+    ----------
+    states : numpy array
+        array of size 2*Ng for Infective (I) and Recovered (R) states.
+    t : float
+        time, not used since the model is autonomous.
+    B : numpy 2D array
+        matrix of contact rates. b_{ij} describes the influence of group j on group i.
+    gamma : numpy array
+        1-D array of recovery rates, diagonal of Gamma.
+    mu : numpy array
+        1-D array of birth/death rates, diagonal of Mu.
+    out : numpy array, optional
+        buffer of the same shape as states to write the result into. The default is None.
+
+    Returns
+    -------
+    dsdt : numpy array
+        time derivative of the states.
+
+    """
+    import numpy as np
+    Ng = B.shape[-1]
+    if out is None:
+        out = np.empty_like(states)
+    I = states[..., :Ng]
+    R = states[..., Ng:2*Ng]
+    Sum_j_x = _force_of_infection(B, I)
+    out[..., :Ng] = (1 - I - R) * Sum_j_x - (mu + gamma) * I
+    out[..., Ng:2*Ng] = gamma * I - mu * R
+    return out
+
+
+def SIS_vec(I, t, B, gamma, mu, out=None):
+    """
+    Vectorised right-hand side of the SIS compartmental model.
+
+    Parameters
+    ----------
+    I : numpy array
+        array of size Ng for Infective (I) states.
+    t : float
+        time, not used since the model is autonomous.
+    B : numpy 2D array
+        matrix of contact rates. b_{ij} describes the influence of group j on group i.
+    gamma : numpy array
+        1-D array of recovery rates, diagonal of Gamma.
+    mu : numpy array
+        1-D array of birth/death rates, diagonal of Mu.
+    out : numpy array, optional
+        buffer of the same shape as I to write the result into. The default is None.
+
+    Returns
+    -------
+    dIdt : numpy array
+        time derivative of the states.
+
+    """
+    import numpy as np
+    if out is None:
+        out = np.empty_like(I)
+    Sum_j = _force_of_infection(B, I)
+    out[...] = (1 - I) * Sum_j - (mu + gamma) * I
+    return out
+
+
+# %% analytic Jacobians
+# Closed-form Jacobians of the vectorised models above, with the same signature, so they can
+# be passed as Dfun to odeint. J[i, j] is the derivative of the i-th equation with respect to
+# the j-th state.
+def SEIR_jac(states, t, B, gamma, mu, sigma, out=None):
+    """
+    Jacobian of the SEIR compartmental model, see SEIR_vec.
+
+    Parameters
+    ----------
+    states : numpy array
+        array of size 3*Ng for Infective (I), Recovered (R) and Exposed (E) states.
+    t : float
+        time, not used since the model is autonomous.
+    B : numpy 2D array
+        matrix of contact rates.
+    gamma : numpy array
+        1-D array of recovery rates, diagonal of Gamma.
+    mu : numpy array
+        1-D array of birth/death rates, diagonal of Mu.
+    sigma : numpy array
+        1-D array of inhibition rates, diagonal of Sigma.
+    out : numpy 2D array, optional
+        (3*Ng x 3*Ng) buffer to write the result into. The default is None.
+
+    Returns
+    -------
+    jac : numpy 2D array
+        Jacobian matrix of the model.
+
+    """
+    import numpy as np
+    Ng = B.shape[0]
+    if out is None:
+        out = np.empty((3*Ng, 3*Ng))
+    I = states[:Ng]
+    R = states[Ng:2*Ng]
+    E = states[2*Ng:3*Ng]
+    Sum_j_x = B @ I
+    ind = np.arange(Ng)
+    out[...] = 0
+    # I
+    out[ind, ind] = -(mu + gamma)
+    out[ind, ind + 2*Ng] = sigma
+    # R
+    out[ind + Ng, ind] = gamma
+    out[ind + Ng, ind + Ng] = -mu
+    # E
+    out[2*Ng:, :Ng] = (1 - I - R - E)[:, None] * B
+    out[ind + 2*Ng, ind] -= Sum_j_x
+    out[ind + 2*Ng, ind + Ng] = -Sum_j_x
+    out[ind + 2*Ng, ind + 2*Ng] = -Sum_j_x - (mu + sigma)
+    return out
+
+
+def SIR_jac(states, t, B, gamma, mu, out=None):
+    """
+    Jacobian of the SIR compartmental model, see SIR_vec.
+
+    Parameters
+    ----------
+    states : numpy array
+        array of size 2*Ng for Infective (I) and Recovered (R) states.
+    t : float
+        time, not used since the model is autonomous.
+    B : numpy 2D array
+        matrix of contact rates.
+    gamma : numpy array
+        1-D array of recovery rates, diagonal of Gamma.
+    mu : numpy array
+        1-D array of birth/death rates, diagonal of Mu.
+    out : numpy 2D array, optional
+        (2*Ng x 2*Ng) buffer to write the result into. The default is None.
+
+    Returns
+    -------
+    jac : numpy 2D array
+        Jacobian matrix of the model.
+
+    """
+    import numpy as np
+    Ng = B.shape[0]
+    if out is None:
+        out = np.empty((2*Ng, 2*Ng))
+    I = states[:Ng]
+    R = states[Ng:2*Ng]
+    Sum_j_x = B @ I
+    ind = np.arange(Ng)
+    out[...] = 0
+    # I
+    out[:Ng, :Ng] = (1 - I - R)[:, None] * B
+    out[ind, ind] -= Sum_j_x + mu + gamma
+    out[ind, ind + Ng] = -Sum_j_x
+    # R
+    out[ind + Ng, ind] = gamma
+    out[ind + Ng, ind + Ng] = -mu
+    return out
+
+
+def SIS_jac(I, t, B, gamma, mu, out=None):
+    """
+    Jacobian of the SIS compartmental model, see SIS_vec.
+
+    Parameters
+    ----------
+    I : numpy array
+        array of size Ng for Infective (I) states.
+    t : float
+        time, not used since the model is autonomous.
+    B : numpy 2D array
+        matrix of contact rates.
+    gamma : numpy array
+        1-D array of recovery rates, diagonal of Gamma.
+    mu : numpy array
+        1-D array of birth/death rates, diagonal of Mu.
+    out : numpy 2D array, optional
+        (Ng x Ng) buffer to write the result into. The default is None.
+
+    Returns
+    -------
+    jac : numpy 2D array
+        Jacobian matrix of the model.
+
+    """
+    import numpy as np
+    Ng = B.shape[0]
+    if out is None:
+        out = np.empty((Ng, Ng))
+    Sum_j = B @ I
+    ind = np.arange(Ng)
+    out[...] = (1 - I)[:, None] * B
+    out[ind, ind] -= Sum_j + mu + gamma
+    return out
+
+
+def jac_bandwidth(jac):
+    """
+    Lower and upper bandwidth of a Jacobian, based on its non-zero entries.
+
+    Parameters
+    ----------
+    jac : numpy 2D array
+        a (structural) Jacobian matrix.
+
+    Returns
+    -------
+    ml : int
+        lower bandwidth.
+    mu : int
+        upper bandwidth.
+
+    """
+    import numpy as np
+    rows, cols = np.nonzero(jac)
+    if rows.size == 0:
+        return 0, 0
+    ml = int(max(np.max(rows - cols), 0))
+    mu = int(max(np.max(cols - rows), 0))
+    return ml, mu
+
+
+def jac_to_banded(jac, ml, mu, out=None):
+    """
+    Pack a dense Jacobian in the banded format expected by odeint.
+
+    jac[i, j] is stored in out[i - j + mu, j].
+
+    Parameters
+    ----------
+    jac : numpy 2D array
+        dense Jacobian, (N x N).
+    ml : int
+        lower bandwidth.
+    mu : int
+        upper bandwidth.
+    out : numpy 2D array, optional
+        (ml + mu + 1 x N) buffer to write the result into. The default is None.
+
+    Returns
+    -------
+    jac_banded : numpy 2D array
+        banded Jacobian.
+
+    """
+    import numpy as np
+    N = jac.shape[0]
+    if out is None:
+        out = np.empty((ml + mu + 1, N))
+    out[...] = 0
+    for k in np.arange(-ml, mu + 1):
+        diag_k = np.diagonal(jac, offset=k)
+        if k >= 0:
+            out[mu - k, k:] = diag_k
+        else:
+            out[mu - k, :N + k] = diag_k
+    return out
+
+
+# %% Jacobian-vector products
+# The products of the Jacobians above with a set of directions, J(states) @ V, for a batch of
+# states (... x N_states) and directions (... x N_states x K), without forming J. They are the
+# right-hand sides of the forward sensitivity (tangent) equations dV/dt = J(states) @ V.
+def SEIR_jvp(states, V, t, B, gamma, mu, sigma, out=None):
+    """
+    Product of the Jacobian of the SEIR compartmental model with directions, see SEIR_jac.
+
+    Parameters
+    ----------
+    states : numpy array
+        states, (... x 3*Ng).
+    V : numpy array
+        directions, (... x 3*Ng x K).
+    t : float
+        time, not used since the model is autonomous.
+    B, gamma, mu, sigma :
+        see SEIR_vec.
+    out : numpy array, optional
+        buffer of the same shape as V to write the result into. The default is None.
+
+    Returns
+    -------
+    jv : numpy array
+        (... x 3*Ng x K), Jacobian times V.
+
+    """
+    import numpy as np
+    Ng = B.shape[-1]
+    if out is None:
+        out = np.empty_like(V)
+    I = states[..., :Ng]
+    R = states[..., Ng:2*Ng]
+    E = states[..., 2*Ng:3*Ng]
+    V_I = V[..., :Ng, :]
+    V_R = V[..., Ng:2*Ng, :]
+    V_E = V[..., 2*Ng:3*Ng, :]
+    Sum_j_x = _force_of_infection(B, I)[..., None]
+    out[..., :Ng, :] = sigma[..., None] * V_E - (mu + gamma)[..., None] * V_I
+    out[..., Ng:2*Ng, :] = gamma[..., None] * V_I - mu[..., None] * V_R
+    out[..., 2*Ng:3*Ng, :] = (1 - I - R - E)[..., None] * np.matmul(B, V_I) \
+        - Sum_j_x * (V_I + V_R + V_E) - (mu + sigma)[..., None] * V_E
+    return out
+
+
+def SIR_jvp(states, V, t, B, gamma, mu, out=None):
+    """
+    Product of the Jacobian of the SIR compartmental model with directions, see SIR_jac.
+
+    Parameters
+    ----------
+    states : numpy array
+        states, (... x 2*Ng).
+    V : numpy array
+        directions, (... x 2*Ng x K).
+    t : float
+        time, not used since the model is autonomous.
+    B, gamma, mu :
+        see SIR_vec.
+    out : numpy array, optional
+        buffer of the same shape as V to write the result into. The default is None.
+
+    Returns
+    -------
+    jv : numpy array
+        (... x 2*Ng x K), Jacobian times V.
+
+    """
+    import numpy as np
+    Ng = B.shape[-1]
+    if out is None:
+        out = np.empty_like(V)
+    I = states[..., :Ng]
+    R = states[..., Ng:2*Ng]
+    V_I = V[..., :Ng, :]
+    V_R = V[..., Ng:2*Ng, :]
+    Sum_j_x = _force_of_infection(B, I)[..., None]
+    out[..., :Ng, :] = (1 - I - R)[..., None] * np.matmul(B, V_I) \
+        - Sum_j_x * (V_I + V_R) - (mu + gamma)[..., None] * V_I
+    out[..., Ng:2*Ng, :] = gamma[..., None] * V_I - mu[..., None] * V_R
+    return out
+
+
+def SIS_jvp(I, V, t, B, gamma, mu, out=None):
+    """
+    Product of the Jacobian of the SIS compartmental model with directions, see SIS_jac.
+
+    Parameters
+    ----------
+    I : numpy array
+        states, (... x Ng).
+    V : numpy array
+        directions, (... x Ng x K).
+    t : float
+        time, not used since the model is autonomous.
+    B, gamma, mu :
+        see SIS_vec.
+    out : numpy array, optional
+        buffer of the same shape as V to write the result into. The default is None.
+
+    Returns
+    -------
+    jv : numpy array
+        (... x Ng x K), Jacobian times V.
+
+    """
+    import numpy as np
+    if out is None:
+        out = np.empty_like(V)
+    Sum_j = _force_of_infection(B, I)[..., None]
+    out[...] = (1 - I)[..., None] * np.matmul(B, V) - Sum_j * V - (mu + gamma)[..., None] * V
+    return out
+
+
+def get_model_jvp(model_type):
+    """
+    Return the Jacobian-vector product of a model type, e.g. SEIR_jvp.
+
+    Parameters
+    ----------
+    model_type : str
+        'SIS', 'SIR' or 'SEIR'.
+
+    Returns
+    -------
+    model_jvp : function
+        Jacobian-vector product, f(states, V, t, *args, out=None).
+
+    """
+    dict_jvp = {'SIS': SIS_jvp,
+                'SIR': SIR_jvp,
+                'SEIR': SEIR_jvp}
+    try:
+        return dict_jvp[model_type]
+    except KeyError:
+        raise ValueError('Model type ' + str(model_type) + ' is not defined.')
+
+
+def get_model(model_type):
+    """
+    Return the vectorised model and its Jacobian for a given model type.
+
+    Parameters
+    ----------
+    model_type : str
+        'SIS', 'SIR' or 'SEIR'.
+
+    Returns
+    -------
+    model : function
+        vectorised right-hand side, e.g. SEIR_vec.
+    model_jac : function
+        analytic Jacobian, e.g. SEIR_jac.
+
+    """
+    dict_models = {'SIS': (SIS_vec, SIS_jac),
+                   'SIR': (SIR_vec, SIR_jac),
+                   'SEIR': (SEIR_vec, SEIR_jac)}
+    try:
+        return dict_models[model_type]
+    except KeyError:
+        raise ValueError('Model type ' + str(model_type) + ' is not defined.')
+
+
+def get_compartments(model_type):
+    """
+    Return the compartments of a model, in the order they appear in the state vector.
+
+    Parameters
+    ----------
+    model_type : str
+        'SIS', 'SIR' or 'SEIR'.
+
+    Returns
+    -------
+    list_compartments : list of str
+        e.g. ['I', 'R', 'E'] for SEIR.
+
+    """
+    dict_compartments = {'SIS': ['I'],
+                         'SIR': ['I', 'R'],
+                         'SEIR': ['I', 'R', 'E']}
+    try:
+        return dict_compartments[model_type]
+    except KeyError:
+        raise ValueError('Model type ' + str(model_type) + ' is not defined.')
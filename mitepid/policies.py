@@ -137,7 +137,7 @@ def str_policy_info():
     """
     return str_out
 
-def get_B_policy(file_data_opt=None, country='Germany', policy='Uncontained', B = None, ):
+def get_B_policy(file_data_opt=None, country='Germany', policy='Uncontained', B = None, D=None):
     """
     Return the contact rates for the specified model (SIS/SIR), country, pre-defined policy.
 
@@ -149,9 +149,15 @@ def get_B_policy(file_data_opt=None, country='Germany', policy='Uncontained', B
         DESCRIPTION. The default is 'Germany'.
     policy : str or (int, float), optional
         either a float, in which case assumed to be desired R0. or a str as defined.
+        or a list of Ng scales of the rows of B.
+        or a dict {'R0': desired R0, 'weights': cost of each group (optional)}, for the
+        scales with the least disruption, see analysis.R0.target_R0_scales (needs D).
         the default is 'Uncontained'.
     B : numpy 2d array
         The B matrix if not to be read from file.
+    D : numpy 2d array, optional
+        matrix of recovery and death rates, Gamma + Mu. If given, a float policy scales B
+        to exactly the desired R0, instead of assuming R0 of B is 2.95. The default is None.
 
     Returns
     -------
@@ -167,10 +173,44 @@ def get_B_policy(file_data_opt=None, country='Germany', policy='Uncontained', B
         print(file_data_opt)
         B_opt_normalised = load_mat(file_data_opt, varname)
         B = Bopt_normalised_2_country(B_opt_normalised, get_pop_distr(country))
+    list_scales = get_policy_scales(B, policy, D)
+    B_policy = scale_B_opt(B, list_scales)
+    return B_policy
+
+
+def get_policy_scales(B, policy='Uncontained', D=None):
+    """
+    Return the scales of the rows of B for a policy, B_policy = diag(scales) @ B.
+
+    Parameters
+    ----------
+    B : numpy 2d array
+        matrix of contact rates (uncontained).
+    policy : str or (int, float), optional
+        policy, as in get_B_policy. The default is 'Uncontained'.
+    D : numpy 2d array, optional
+        matrix of recovery and death rates, Gamma + Mu, as in get_B_policy.
+        The default is None.
+
+    Returns
+    -------
+    list_scales : list of float
+        scales of the rows of B, or a single scale for all of them.
+
+    """
     # these policies are defined intuitively,
     # chnage as you wish
     R0_used_in_opt  = 2.95
-    if isinstance(policy, (int, float)):
+    if isinstance(policy, dict):
+        from mitepid.analysis.R0 import target_R0_scales
+        if D is None:
+            raise ValueError('Policies with a target R0 need D.')
+        list_scales = list(target_R0_scales(B, D, policy['R0'], policy.get('weights')))
+    elif isinstance(policy, (list, tuple)):
+        list_scales = list(policy)
+    elif isinstance(policy, (int, float)):
+        if D is not None:
+            R0_used_in_opt = spectral_radius(B, D)
 
         w_kids = policy / R0_used_in_opt;
         w_adults = policy / R0_used_in_opt;
@@ -244,8 +284,7 @@ def get_B_policy(file_data_opt=None, country='Germany', policy='Uncontained', B
         elif not policy == 'Uncontained':
             raise('Policy was not recognized.')
 
-    B_policy = scale_B_opt(B, list_scales)
-    return B_policy
+    return list_scales
 
 def get_pop_distr(country):
     """
@@ -281,6 +320,33 @@ def get_pop_distr(country):
     list_out = dict_pop[country]
     return list_out
 
+
+def get_pop_weights(country):
+    """
+    Return the population distribution of a country as fractions, cached.
+
+    Parameters
+    ----------
+    country : str
+        name of the country.
+
+    Returns
+    -------
+    weights : numpy array
+        get_pop_distr(country) / 100, read-only and shared between calls.
+
+    """
+    import numpy as np
+
+    if country not in dict_pop_weights:
+        weights = np.array(get_pop_distr(country), dtype=float) / 100
+        weights.setflags(write=False)
+        dict_pop_weights[country] = weights
+    return dict_pop_weights[country]
+
+
+dict_pop_weights = {}
+
 def Bopt_normalised_2_country(Bopt, list_age_distr):
     """
     Convert the general optimised B matrix to one adapted for a certain country.
@@ -306,4 +372,119 @@ def Bopt_normalised_2_country(Bopt, list_age_distr):
         for cc2 in np.arange(Ng):
             B_factors[cc1, cc2] = list_age_distr[cc2]/list_age_distr[cc1]
     Bopt_country = np.multiply(Bopt, B_factors)
-    return Bopt_country
\ No newline at end of file
+    return Bopt_country
+
+
+# %% cache of policy contact matrices and their R0
+# get_B_policy and the spectral radius are recalculated for every segment of every simulation,
+# although the same (B, policy) pairs recur all the time. They are kept in a bounded LRU cache.
+B_policy_cache_size = 1024
+dict_B_policy_cache = {}
+
+
+def get_B_policy_R0(B, D, country='Germany', policy='Uncontained', return_scales=False):
+    """
+    Return the contact rates of a policy and its R0, using a bounded LRU cache.
+
+    The cache is keyed on a hash of B and D, the country and the policy. The returned matrix
+    is shared between calls with the same key, hence it is read-only.
+
+    Parameters
+    ----------
+    B : numpy 2d array
+        matrix of contact rates (uncontained).
+    D : numpy 2d array
+        matrix of recovery and death rates, Gamma + Mu.
+    country : str, optional
+        the country. The default is 'Germany'.
+    policy : str or (int, float), optional
+        policy, as in get_B_policy. The default is 'Uncontained'.
+    return_scales : bool, optional
+        also return the scales of the rows of B of the policy. The default is False.
+
+    Returns
+    -------
+    B_policy : numpy 2d array
+        The matrix of contact rates of the policy (read-only).
+    R0 : float
+        spectral radius of inv(D) * B_policy.
+    scales : numpy array
+        scales of the rows of B, (Ng), see get_policy_scales (read-only). Only if
+        return_scales is True.
+
+    """
+    import numpy as np
+    from mitepid.utils import scale_B_opt
+
+    B = np.asarray(B, dtype=float)
+    D = np.asarray(D, dtype=float)
+    key = (hash_arrays(B, D), country, repr(policy))
+    try:
+        B_policy, R0, scales = dict_B_policy_cache.pop(key)
+    except KeyError:
+        # as in get_B_policy, keeping the scales, e.g. for the sensitivities to them
+        scales = np.array(np.broadcast_to(np.asarray(get_policy_scales(B, policy, D),
+                                                     dtype=float), (B.shape[0],)))
+        scales.setflags(write=False)
+        B_policy = np.array(scale_B_opt(B, list(scales)), dtype=float)
+        B_policy.setflags(write=False)
+        R0 = spectral_radius(B_policy, D)
+        if len(dict_B_policy_cache) >= B_policy_cache_size:
+            # dicts keep insertion order, the first item is the least recently used
+            dict_B_policy_cache.pop(next(iter(dict_B_policy_cache)))
+    dict_B_policy_cache[key] = (B_policy, R0, scales)
+    if return_scales:
+        return B_policy, R0, scales
+    return B_policy, R0
+
+
+def hash_arrays(*list_arrays):
+    """Return a hash of the shapes and contents of numpy arrays, used as a cache key."""
+    import hashlib
+    import numpy as np
+
+    hash_out = hashlib.blake2b(digest_size=16)
+    for arr in list_arrays:
+        arr = np.asarray(arr, dtype=float)
+        hash_out.update(str(arr.shape).encode())
+        hash_out.update(np.ascontiguousarray(arr).tobytes())
+    return hash_out.digest()
+
+
+def clear_B_policy_cache():
+    """Empty the cache used by get_B_policy_R0."""
+    dict_B_policy_cache.clear()
+
+
+def spectral_radius(B_policy, D):
+    """
+    Return the spectral radius of inv(D) * B_policy, i.e. R0 of the policy.
+
+    For a diagonal D, the eigenvalues of the row-scaled matrix B_policy / diag(D) are used,
+    without the inverse. On the 9 x 9 matrices of the package, this is cheaper than iterating
+    on it in Python, e.g. with the power method. For batches of policies, see
+    analysis.R0.R0_engine.
+
+    Parameters
+    ----------
+    B_policy : numpy 2d array
+        matrix of contact rates.
+    D : numpy 2d array
+        matrix of recovery and death rates, Gamma + Mu.
+
+    Returns
+    -------
+    rho : float
+        spectral radius.
+
+    """
+    import numpy as np
+    from numpy.linalg import eigvals, solve
+
+    d = np.diag(D)
+    if np.count_nonzero(D) == np.count_nonzero(d):
+        # D is diagonal
+        K = B_policy / d[:, None]
+    else:
+        K = solve(D, B_policy)
+    return float(np.max(np.abs(eigvals(K))))
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Reducers compute summary statistics of a solution while it is being calculated.
+
+epid_sim and epid_ensemble pass each newly calculated piece of the solution to their reducers,
+so with summary_only=True the trajectories do not need to be kept:
+
+    dict_reducers = {'peak_I': peak('I'), 'final_R': final('R'),
+                     'ICU': integral('I', weights=w_ICU)}
+    epid_obj = epid_sim(..., reducers=dict_reducers, summary_only=True)
+    epid_obj.summary['peak_I']['t']
+
+A reducer is any object with the methods of the base class reducer:
+    reset(): called before the first piece.
+    update(t, sol_dict, sol_agg_dict): called for each piece, in time order.
+        t is a numpy array (N_time), sol_dict[key] is (... x N_time x Ng) and sol_agg_dict[key]
+        is (... x N_time), where leading dimensions are e.g. the members of an ensemble.
+    result(): the summary so far.
+
+@author: MiTepid contributors
+"""
+
+
+class reducer:
+    """
+    Base class of reducers.
+
+    Subclasses implement update_values, which gets the values selected by compartment,
+    per_group and weights as an array (... x N_time x K), with K = Ng if per_group else 1.
+    """
+
+    def __init__(self, compartment='I', per_group=False, weights=None):
+        """
+        Initialise the reducer.
+
+        Parameters
+        ----------
+        compartment : str, optional
+            'I', 'R', 'E', etc. The default is 'I'.
+        per_group : bool, optional
+            reduce each group separately, instead of the aggregate of the whole population.
+            The default is False.
+        weights : numpy array, optional
+            weights of each group, (Ng), used instead of the population distribution to
+            aggregate the groups, e.g. fractions of each group needing an ICU bed times the
+            population distribution. The default is None.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.compartment = compartment
+        self.per_group = per_group
+        self.weights = weights
+        self.reset()
+
+    def reset(self, ):
+        """Discard the summary so far."""
+
+    def values(self, sol_dict, sol_agg_dict):
+        """Return the values to reduce, (... x N_time x K)."""
+        import numpy as np
+
+        if self.weights is not None:
+            return (sol_dict[self.compartment] @ np.asarray(self.weights, dtype=float))[..., None]
+        if self.per_group:
+            return sol_dict[self.compartment]
+        return sol_agg_dict[self.compartment][..., None]
+
+    def update(self, t, sol_dict, sol_agg_dict):
+        """Update the summary with a new piece of the solution."""
+        self.update_values(t, self.values(sol_dict, sol_agg_dict))
+
+    def update_values(self, t, x):
+        """Update the summary with new values, (... x N_time x K)."""
+        raise NotImplementedError
+
+    def result(self, ):
+        """Return the summary so far."""
+        raise NotImplementedError
+
+    def _squeeze(self, x):
+        """Drop the last axis if there is only one value per time point."""
+        if self.per_group:
+            return x
+        return x[..., 0]
+
+
+class peak(reducer):
+    """Maximum value and the time it is reached."""
+
+    def reset(self, ):
+        """Discard the summary so far."""
+        self.value = None
+        self.t = None
+
+    def update_values(self, t, x):
+        """Update the maximum with new values."""
+        import numpy as np
+
+        idx = np.argmax(x, axis=-2)
+        value = np.take_along_axis(x, idx[..., None, :], axis=-2)[..., 0, :]
+        t_value = np.asarray(t)[idx]
+        if self.value is None:
+            self.value = value
+            self.t = t_value
+            return
+        is_new = value > self.value
+        self.value = np.where(is_new, value, self.value)
+        self.t = np.where(is_new, t_value, self.t)
+
+    def result(self, ):
+        """
+        Return the peak so far.
+
+        Returns
+        -------
+        dict_out : dict
+            'value': maximum value, 't': time of the maximum.
+
+        """
+        if self.value is None:
+            return {'value': None, 't': None}
+        return {'value': self._squeeze(self.value), 't': self._squeeze(self.t)}
+
+
+class final(reducer):
+    """Last value."""
+
+    def reset(self, ):
+        """Discard the summary so far."""
+        self.value = None
+
+    def update_values(self, t, x):
+        """Keep the last value."""
+        self.value = x[..., -1, :]
+
+    def result(self, ):
+        """Return the last value so far."""
+        if self.value is None:
+            return None
+        return self._squeeze(self.value)
+
+
+class cumulative_infections(final):
+    """
+    Last value of the sum of the infected, recovered and exposed compartments.
+
+    This is the fraction of the population which has been infected so far, as long as there
+    are no births and deaths (Mu is zero). It is not defined for SIS models.
+    """
+
+    def __init__(self, per_group=False, weights=None):
+        super().__init__(compartment=None, per_group=per_group, weights=weights)
+
+    def values(self, sol_dict, sol_agg_dict):
+        """Return the sum of the compartments I, R and E, (... x N_time x K)."""
+        list_values = []
+        for key in ['I', 'R', 'E']:
+            if key in sol_dict:
+                self.compartment = key
+                list_values.append(super().values(sol_dict, sol_agg_dict))
+        self.compartment = None
+        return sum(list_values)
+
+
+class integral(reducer):
+    """Time integral with the trapezoidal rule, e.g. the load on ICU beds."""
+
+    def reset(self, ):
+        """Discard the summary so far."""
+        self.value = None
+        self.t_last = None
+        self.x_last = None
+
+    def update_values(self, t, x):
+        """Add the integral over the new values."""
+        import numpy as np
+
+        t = np.asarray(t, dtype=float)
+        if self.x_last is not None:
+            t = np.concatenate(([self.t_last], t))
+            x = np.concatenate((self.x_last[..., None, :], x), axis=-2)
+        dt = np.diff(t)[:, None]
+        value = np.sum(0.5 * dt * (x[..., 1:, :] + x[..., :-1, :]), axis=-2)
+        self.value = value if self.value is None else self.value + value
+        self.t_last = t[-1]
+        self.x_last = x[..., -1, :]
+
+    def result(self, ):
+        """Return the integral so far."""
+        if self.value is None:
+            return None
+        return self._squeeze(self.value)
+
+
+class time_above(reducer):
+    """Time spent at or above a threshold, e.g. days with more ICU patients than beds."""
+
+    def __init__(self, compartment='I', threshold=0.01, per_group=False, weights=None):
+        """
+        Initialise the reducer.
+
+        Parameters
+        ----------
+        compartment : str, optional
+            'I', 'R', 'E', etc. The default is 'I'.
+        threshold : float, optional
+            the threshold. The default is 0.01.
+        per_group : bool, optional
+            see reducer. The default is False.
+        weights : numpy array, optional
+            see reducer. The default is None.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.threshold = threshold
+        super().__init__(compartment=compartment, per_group=per_group, weights=weights)
+
+    def reset(self, ):
+        """Discard the summary so far."""
+        self.value = None
+        self.t_last = None
+        self.x_last = None
+
+    def update_values(self, t, x):
+        """Add the time above the threshold, linearly interpolated between time points."""
+        import numpy as np
+
+        t = np.asarray(t, dtype=float)
+        if self.x_last is not None:
+            t = np.concatenate(([self.t_last], t))
+            x = np.concatenate((self.x_last[..., None, :], x), axis=-2)
+        x = x - self.threshold
+        x0 = x[..., :-1, :]
+        x1 = x[..., 1:, :]
+        # fraction of each interval above the threshold
+        with np.errstate(divide='ignore', invalid='ignore'):
+            frac = np.where(x0 >= 0, np.where(x1 >= 0, 1., x0 / (x0 - x1)),
+                            np.where(x1 >= 0, x1 / (x1 - x0), 0.))
+        value = np.sum(frac * np.diff(t)[:, None], axis=-2)
+        self.value = value if self.value is None else self.value + value
+        self.t_last = t[-1]
+        self.x_last = x[..., -1, :] + self.threshold
+
+    def result(self, ):
+        """Return the time above the threshold so far."""
+        if self.value is None:
+            return None
+        return self._squeeze(self.value)
+
+
+class threshold_crossing(reducer):
+    """First time a threshold is crossed, linearly interpolated between time points."""
+
+    def __init__(self, compartment='I', threshold=0.01, direction='up', per_group=False,
+                 weights=None):
+        """
+        Initialise the reducer.
+
+        Parameters
+        ----------
+        compartment : str, optional
+            'I', 'R', 'E', etc. The default is 'I'.
+        threshold : float, optional
+            the threshold. The default is 0.01.
+        direction : str, optional
+            'up' for the first time the value reaches the threshold from below, 'down' for
+            the first time it falls to the threshold from above. The default is 'up'.
+        per_group : bool, optional
+            see reducer. The default is False.
+        weights : numpy array, optional
+            see reducer. The default is None.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.threshold = threshold
+        self.direction = direction
+        super().__init__(compartment=compartment, per_group=per_group, weights=weights)
+
+    def reset(self, ):
+        """Discard the summary so far."""
+        self.t_cross = None
+        self.t_last = None
+        self.x_last = None
+
+    def update_values(self, t, x):
+        """Look for the first crossing in the new values."""
+        import numpy as np
+
+        t = np.asarray(t, dtype=float)
+        if self.direction == 'down':
+            x = -x
+            threshold = -self.threshold
+        else:
+            threshold = self.threshold
+        if self.t_cross is None:
+            self.t_cross = np.full(x.shape[:-2] + x.shape[-1:], np.nan)
+            # already above the threshold at the start
+            self.t_cross[x[..., 0, :] >= threshold] = t[0]
+        if self.x_last is not None:
+            t = np.concatenate(([self.t_last], t))
+            x = np.concatenate((self.x_last[..., None, :], x), axis=-2)
+        self.t_last = t[-1]
+        self.x_last = x[..., -1, :]
+        if len(t) < 2:
+            return
+        is_cross = (x[..., 1:, :] >= threshold) & (x[..., :-1, :] < threshold)
+        has_cross = np.any(is_cross, axis=-2) & np.isnan(self.t_cross)
+        if not np.any(has_cross):
+            return
+        idx = np.argmax(is_cross, axis=-2)
+        x0 = np.take_along_axis(x, idx[..., None, :], axis=-2)[..., 0, :]
+        x1 = np.take_along_axis(x, idx[..., None, :] + 1, axis=-2)[..., 0, :]
+        t0 = t[idx]
+        t1 = t[idx + 1]
+        # x1 == x0 only where there is no crossing
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t_cross = t0 + (threshold - x0) / (x1 - x0) * (t1 - t0)
+        self.t_cross = np.where(has_cross, t_cross, self.t_cross)
+
+    def result(self, ):
+        """Return the time of the first crossing, nan if it has not been crossed."""
+        if self.t_cross is None:
+            return None
+        return self._squeeze(self.t_cross)
@@ -0,0 +1,521 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+A compressed, columnar store for the results of many scenarios.
+
+The store is a zip file. Each column of each scenario is a separate compressed .npy member:
+
+    scenarios/000012/t.npy
+    scenarios/000012/sol/I.npy, scenarios/000012/sol/R.npy, ...
+    scenarios/000012/sol_agg/I.npy, ...
+    scenarios/000012/params/B.npy, ... (array parameters)
+    scenarios/000012/params.json        (other parameters)
+    scenarios/000012/policy_info.json   (list_policy_info)
+    scenarios/000012/precision.json     (only with dtype, see below)
+
+With chunk_rows, the columns along time (t, sol and sol_agg) are split into chunks of that
+many rows instead, one member each, e.g. scenarios/000012/sol/I.000003.npy holds rows
+3*chunk_rows to 4*chunk_rows - 1, and chunks.json records chunk_rows and the number of rows of
+each chunked column.
+
+Scenarios can be appended to an existing store, and only the members which are asked for are
+read back, e.g. the aggregate I of scenarios 100 to 200, or only its first 1000 rows:
+
+    with results_store(file_store) as store:
+        list_I = store.read_column('sol_agg/I', scenarios=range(100, 201))
+        list_I_start = store.read_column('sol_agg/I', scenarios=range(100, 201),
+                                         rows=slice(0, 1000))
+
+With dtype, solution columns are stored with reduced precision: cast to a float type such as
+float32, or quantized to an unsigned integer type such as uint16 (fixed point between the
+minimum and maximum of each group). They are read back as float64. The rounding error against
+the float64 input is recorded for each column, see error_report.
+
+@author: MiTepid contributors
+"""
+
+# epid_sim attributes stored as parameters of each scenario
+list_param_names = ['model_type', 'country', 'x0', 'B', 'Gamma', 'Mu', 'Sigma', 't_end',
+                    't_step', 'output_dt', 'rtol', 'atol', 'dtype', 'policy_list',
+                    'policy_switch_times', 'xternal_inputs', 'integrator', 'jac', 'events',
+                    'steady_tol', 'steady_tol_I']
+
+
+class results_store:
+    """Read and write scenarios in a compressed zip file, one member per column."""
+
+    ###
+    def __init__(self, filename, mode='r', compress=True, dtype=None, chunk_rows=None):
+        """
+        Open the store.
+
+        Parameters
+        ----------
+        filename : pathlib.Path
+            the zip file.
+        mode : str, optional
+            'r' to read, 'w' to create a new store, 'a' to append to an existing one.
+            The default is 'r'.
+        compress : bool, optional
+            compress the members (zip deflate). The default is True.
+        dtype : numpy dtype, optional
+            data type of the solution columns written, a float type (e.g. 'float32') or an
+            unsigned integer type for fixed point (e.g. 'uint16'). The default is None, i.e.
+            as given.
+        chunk_rows : int, optional
+            number of rows per member of the columns along time written. The default is None,
+            i.e. one member per column.
+
+        Raises
+        ------
+        ValueError
+            if dtype is not a float or unsigned integer type, or chunk_rows is not positive.
+
+        Returns
+        -------
+        None.
+
+        """
+        import re
+        import zipfile
+        import numpy as np
+        from pathlib import Path
+
+        self.filename = Path(filename)
+        self.mode = mode
+        self.dtype = None if dtype is None else np.dtype(dtype)
+        if self.dtype is not None and self.dtype.kind not in 'fu':
+            raise ValueError('dtype should be float or uint.')
+        if chunk_rows is not None and chunk_rows <= 0:
+            raise ValueError('chunk_rows should be positive.')
+        self.chunk_rows = chunk_rows
+        self.dict_precision = {}  # precision.json of each scenario, read on demand
+        self.dict_chunks = {}  # chunks.json of each scenario, read on demand
+        compression = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+        self.zip_file = zipfile.ZipFile(self.filename, mode=mode, compression=compression)
+        # columns (.npy members) of each scenario
+        self.dict_columns = {}
+        for name in self.zip_file.namelist():
+            match = re.fullmatch(r'scenarios/(\d+)/(.+?)(\.\d{6})?\.(npy|json)', name)
+            if match:
+                list_columns = self.dict_columns.setdefault(int(match.group(1)), [])
+                if match.group(4) == 'npy' and match.group(2) not in list_columns:
+                    list_columns.append(match.group(2))
+        self.list_ids = sorted(self.dict_columns)
+
+    def __enter__(self, ):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self, ):
+        return len(self.list_ids)
+
+    def close(self, ):
+        """Close the zip file."""
+        self.zip_file.close()
+
+    # %% write
+    def append(self, epid_obj, params=None):
+        """
+        Append the results of an epid_sim object as a new scenario.
+
+        Parameters
+        ----------
+        epid_obj : epid_sim
+            the simulation. Its solution is calculated if it is lazy.
+        params : dict, optional
+            extra parameters to store, e.g. labels of a sweep. The default is None.
+
+        Returns
+        -------
+        idx : int
+            index of the new scenario.
+
+        """
+        dict_params = {name: getattr(epid_obj, name) for name in list_param_names}
+        dict_params['events'] = {name: vars(item) for name, item in epid_obj.events.items()}
+        if params is not None:
+            dict_params.update(params)
+        return self.append_arrays(t=epid_obj.t[:epid_obj.sol_dict['I'].shape[0]],
+                                  sol_dict=epid_obj.sol_dict,
+                                  sol_agg_dict=epid_obj.sol_agg_dict,
+                                  list_policy_info=epid_obj.list_policy_info,
+                                  params=dict_params)
+
+    def append_result(self, result, params=None):
+        """
+        Append a result of runner.run_spec as a new scenario.
+
+        Parameters
+        ----------
+        result : dict
+            output of run_spec.
+        params : dict, optional
+            parameters to store, e.g. the scenario specification. The default is None.
+
+        Returns
+        -------
+        idx : int
+            index of the new scenario.
+
+        """
+        from mitepid.runner import result_to_dicts
+
+        sol_dict, sol_agg_dict = result_to_dicts(result)
+        return self.append_arrays(t=result['t'][:result['sol'].shape[0]],
+                                  sol_dict=sol_dict,
+                                  sol_agg_dict=sol_agg_dict,
+                                  list_policy_info=result['list_policy_info'],
+                                  params=params)
+
+    def append_arrays(self, t, sol_dict, sol_agg_dict, list_policy_info=[], params=None):
+        """
+        Append a new scenario.
+
+        Parameters
+        ----------
+        t : numpy array
+            time array.
+        sol_dict : dict of numpy arrays
+            solution for each compartment, e.g. epid_sim.sol_dict.
+        sol_agg_dict : dict of numpy arrays
+            aggregate solution for each compartment, e.g. epid_sim.sol_agg_dict.
+        list_policy_info : list of (float, str, float), optional
+            switching time, policy and R0 of each segment. The default is [].
+        params : dict, optional
+            parameters of the scenario. numpy arrays are stored as .npy members, everything
+            else in params.json (where keys of dicts, e.g. times in xternal_inputs, become
+            strings). The default is None.
+
+        Raises
+        ------
+        RuntimeError
+            if the store is not open for writing.
+
+        Returns
+        -------
+        idx : int
+            index of the new scenario.
+
+        """
+        import numpy as np
+
+        if self.mode not in ['w', 'a']:
+            raise RuntimeError('The store is not open for writing.')
+        idx = self.list_ids[-1] + 1 if self.list_ids else 0
+        self.dict_columns[idx] = []
+        if self.chunk_rows is not None:
+            self.dict_chunks[idx] = {'chunk_rows': self.chunk_rows, 'rows': {}}
+        self._write_array(idx, 't', t, along_time=True)
+        dict_precision = {}
+        for key, value in sol_dict.items():
+            self._write_solution(idx, 'sol/' + key, value, dict_precision)
+        for key, value in sol_agg_dict.items():
+            self._write_solution(idx, 'sol_agg/' + key, value, dict_precision)
+        if self.chunk_rows is not None:
+            self._write_json(idx, 'chunks', self.dict_chunks[idx])
+        if self.dtype is not None:
+            self._write_json(idx, 'precision', dict_precision)
+            self.dict_precision[idx] = dict_precision
+        self._write_json(idx, 'policy_info',
+                         [[t_switch, policy, rho] for (t_switch, policy, rho) in list_policy_info])
+        dict_json = {}
+        for key, value in (params or {}).items():
+            if isinstance(value, np.ndarray):
+                self._write_array(idx, 'params/' + key, value)
+            else:
+                dict_json[key] = value
+        self._write_json(idx, 'params', dict_json)
+        self.list_ids.append(idx)
+        return idx
+
+    def _member(self, idx, column, ext):
+        return 'scenarios/%06d/%s.%s' % (idx, column, ext)
+
+    def _write_array(self, idx, column, value, along_time=False):
+        import numpy as np
+
+        value = np.asanyarray(value)
+        if along_time and self.chunk_rows is not None:
+            list_members = [('%s.%06d' % (column, idx_chunk),
+                             value[idx_chunk*self.chunk_rows:(idx_chunk+1)*self.chunk_rows])
+                            for idx_chunk in range(max(-(-len(value) // self.chunk_rows), 1))]
+            self.dict_chunks[idx]['rows'][column] = len(value)
+        else:
+            list_members = [(column, value)]
+        for member, value_member in list_members:
+            with self.zip_file.open(self._member(idx, member, 'npy'), 'w',
+                                    force_zip64=True) as file_member:
+                np.lib.format.write_array(file_member, value_member, allow_pickle=False)
+        self.dict_columns[idx].append(column)
+
+    def _write_solution(self, idx, column, value, dict_precision):
+        """Write a solution column with the dtype of the store, and record its error."""
+        import numpy as np
+
+        if self.dtype is None:
+            self._write_array(idx, column, value, along_time=True)
+            return
+        value = np.asarray(value, dtype=float)
+        info = {'dtype': self.dtype.str}
+        if self.dtype.kind == 'u':
+            # fixed point between the minimum and maximum of each group
+            q_max = np.iinfo(self.dtype).max
+            offset = np.min(value, axis=0) if value.size else np.zeros(value.shape[1:])
+            scale = (np.max(value, axis=0) - offset) / q_max if value.size else offset
+            scale = np.where(scale > 0, scale, 1.0)
+            value_stored = np.rint((value - offset) / scale).astype(self.dtype)
+            value_read = offset + value_stored * scale
+            info['offset'] = offset.tolist()
+            info['scale'] = scale.tolist()
+        else:
+            value_stored = value.astype(self.dtype)
+            value_read = value_stored.astype(float)
+        error = np.abs(value_read - value)
+        max_abs = np.max(np.abs(value)) if value.size else 0.0
+        info['max_abs_error'] = float(np.max(error)) if value.size else 0.0
+        info['max_rel_error'] = info['max_abs_error'] / max_abs if max_abs > 0 else 0.0
+        dict_precision[column] = info
+        self._write_array(idx, column, value_stored, along_time=True)
+
+    def _write_json(self, idx, column, value):
+        import json
+
+        self.zip_file.writestr(self._member(idx, column, 'json'),
+                               json.dumps(value, default=_to_json))
+
+    # %% read
+    def columns(self, idx=None):
+        """
+        Return the columns stored for a scenario.
+
+        Parameters
+        ----------
+        idx : int, optional
+            the scenario. The default is None, i.e. the first one.
+
+        Returns
+        -------
+        list_columns : list of str
+            e.g. ['t', 'sol/I', 'sol_agg/I', 'params/B'].
+
+        """
+        if idx is None:
+            idx = self.list_ids[0]
+        return list(self.dict_columns[idx])
+
+    def read_column(self, column, scenarios=None, stack=False, rows=None):
+        """
+        Read one column of some scenarios. Other members, and for chunked columns other
+        chunks, are not decompressed.
+
+        Parameters
+        ----------
+        column : str
+            e.g. 't', 'sol/I', 'sol_agg/R' or 'params/B'.
+        scenarios : iterable of int, optional
+            indices of the scenarios. The default is None, i.e. all.
+        stack : bool, optional
+            stack the arrays along a new first axis (they must have the same shape).
+            The default is False.
+        rows : slice, optional
+            rows to read, with a step of 1 or None. The default is None, i.e. all.
+
+        Raises
+        ------
+        ValueError
+            if rows has another step.
+
+        Returns
+        -------
+        list_arrays : list of numpy arrays, or numpy array if stack
+            the column of each scenario.
+
+        """
+        import numpy as np
+
+        if rows is not None and rows.step not in [None, 1]:
+            raise ValueError('rows should be a slice with step 1.')
+        list_arrays = []
+        for idx in self._scenarios(scenarios):
+            value = self._read_rows(idx, column, rows)
+            info = self._precision(idx).get(column)
+            if info is not None:
+                if 'scale' in info:
+                    value = np.array(info['offset']) + value * np.array(info['scale'])
+                else:
+                    value = value.astype(float)
+            list_arrays.append(value)
+        if stack:
+            return np.stack(list_arrays)
+        return list_arrays
+
+    def read_params(self, scenarios=None):
+        """
+        Read the parameters of some scenarios.
+
+        Parameters
+        ----------
+        scenarios : iterable of int, optional
+            indices of the scenarios. The default is None, i.e. all.
+
+        Returns
+        -------
+        list_params : list of dict
+            parameters of each scenario, array parameters included.
+
+        """
+        list_params = []
+        for idx in self._scenarios(scenarios):
+            params = self._read_json(idx, 'params')
+            for column in self.columns(idx):
+                if column.startswith('params/'):
+                    params[column[len('params/'):]] = self.read_column(column, [idx])[0]
+            list_params.append(params)
+        return list_params
+
+    def read_policy_info(self, scenarios=None):
+        """
+        Read list_policy_info of some scenarios.
+
+        Parameters
+        ----------
+        scenarios : iterable of int, optional
+            indices of the scenarios. The default is None, i.e. all.
+
+        Returns
+        -------
+        list_list_policy_info : list of lists of (float, str, float)
+            switching time, policy and R0 of each segment of each scenario.
+
+        """
+        return [[tuple(info) for info in self._read_json(idx, 'policy_info')]
+                for idx in self._scenarios(scenarios)]
+
+    def read(self, idx):
+        """
+        Read all columns of one scenario.
+
+        Parameters
+        ----------
+        idx : int
+            the scenario.
+
+        Returns
+        -------
+        t : numpy array
+            time array.
+        sol_dict : dict of numpy arrays
+            solution for each compartment.
+        sol_agg_dict : dict of numpy arrays
+            aggregate solution for each compartment.
+        list_policy_info : list of (float, str, float)
+            switching time, policy and R0 of each segment.
+        params : dict
+            parameters of the scenario.
+
+        """
+        sol_dict = {}
+        sol_agg_dict = {}
+        for column in self.columns(idx):
+            group, _, key = column.partition('/')
+            if group == 'sol':
+                sol_dict[key] = self.read_column(column, [idx])[0]
+            elif group == 'sol_agg':
+                sol_agg_dict[key] = self.read_column(column, [idx])[0]
+        t = self.read_column('t', [idx])[0]
+        return (t, sol_dict, sol_agg_dict, self.read_policy_info([idx])[0],
+                self.read_params([idx])[0])
+
+    def error_report(self, scenarios=None):
+        """
+        Rounding error of the solution columns stored with reduced precision, see dtype.
+
+        Parameters
+        ----------
+        scenarios : iterable of int, optional
+            indices of the scenarios. The default is None, i.e. all.
+
+        Returns
+        -------
+        list_reports : list of dict
+            for each scenario, keys are columns (e.g. 'sol/I'), values are dict with 'dtype',
+            'max_abs_error' and 'max_rel_error' (relative to the largest absolute value).
+            Empty for scenarios stored as given.
+
+        """
+        list_reports = []
+        for idx in self._scenarios(scenarios):
+            list_reports.append({column: {key: info[key] for key in ['dtype', 'max_abs_error',
+                                                                     'max_rel_error']}
+                                 for column, info in self._precision(idx).items()})
+        return list_reports
+
+    def _read_rows(self, idx, column, rows):
+        """Read rows of a column, only the chunks which overlap them if it is chunked."""
+        import numpy as np
+
+        dict_chunks = self._chunks(idx)
+        if dict_chunks is None or column not in dict_chunks['rows']:
+            value = self._read_member(idx, column)
+            return value if rows is None else value[rows]
+        chunk_rows = dict_chunks['chunk_rows']
+        N_rows = dict_chunks['rows'][column]
+        N_chunks = max(-(-N_rows // chunk_rows), 1)
+        start, stop, _ = (rows or slice(None)).indices(N_rows)
+        idx_first = min(start // chunk_rows, N_chunks - 1)
+        list_values = []
+        for idx_chunk in range(idx_first, max(-(-stop // chunk_rows), idx_first + 1)):
+            value = self._read_member(idx, '%s.%06d' % (column, idx_chunk))
+            offset = idx_chunk * chunk_rows
+            list_values.append(value[max(start - offset, 0):max(stop - offset, 0)])
+        return np.concatenate(list_values)
+
+    def _read_member(self, idx, column):
+        import numpy as np
+
+        with self.zip_file.open(self._member(idx, column, 'npy')) as file_member:
+            return np.lib.format.read_array(file_member, allow_pickle=False)
+
+    def _chunks(self, idx):
+        if idx not in self.dict_chunks:
+            try:
+                self.zip_file.getinfo(self._member(idx, 'chunks', 'json'))
+                self.dict_chunks[idx] = self._read_json(idx, 'chunks')
+            except KeyError:
+                self.dict_chunks[idx] = None
+        return self.dict_chunks[idx]
+
+    def _precision(self, idx):
+        if idx not in self.dict_precision:
+            try:
+                self.zip_file.getinfo(self._member(idx, 'precision', 'json'))
+                self.dict_precision[idx] = self._read_json(idx, 'precision')
+            except KeyError:
+                self.dict_precision[idx] = {}
+        return self.dict_precision[idx]
+
+    def _scenarios(self, scenarios):
+        if scenarios is None:
+            return list(self.list_ids)
+        return [int(idx) for idx in scenarios]
+
+    def _read_json(self, idx, column):
+        import json
+
+        return json.loads(self.zip_file.read(self._member(idx, column, 'json')))
+
+
+def _to_json(value):
+    """Convert numpy types for json, used as json.dumps(default=...)."""
+    import numpy as np
+
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, set):
+        return sorted(value)
+    return str(value)
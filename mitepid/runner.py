@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Run many epid_sim scenarios in parallel on a pool of processes.
+
+A scenario is a dictionary with the same fields as the arguments of epid_sim. Arguments which
+are only needed for plots (dir_save_plots_main, str_policy, group_labels) can be left out.
+
+@author: MiTepid contributors
+"""
+
+# default values for the arguments of epid_sim which are only used for plots
+dict_spec_defaults = {'dir_save_plots_main': '.',
+                      'str_policy': '',
+                      'group_labels': None,
+                      'verbose': False,
+                      }
+
+
+def run_scenarios(list_specs, max_workers=None, timeout=None, reducers=None):
+    """
+    Run a list of scenarios on a ProcessPoolExecutor.
+
+    Results come back in the same order as list_specs. Each worker returns compact numpy arrays
+    instead of the whole epid_sim object, see run_spec.
+
+    With a timeout, each scenario runs in its own process instead, which is terminated if the
+    scenario does not finish in time. This also stops scenarios stuck in compiled solver code.
+
+    Parameters
+    ----------
+    list_specs : list of dict
+        scenario specifications, keyword arguments of epid_sim.
+    max_workers : int, optional
+        number of worker processes. The default is None, i.e. number of CPUs.
+    timeout : float, optional
+        time limit for each scenario, in seconds, from its start. The default is None, i.e.
+        no limit.
+    reducers : dict of reducers, optional
+        if given, only these summary statistics are calculated and returned, without the
+        trajectories, see mitepid.reducers. The default is None.
+
+    Returns
+    -------
+    list_results : list of dict or Exception
+        result of each scenario, or the exception it raised (e.g. TimeoutError).
+
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    if timeout is not None:
+        return run_scenarios_timeout(list_specs, max_workers, timeout, reducers)
+    list_results = []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        list_futures = [executor.submit(run_spec, spec, reducers) for spec in list_specs]
+        for future in list_futures:
+            try:
+                list_results.append(future.result())
+            except Exception as err:
+                list_results.append(err)
+    return list_results
+
+
+def run_scenarios_timeout(list_specs, max_workers, timeout, reducers=None):
+    """
+    Run a list of scenarios, each in its own process, terminated after timeout seconds.
+
+    Parameters are as in run_scenarios.
+
+    Returns
+    -------
+    list_results : list of dict or Exception
+        result of each scenario, or the exception it raised (e.g. TimeoutError).
+
+    """
+    import os
+    import time
+    import multiprocessing
+    from multiprocessing.connection import wait
+
+    N_workers = os.cpu_count() if max_workers is None else max_workers
+    list_results = [None] * len(list_specs)
+    dict_running = {}  # index of the scenario: (process, connection, start time)
+    idx_next = 0
+    while idx_next < len(list_specs) or dict_running:
+        while idx_next < len(list_specs) and len(dict_running) < N_workers:
+            conn_recv, conn_send = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(target=_run_spec_to_pipe,
+                                              args=(list_specs[idx_next], reducers, conn_send),
+                                              daemon=True)
+            process.start()
+            conn_send.close()
+            dict_running[idx_next] = (process, conn_recv, time.monotonic())
+            idx_next = idx_next + 1
+        t_next = min(t_start for _, _, t_start in dict_running.values()) + timeout
+        list_ready = wait([conn for _, conn, _ in dict_running.values()],
+                          timeout=max(t_next - time.monotonic(), 0))
+        for idx, (process, conn, t_start) in list(dict_running.items()):
+            if conn in list_ready:
+                try:
+                    list_results[idx] = conn.recv()
+                except EOFError:
+                    list_results[idx] = RuntimeError('The process of scenario %d exited '
+                                                     'without a result.' % idx)
+            elif time.monotonic() >= t_start + timeout:
+                process.terminate()
+                list_results[idx] = TimeoutError('Scenario did not finish in ' + str(timeout)
+                                                 + ' seconds.')
+            else:
+                continue
+            process.join()
+            conn.close()
+            del dict_running[idx]
+    return list_results
+
+
+def _run_spec_to_pipe(spec, reducers, conn):
+    """Run a scenario and send its result, or the exception it raised, through conn."""
+    try:
+        result = run_spec(spec, reducers)
+    except Exception as err:
+        result = err
+    conn.send(result)
+    conn.close()
+
+
+def run_spec(spec, reducers=None):
+    """
+    Run a single scenario and return its solution as compact arrays.
+
+    The whole solution is calculated here, also for lazy specs.
+
+    Parameters
+    ----------
+    spec : dict
+        scenario specification, keyword arguments of epid_sim.
+    reducers : dict of reducers, optional
+        summary statistics to calculate instead of keeping the trajectories. The result then
+        has 'summary' (see epid_sim.summary) instead of 't', 'sol' and 'sol_agg'.
+        The default is None.
+
+    Returns
+    -------
+    result : dict
+        't': numpy array (Nt,), time of each row of sol.
+        'sol': numpy array (Nt x N_states), states of all groups and compartments.
+        'sol_agg': numpy array (Nt x N_compartments), aggregate solution.
+        'compartments': list of str, compartments in the order they appear in the states.
+        'list_policy_info': list of (time, policy, R0).
+        'list_solver_info': list of dict, solver statistics.
+
+    """
+    import numpy as np
+    from mitepid.epid_sim import epid_sim
+    from mitepid.models import get_compartments
+
+    kwargs = dict(dict_spec_defaults)
+    kwargs.update(spec)
+    if reducers is not None:
+        kwargs['reducers'] = reducers
+        kwargs['summary_only'] = True
+
+    epid_obj = epid_sim(**kwargs)
+    if epid_obj.lazy:
+        epid_obj.run()
+
+    result = {}
+    result['list_policy_info'] = [(t, policy, float(rho))
+                                  for (t, policy, rho) in epid_obj.list_policy_info]
+    result['list_solver_info'] = epid_obj.list_solver_info
+    if epid_obj.summary_only:
+        result['summary'] = epid_obj.summary
+        return result
+
+    list_compartments = get_compartments(epid_obj.model_type)
+    result['sol'] = np.concatenate([epid_obj.sol_dict[key] for key in list_compartments],
+                                   axis=1)
+    # rows of terminated runs stop early, and event switches add rows off the grid of t
+    result['t'] = np.array(epid_obj.t_sol[:len(result['sol'])])
+    result['sol_agg'] = np.concatenate([epid_obj.sol_agg_dict[key]
+                                        for key in list_compartments], axis=1)
+    result['compartments'] = list_compartments
+    return result
+
+
+def result_to_dicts(result):
+    """
+    Convert the compact arrays returned by run_spec to sol_dict and sol_agg_dict.
+
+    Parameters
+    ----------
+    result : dict
+        output of run_spec.
+
+    Returns
+    -------
+    sol_dict : dict, keys are 'I', 'R', 'E', etc, values are numpy array (Nt x Ng)
+        solution for each group and each compartment (views into result['sol']).
+    sol_agg_dict : dict, keys are 'I', 'R', 'E', etc, values are numpy array (Nt x 1)
+        aggregate solution for each compartment.
+
+    """
+    list_compartments = result['compartments']
+    Ng = result['sol'].shape[1] // len(list_compartments)
+    sol_dict = {}
+    sol_agg_dict = {}
+    for idx, key in enumerate(list_compartments):
+        sol_dict[key] = result['sol'][:, idx*Ng:(idx+1)*Ng]
+        sol_agg_dict[key] = result['sol_agg'][:, idx:idx+1]
+    return sol_dict, sol_agg_dict
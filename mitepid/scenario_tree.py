@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: MiTepid contributors
+"""
+
+
+class scenario_tree:
+    """
+    A class to simulate many policy schedules which share common histories.
+
+    Each schedule is split into segments of (switching time, policy, external input), as in
+    epid_sim. The segments of all schedules are arranged in a trie, so a history shared by
+    several schedules is integrated only once and all branches continue from its cached state.
+    """
+
+    ###
+    def __init__(self,
+                 list_policy_switch_times,
+                 list_policy_list,
+                 list_xternal_inputs=None,
+                 **kwargs_epid_sim):
+        """
+        Initilise the class. Nothing is integrated before calling run().
+
+        Parameters
+        ----------
+        list_policy_switch_times : list of lists of float
+            switching instances of each schedule.
+        list_policy_list : list of lists of str
+            policies of each schedule.
+        list_xternal_inputs : list of dict, optional
+            external inputs of each schedule. The default is None, i.e. no external input.
+        **kwargs_epid_sim :
+            other arguments of epid_sim, shared by all schedules (model_type, country, x0, B,
+            t_end, Gamma, ...). Arguments only used for plots can be left out. Events and
+            steady_tol stop single runs early, and are not supported here.
+
+        Raises
+        ------
+        ValueError
+            if events or steady_tol are given.
+
+        Returns
+        -------
+        None.
+
+        """
+        import numpy as np
+        from mitepid.epid_sim import epid_sim
+        from mitepid.runner import dict_spec_defaults
+
+        for key in ['events', 'steady_tol']:
+            if kwargs_epid_sim.get(key) is not None:
+                raise ValueError(key + ' is not supported by scenario_tree, use epid_sim or '
+                                 'run_scenarios for each schedule instead.')
+        if list_xternal_inputs is None:
+            list_xternal_inputs = [{}] * len(list_policy_list)
+        kwargs = dict(dict_spec_defaults)
+        kwargs.update(kwargs_epid_sim)
+        kwargs['lazy'] = True
+
+        # one lazy epid_sim object for each leaf of the tree
+        self.list_leaves = []
+        for policy_switch_times, policy_list, xternal_inputs in zip(list_policy_switch_times,
+                                                                     list_policy_list,
+                                                                     list_xternal_inputs):
+            self.list_leaves.append(epid_sim(policy_list=policy_list,
+                                             policy_switch_times=policy_switch_times,
+                                             xternal_inputs=xternal_inputs,
+                                             **kwargs))
+
+        # the trie. Each node is one segment, integrated from its own switching time up to
+        # the latest time any of the schedules passing through it needs.
+        self.list_nodes = []
+        self.list_paths = []
+        dict_children = {}
+        for leaf in self.list_leaves:
+            idx_parent = -1
+            path = []
+            for segment in leaf.list_segments:
+                t_switch1, t_switch2, B_step, x0_xtrnal = segment
+                key = (idx_parent, t_switch1, B_step.tobytes(),
+                       np.asarray(leaf.correct_x0(x0_xtrnal), dtype=float).tobytes())
+                if key not in dict_children:
+                    dict_children[key] = len(self.list_nodes)
+                    self.list_nodes.append({'parent': idx_parent,
+                                            'segment': segment,
+                                            't_end': t_switch2,
+                                            'leaf': leaf})
+                idx_node = dict_children[key]
+                node = self.list_nodes[idx_node]
+                node['t_end'] = max(node['t_end'], t_switch2)
+                path.append(idx_node)
+                idx_parent = idx_node
+            self.list_paths.append(path)
+
+        self.N_segments = len(self.list_nodes)
+        self.N_segments_flat = int(np.sum([len(path) for path in self.list_paths]))
+
+    # %% calculate solution
+    def run(self, ):
+        """
+        Integrate each unique segment once and fill the solution of each leaf.
+
+        Returns
+        -------
+        list_leaves : list of epid_sim
+            one epid_sim object per schedule, with the solution in sol_dict and sol_agg_dict.
+
+        """
+        import numpy as np
+
+        list_leaves = self.list_leaves
+        for node in self.list_nodes:
+            t_switch1, _, B_step, x0_xtrnal = node['segment']
+            leaf = node['leaf']
+            if node['parent'] < 0:
+                x_start = leaf.x0
+            else:
+                # as in epid_sim, start from the last state before the switching time
+                parent = self.list_nodes[node['parent']]
+                ind_last = len(np.arange(parent['t'][0], t_switch1, step=leaf.t_step)) - 1
+                x_start = parent['sol'][ind_last]
+            x0_step = np.array(x_start, dtype=float) + leaf.correct_x0(x0_xtrnal)
+            t_step = np.arange(t_switch1, node['t_end'], step=leaf.t_step)
+            node['t'] = t_step
+            node['sol'], node['solver_info'] = leaf.integrate_segment(x0_step, t_step, B_step)
+
+        # materialise the leaves
+        for leaf, path in zip(list_leaves, self.list_paths):
+            leaf.reset_sol()
+            for idx_node, segment in zip(path, leaf.list_segments):
+                t_switch1, t_switch2, B_step, _ = segment
+                node = self.list_nodes[idx_node]
+                t_seg = np.arange(t_switch1, t_switch2, step=leaf.t_step)
+                n_rows = int(np.sum(t_seg <= leaf.t_end + 1e-6*leaf.t_step))
+                if n_rows == 0:
+                    continue
+                t_out = leaf.t_out_segment(t_switch1, t_switch2)
+                leaf.write_rows(leaf.sample_segment(node['t'][:n_rows], node['sol'][:n_rows],
+                                                    t_out, B_step), t_out)
+                leaf.x_last = node['sol'][n_rows-1]
+            leaf.list_solver_info = [self.list_nodes[idx]['solver_info'] for idx in path]
+            leaf.idx_segment = len(leaf.list_segments)
+            leaf.t_last = None
+            leaf.update_sol_dict()
+        return list_leaves
@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Derivatives of the solution of epid_sim with respect to the parameters of the model.
+
+Forward mode. With calc_sol(sensitivity=...), the sensitivities V = dx/dp of all states to
+all chosen parameters are integrated together with the model,
+    dV/dt = J(x) @ V + df/dp,    V(0) = dx0/dp,
+with J the Jacobian of the model (see models.SEIR_jvp), and stored with the solution:
+
+    epid_obj.calc_sol(sensitivity=['B', 'Gamma', 'Sigma'])
+    epid_obj.sol_sens['B'][:, idx_state]  # (N_time x Ng x Ng), d x[idx_state](t) / d B
+    epid_obj.gradient('peak', 'I')['Gamma']  # (Ng), d peak of aggregate I / d Gamma
+
+Adjoint mode. For one scalar objective, c @ x(t_obj), over many parameters, the adjoint
+    dlambda/dt = -J(x)^T @ lambda,    lambda(t_obj) = c,
+is integrated backwards along the stored solution, and the gradient is
+    lambda(0) @ dx0/dp + integral of lambda @ df/dp from 0 to t_obj.
+This is what epid_sim.gradient does without forward sensitivities, at the cost of about one
+more integration, whatever the number of parameters.
+
+The parameters are
+    'B': entries of the (uncontained) contact matrix B, (Ng x Ng),
+    'Gamma', 'Mu', 'Sigma': diagonals of the rate matrices, (Ng),
+    'x0': initial condition, (N_states),
+    'scales': scales of the rows of B of each policy segment, B_policy = diag(scales) @ B,
+        (N_segments x Ng).
+The scales of each policy are held fixed for the derivatives with respect to B, i.e. policies
+with a target R0 are not re-solved. Gradients are structured numpy arrays with these fields.
+
+@author: MiTepid contributors
+"""
+
+
+list_all_params = ['B', 'Gamma', 'Mu', 'Sigma', 'x0', 'scales']
+
+
+def sensitivity_layout(model_type, Ng, N_segments, list_params=None):
+    """
+    Return the names and shapes of the parameters, in the order of the sensitivities.
+
+    Parameters
+    ----------
+    model_type : str
+        'SIS', 'SIR' or 'SEIR'.
+    Ng : int
+        number of groups.
+    N_segments : int
+        number of policy segments.
+    list_params : list of str, optional
+        the parameters, see list_all_params. The default is None, i.e. all of them.
+
+    Raises
+    ------
+    ValueError
+        for unknown parameters, or 'Sigma' for other models than SEIR.
+
+    Returns
+    -------
+    layout : list of (str, tuple)
+        name and shape of each parameter.
+
+    """
+    from mitepid.models import get_compartments
+
+    N_states = Ng * len(get_compartments(model_type))
+    dict_shapes = {'B': (Ng, Ng),
+                   'Gamma': (Ng,),
+                   'Mu': (Ng,),
+                   'x0': (N_states,),
+                   'scales': (N_segments, Ng)}
+    if model_type == 'SEIR':
+        dict_shapes['Sigma'] = (Ng,)
+    if list_params is None:
+        list_params = [key for key in list_all_params if key in dict_shapes]
+    layout = []
+    for key in list_params:
+        if key not in dict_shapes:
+            raise ValueError('Sensitivity to ' + str(key) + ' is not defined for ' + model_type)
+        layout.append((key, dict_shapes[key]))
+    return layout
+
+
+def to_structured(arr, layout):
+    """
+    Return sensitivities (... x P) as a structured array (...) with one field per parameter.
+
+    Parameters
+    ----------
+    arr : numpy array
+        (... x P), P the total size of all parameters of layout.
+    layout : list of (str, tuple)
+        see sensitivity_layout.
+
+    Returns
+    -------
+    arr_out : numpy array
+        structured array, e.g. arr_out['B'] is (... x Ng x Ng).
+
+    """
+    import numpy as np
+
+    dtype = np.dtype([(key, float, shape) for key, shape in layout])
+    arr = np.ascontiguousarray(arr, dtype=float)
+    return arr.view(dtype)[..., 0]
+
+
+def param_forcing(model_type, states, B, scales, args, idx_segment, layout):
+    """
+    Return the derivative of the model with respect to the parameters, df/dp.
+
+    Parameters
+    ----------
+    model_type : str
+        'SIS', 'SIR' or 'SEIR'.
+    states : numpy array
+        (... x N_states).
+    B : numpy array
+        (uncontained) contact matrix, (Ng x Ng).
+    scales : numpy array
+        scales of the rows of B of the policy of the segment, (Ng), see
+        policies.get_policy_scales.
+    args : tuple
+        arguments of the vectorised model, (B_step, gamma, mu, ...), with B_step the contact
+        matrix of the policy of the segment.
+    idx_segment : int
+        index of the policy segment, for 'scales'.
+    layout : list of (str, tuple)
+        see sensitivity_layout.
+
+    Returns
+    -------
+    F : numpy array
+        (... x N_states x P).
+
+    """
+    import numpy as np
+
+    Ng = B.shape[0]
+    N_states = states.shape[-1]
+    shape = states.shape[:-1]
+    ind = np.arange(Ng)
+    I = states[..., :Ng]
+    if model_type == 'SIS':
+        S = 1 - I
+        ind_inf = ind
+    else:
+        S = 1 - np.sum(np.reshape(states, shape + (-1, Ng)), axis=-2)
+        ind_inf = ind + (2*Ng if model_type == 'SEIR' else 0)
+    F = np.zeros(shape + (N_states, _size(layout)))
+    offset = 0
+    for key, shape_key in layout:
+        size = int(np.prod(shape_key))
+        # a view of the columns of the parameter, splitting the last axis to shape_key
+        block = np.reshape(F[..., offset:offset + size], shape + (N_states,) + shape_key)
+        offset += size
+        if key == 'B':
+            block[..., ind_inf, ind, :] = (S * scales)[..., None] * I[..., None, :]
+        elif key == 'Gamma':
+            block[..., ind, ind] = -I
+            if model_type != 'SIS':
+                block[..., ind + Ng, ind] = I
+        elif key == 'Mu':
+            block[..., ind, ind] = -I
+            if model_type != 'SIS':
+                block[..., ind + Ng, ind] = -states[..., Ng:2*Ng]
+            if model_type == 'SEIR':
+                block[..., ind + 2*Ng, ind] = -states[..., 2*Ng:3*Ng]
+        elif key == 'Sigma':
+            E = states[..., 2*Ng:3*Ng]
+            block[..., ind, ind] = E
+            block[..., ind + 2*Ng, ind] = -E
+        elif key == 'scales':
+            Sum_j_x = np.matmul(I, B.T)
+            block[..., ind_inf, idx_segment, ind] = S * Sum_j_x
+    return F
+
+
+def initial_sensitivity(N_states, layout):
+    """Return dx0/dp, (N_states x P)."""
+    import numpy as np
+
+    list_blocks = []
+    for key, shape_key in layout:
+        if key == 'x0':
+            list_blocks.append(np.eye(N_states))
+        else:
+            list_blocks.append(np.zeros((N_states, int(np.prod(shape_key)))))
+    return np.concatenate(list_blocks, axis=-1)
+
+
+def sensitivity_model(model_type, B, scales, idx_segment, layout):
+    """
+    Return the model augmented with the forward sensitivity equations.
+
+    The augmented states are the states followed by the sensitivities to each parameter,
+    i.e. the columns of V one after another, (... x N_states * (1 + P)), and the function has
+    the signature of the vectorised models, f(states, t, *args, out=None), with the same args.
+
+    Parameters
+    ----------
+    model_type : str
+        'SIS', 'SIR' or 'SEIR'.
+    B, scales, idx_segment, layout :
+        see param_forcing.
+
+    Returns
+    -------
+    model_sens : function
+        the augmented model.
+
+    """
+    import numpy as np
+    from mitepid.models import get_model, get_model_jvp
+
+    model, model_jac = get_model(model_type)
+    model_jvp = get_model_jvp(model_type)
+    P = _size(layout)
+
+    def model_sens(z, t, *args, out=None):
+        z = np.asarray(z, dtype=float)
+        if out is None:
+            out = np.empty_like(z)
+        N_states = z.shape[-1] // (1 + P)
+        shape = z.shape[:-1]
+        x = z[..., :N_states]
+        V_T = np.reshape(z[..., N_states:], shape + (P, N_states))
+        out[..., :N_states] = model(x, t, *args)
+        F_T = np.swapaxes(param_forcing(model_type, x, B, scales, args, idx_segment, layout),
+                          -1, -2)
+        if z.ndim == 1:
+            # a single state, as from the solvers: one product with the dense Jacobian
+            dVdt_T = V_T @ model_jac(x, t, *args).T + F_T
+        else:
+            dVdt_T = np.swapaxes(model_jvp(x, np.swapaxes(V_T, -1, -2), t, *args), -1, -2) + F_T
+        out[..., N_states:] = np.reshape(dVdt_T, shape + (-1,))
+        return out
+
+    return model_sens
+
+
+def sensitivity_jac(model_type, layout):
+    """
+    Return the Jacobian of the model augmented by sensitivity_model, in banded format.
+
+    The Jacobian J of the model is on the diagonal blocks, one for the states and one for
+    each column of V. The coupling of the sensitivities to the states is left out, as in the
+    staggered methods for sensitivities: the solution is the same, the Newton iterations of
+    implicit solvers may only need a few more steps. Both bandwidths are N_states - 1, see
+    models.jac_to_banded.
+
+    Parameters
+    ----------
+    model_type : str
+        'SIS', 'SIR' or 'SEIR'.
+    layout : list of (str, tuple)
+        see sensitivity_layout.
+
+    Returns
+    -------
+    jac_sens : function
+        jac_sens(z, t, *args), the (2 * N_states - 1 x N_states * (1 + P)) banded Jacobian.
+
+    """
+    import numpy as np
+    from mitepid.models import get_model, jac_to_banded
+
+    _, model_jac = get_model(model_type)
+    P = _size(layout)
+
+    def jac_sens(z, t, *args):
+        N_states = len(z) // (1 + P)
+        J = model_jac(z[:N_states], t, *args)
+        return np.tile(jac_to_banded(J, N_states - 1, N_states - 1), (1, 1 + P))
+
+    return jac_sens
+
+
+def adjoint_gradient(model_type, t_sol, sol, list_segments, list_scales, B, args_fn, idx_obj,
+                     c, layout):
+    """
+    Return the gradient of c @ x(t_sol[idx_obj]) with the adjoint method.
+
+    The adjoint is integrated backwards with RK4 on the grid of the stored solution. States
+    in the middle of each step are interpolated with cubic Hermite polynomials.
+
+    Parameters
+    ----------
+    model_type : str
+        'SIS', 'SIR' or 'SEIR'.
+    t_sol : numpy array
+        time grid of the stored solution, (N_time).
+    sol : numpy array
+        the solution, (N_time x N_states).
+    list_segments : list of tuple
+        (t_switch1, t_switch2, B_step, x0_xtrnal) of each segment, as in epid_sim.
+    list_scales : list of numpy arrays
+        scales of the rows of B of each segment, (Ng), as in epid_sim.
+    B : numpy array
+        (uncontained) contact matrix, (Ng x Ng).
+    args_fn : function
+        returns the arguments of the vectorised model for B_step.
+    idx_obj : int
+        row of the objective.
+    c : numpy array
+        weights of the states in the objective, (N_states).
+    layout : list of (str, tuple)
+        see sensitivity_layout.
+
+    Returns
+    -------
+    grad : numpy array
+        (P), gradient of the objective.
+
+    """
+    import numpy as np
+    from mitepid.models import get_model
+
+    model, model_jac = get_model(model_type)
+    N_states = sol.shape[-1]
+    t_sol = np.asarray(t_sol, dtype=float)
+    list_t1 = np.array([x[0] for x in list_segments])
+    eps_t = 1e-9 * max(t_sol[-1], 1)
+    arr_segment = np.searchsorted(list_t1, t_sol + eps_t) - 1
+    lam = np.array(c, dtype=float)
+    mu_p = np.zeros(_size(layout))
+    cache = {}
+
+    def _segment(idx_segment):
+        if idx_segment not in cache:
+            B_step = list_segments[idx_segment][2]
+            cache[idx_segment] = args_fn(B_step)
+        return cache[idx_segment]
+
+    def _g(x, lam, idx_segment):
+        args = _segment(idx_segment)
+        J = model_jac(x, 0., *args)
+        F = param_forcing(model_type, x, B, list_scales[idx_segment], args, idx_segment,
+                          layout)
+        return -lam @ J, -lam @ F
+
+    for idx in np.arange(idx_obj, 0, -1):
+        idx_segment = int(arr_segment[idx - 1])
+        if arr_segment[idx] != idx_segment:
+            # each segment starts from the last state of the previous one (plus the external
+            # input), so the adjoint does not change
+            continue
+        args = _segment(idx_segment)
+        h = t_sol[idx] - t_sol[idx - 1]
+        x0 = np.array(sol[idx - 1], dtype=float)
+        x1 = np.array(sol[idx], dtype=float)
+        f0 = model(x0, 0., *args)
+        f1 = model(x1, 0., *args)
+        x_mid = 0.5 * (x0 + x1) + h / 8 * (f0 - f1)
+        k1_l, k1_m = _g(x1, lam, idx_segment)
+        k2_l, k2_m = _g(x_mid, lam - 0.5 * h * k1_l, idx_segment)
+        k3_l, k3_m = _g(x_mid, lam - 0.5 * h * k2_l, idx_segment)
+        k4_l, k4_m = _g(x0, lam - h * k3_l, idx_segment)
+        lam = lam - h / 6 * (k1_l + 2 * k2_l + 2 * k3_l + k4_l)
+        mu_p = mu_p - h / 6 * (k1_m + 2 * k2_m + 2 * k3_m + k4_m)
+    return mu_p + lam @ initial_sensitivity(N_states, layout)
+
+
+def _size(layout):
+    """Return the total size of the parameters of a layout."""
+    import numpy as np
+
+    return int(sum(np.prod(shape) for _, shape in layout))
@@ -12,30 +12,210 @@ def load_mat(filename, var_name=None):
     """
     Load data from mat files.
 
+    Files are parsed only once, see load_mat_dict. A copy of the variable is returned, so the
+    cached data cannot be changed by the caller.
+
     Parameters
     ----------
     filename : pathlib Path
         filename including possibly multiple variable in matlab mat format.
     var_name : str, optional
-        variable to be loaded. The default is None.
+        variable to be loaded. The default is None, i.e. the first variable in the file.
 
     Returns
     -------
-    my_data : TYPE
-        DESCRIPTION.
+    my_data : numpy array
+        the variable.
 
     """
-    from scipy.io import loadmat
-    from pathlib import Path
+    import numpy as np
 
-    filename = Path(filename).as_posix()
-    data_struct = loadmat(filename)
+    data_struct = load_mat_dict(filename)
     if not var_name:
         var_name = [x for x in data_struct.keys() if not '__' in x][0]
-    my_data = data_struct[var_name]
+    my_data = np.array(data_struct[var_name], copy=True)
     return my_data
 
 
+def load_mat_dict(filename):
+    """
+    Load all variables of a mat file, memoized.
+
+    If the folder holds a bundle (see build_mat_bundle) including the file, the variables are
+    views into the bundle. Otherwise the file is parsed with scipy.io, and the result is cached,
+    keyed on the resolved path and the modification time of the file, so a file which is written
+    again is parsed again. Numeric arrays in the returned dict are read-only and shared between
+    calls.
+
+    Parameters
+    ----------
+    filename : pathlib Path
+        filename in matlab mat format.
+
+    Returns
+    -------
+    data_struct : dict
+        keys are variable names, values are the variables, as returned by scipy.io.loadmat.
+
+    """
+    from pathlib import Path
+
+    filename = Path(filename).resolve()
+    data_struct = load_mat_from_bundle(filename)
+    if data_struct is not None:
+        return data_struct
+    return _load_mat_cached(filename.as_posix(), filename.stat().st_mtime_ns)
+
+
+def _load_mat_cached(filename, mtime_ns):
+    """Parse a mat file, see load_mat_dict. mtime_ns is only part of the cache key."""
+    import numpy as np
+    from scipy.io import loadmat
+
+    key = (filename, mtime_ns)
+    if key not in dict_mat_cache:
+        data_struct = loadmat(filename)
+        for value in data_struct.values():
+            if isinstance(value, np.ndarray) and value.dtype.kind in 'biufc':
+                value.setflags(write=False)
+        dict_mat_cache[key] = data_struct
+    return dict_mat_cache[key]
+
+
+dict_mat_cache = {}
+
+# all mat files of a folder can be packed in one bundle, see build_mat_bundle
+file_bundle_data = 'mat_bundle.npy'
+file_bundle_index = 'mat_bundle.json'
+dict_bundle_cache = {}
+
+
+def build_mat_bundle(dir_mat):
+    """
+    Pack the variables of all mat files in a folder into a single memory-mapped bundle.
+
+    The bundle is a flat uint8 array in mat_bundle.npy, holding the data of every numeric or
+    string variable (8-byte aligned), and an index in mat_bundle.json with the offset, dtype
+    and shape of each. Other variables (e.g. matlab function handles) are left out.
+    Once the bundle exists, load_mat_dict reads these files from it, without scipy.io.
+    The bundle of Optimised_B is not kept in the repository, it is built when the package is
+    built (see setup.py), or in a checkout with catalog.build_bundle().
+
+    Parameters
+    ----------
+    dir_mat : pathlib.Path
+        the folder containing the mat files.
+
+    Returns
+    -------
+    dict_index : dict
+        the index, keys are file names, values are {'size': size of the mat file in bytes,
+        'sha256': hash of its content, 'vars': {var_name: {'offset', 'dtype', 'shape'}}}.
+        Modification times are not used, they change with every checkout or installation.
+
+    """
+    import json
+    import numpy as np
+    from pathlib import Path
+
+    dir_mat = Path(dir_mat)
+    dict_index = {}
+    list_chunks = []
+    offset = 0
+    for file in sorted(dir_mat.glob('*.mat')):
+        data_struct = _load_mat_cached(file.resolve().as_posix(), file.stat().st_mtime_ns)
+        dict_vars = {}
+        for var_name, value in data_struct.items():
+            if '__' in var_name or not isinstance(value, np.ndarray) \
+                    or value.dtype.kind not in 'biufcU':
+                continue
+            value = np.ascontiguousarray(value)
+            dict_vars[var_name] = {'offset': offset,
+                                   'dtype': value.dtype.str,
+                                   'shape': list(value.shape)}
+            nbytes = value.nbytes + (-value.nbytes) % 8
+            chunk = np.zeros(nbytes, dtype=np.uint8)
+            chunk[:value.nbytes] = value.reshape(-1).view(np.uint8)
+            list_chunks.append(chunk)
+            offset = offset + nbytes
+        dict_index[file.name] = {'size': file.stat().st_size,
+                                 'sha256': _file_sha256(file),
+                                 'vars': dict_vars}
+
+    data = np.concatenate(list_chunks) if list_chunks else np.zeros(0, dtype=np.uint8)
+    np.save(Path(dir_mat, file_bundle_data), data)
+    with open(Path(dir_mat, file_bundle_index), 'w') as file_json:
+        json.dump(dict_index, file_json, indent=1)
+    dict_bundle_cache.pop(dir_mat.resolve().as_posix(), None)
+    return dict_index
+
+
+def load_mat_from_bundle(filename):
+    """
+    Return the variables of a mat file from the bundle in its folder, see build_mat_bundle.
+
+    Arrays are read-only views into the memory-mapped bundle, no data is copied.
+
+    Parameters
+    ----------
+    filename : pathlib.Path
+        the mat file.
+
+    Returns
+    -------
+    data_struct : dict or None
+        keys are variable names, values are numpy arrays. None if there is no bundle, if the
+        file is not in it, or if the file changed since the bundle was built, i.e. its size or
+        the hash of its content differ from the index. Each file is checked once per process,
+        on first use, which takes a few microseconds for the small files of Optimised_B.
+
+    """
+    import json
+    import numpy as np
+    from pathlib import Path
+
+    filename = Path(filename)
+    dir_mat = filename.parent.as_posix()
+    if dir_mat not in dict_bundle_cache:
+        file_data = Path(dir_mat, file_bundle_data)
+        file_index = Path(dir_mat, file_bundle_index)
+        if file_data.is_file() and file_index.is_file():
+            with open(file_index) as file_json:
+                dict_index = json.load(file_json)
+            data = np.load(file_data, mmap_mode='r').view(np.ndarray)
+            dict_bundle_cache[dir_mat] = (data, dict_index, {})
+        else:
+            dict_bundle_cache[dir_mat] = None
+    if dict_bundle_cache[dir_mat] is None:
+        return None
+
+    data, dict_index, dict_views = dict_bundle_cache[dir_mat]
+    if filename.name not in dict_views:
+        entry = dict_index.get(filename.name)
+        if entry is None or not filename.is_file():
+            return None
+        if filename.stat().st_size != entry['size'] \
+                or _file_sha256(filename) != entry['sha256']:
+            return None
+        data_struct = {}
+        for var_name, var_info in entry['vars'].items():
+            dtype = np.dtype(var_info['dtype'])
+            shape = tuple(var_info['shape'])
+            nbytes = dtype.itemsize * int(np.prod(shape))
+            offset = var_info['offset']
+            data_struct[var_name] = data[offset:offset+nbytes].view(dtype).reshape(shape)
+        dict_views[filename.name] = data_struct
+    return dict_views[filename.name]
+
+
+def _file_sha256(filename):
+    """Return the sha256 hash of the content of a file, as a hex string."""
+    import hashlib
+
+    with open(filename, 'rb') as file_in:
+        return hashlib.sha256(file_in.read()).hexdigest()
+
+
 def save_mat(filename, var):
     """
     Save data to mat files.
@@ -59,6 +239,94 @@ def save_mat(filename, var):
     my_dict = {'var_name': var}
     savemat(filename, my_dict)
 
+def alloc_output(shape, output=None, dtype=float):
+    """
+    Allocate an array for the solution, in memory or as a memory-mapped .npy file.
+
+    Parameters
+    ----------
+    shape : tuple of int
+        shape of the array.
+    output : pathlib.Path, optional
+        .npy file backing the array. The default is None, i.e. in memory.
+    dtype : numpy dtype, optional
+        data type. The default is float.
+
+    Returns
+    -------
+    arr : numpy array or numpy memmap
+        uninitialised array. A file can be opened later with np.load(output, mmap_mode='r').
+
+    """
+    import numpy as np
+    from pathlib import Path
+
+    if output is None:
+        return np.empty(shape, dtype=dtype)
+    Path(output).parent.mkdir(parents=True, exist_ok=True)
+    return np.lib.format.open_memmap(Path(output), mode='w+', dtype=dtype, shape=shape)
+
+
+def resize_output(arr, N_rows, output=None):
+    """
+    Change the number of rows of an array allocated with alloc_output, keeping its data.
+
+    For a memory-mapped .npy file, the header is rewritten and the file is truncated or grown in
+    place (numpy leaves room in the header for the first dimension to grow), and the file is
+    opened again in 'r+' mode. Views of the old array must not be used afterwards.
+
+    Parameters
+    ----------
+    arr : numpy array or numpy memmap
+        the array.
+    N_rows : int
+        new size of the first dimension.
+    output : pathlib.Path, optional
+        .npy file backing the array. The default is None, i.e. in memory.
+
+    Returns
+    -------
+    arr : numpy array or numpy memmap
+        the resized array. Rows beyond the old size are uninitialised.
+
+    """
+    import io
+    import numpy as np
+    from pathlib import Path
+
+    shape = (N_rows, ) + arr.shape[1:]
+    if shape == arr.shape:
+        return arr
+    if output is None:
+        arr_new = np.empty(shape, dtype=arr.dtype)
+        N_keep = min(N_rows, arr.shape[0])
+        arr_new[:N_keep] = arr[:N_keep]
+        return arr_new
+
+    dtype = arr.dtype
+    arr.flush()
+    del arr
+    header = {'descr': np.lib.format.dtype_to_descr(dtype),
+              'fortran_order': False,
+              'shape': shape}
+    with open(Path(output), 'r+b') as file_npy:
+        version = np.lib.format.read_magic(file_npy)
+        header_new = io.BytesIO()
+        if version == (1, 0):
+            np.lib.format.read_array_header_1_0(file_npy)
+            np.lib.format.write_array_header_1_0(header_new, header)
+        else:
+            np.lib.format.read_array_header_2_0(file_npy)
+            np.lib.format.write_array_header_2_0(header_new, header)
+        offset = file_npy.tell()
+        if len(header_new.getvalue()) != offset:
+            raise ValueError('The header of ' + str(output) + ' cannot grow in place.')
+        file_npy.seek(0)
+        file_npy.write(header_new.getvalue())
+        file_npy.truncate(offset + int(np.prod(shape)) * dtype.itemsize)
+    return np.memmap(Path(output), dtype=dtype, mode='r+', offset=offset, shape=shape)
+
+
 def sol_aggregate(sol_in, pop_country):
     """
     Calculate the aggregate trajectory of the whole population.
@@ -68,25 +336,100 @@ def sol_aggregate(sol_in, pop_country):
     Parameters
     ----------
     sol_in : numpy array
-        solution to epid model. shape (N_time x N_groups)
+        solution to epid model. shape (N_time x N_groups), or (... x N_time x N_groups)
     pop_country : list of floats
         list of relative ratio of each age group in the population.
 
     Returns
     -------
     sol_out : numpy array
-        aggregate trajectory. shape (N_time x 1)
+        aggregate trajectory. shape (N_time x 1), or (... x N_time x 1)
+
+    """
+    import numpy as np
+
+    weights = np.asarray(pop_country, dtype=float) / 100
+    sol_out = np.asarray(sol_in) @ weights
+    return sol_out[..., None]
+
+
+def sol_aggregate_batch(sol_in, country):
+    """
+    Calculate the aggregate trajectories of many solutions in one matrix-vector product.
+
+    Parameters
+    ----------
+    sol_in : numpy array
+        solutions, shape (... x N_time x N_groups), e.g. (N_scenarios x N_time x N_groups).
+    country : str
+        the country, see policies.get_pop_weights.
+
+    Returns
+    -------
+    sol_out : numpy array
+        aggregate trajectories, shape (... x N_time).
+
+    """
+    from mitepid.policies import get_pop_weights
+
+    return sol_in @ get_pop_weights(country)
+
+
+def correct_x0(x0, model_type, Ng):
+    """
+    Correct the size of vextor x0, initial conditions.
+
+    if length of x0 is 1, it will set initial conditoin for all groups in compartment 'I' to x0
+        and 0 for other compartments.
+    if length of x0 is Ng, it will set it as the initial conditoin for compartment 'I'
+        and 0 for other compartments.
+    if length of x0 is equal total number of states (for example 2*Ng for SIR), then it sets
+        it as initial condition.
+    else raises an error.
+
+    Parameters
+    ----------
+    x0 : list of float
+        input list of initial conditoins.
+    model_type : str
+        'SIS', 'SIR' or 'SEIR'.
+    Ng : int
+        Number of groups defined in the model.
+
+    Returns
+    -------
+    x0 : list of float
+        initial consitions with corrected length.
 
     """
     import numpy as np
 
-    sol = sol_in.copy()
-    Ng = sol.shape[1]
-    for cc in np.arange(Ng):
-        sol[:,cc] = sol[:,cc] * pop_country[cc]/100
-    sol_out = np.sum(sol, axis=1)
-    sol_out = sol_out.reshape(sol_out.size,1)
-    return sol_out
+    if model_type == 'SIS':
+        if len(x0) == 1:
+            x0 = np.ones(Ng)*x0
+        elif len(x0) == Ng:
+            x0 = x0
+        else:
+            raise ValueError('Something wrong with initial conditions vector!')
+    elif model_type == 'SIR':
+        if len(x0) == 1:
+            x0 = np.concatenate((np.ones(Ng)*x0, np.zeros(Ng)))
+        elif len(x0) == Ng:
+            x0 = np.concatenate((x0, np.zeros(Ng)))
+        elif len(x0) == 2*Ng:
+            x0 = x0
+        else:
+            raise ValueError('Something wrong with initial conditions vector!')
+    elif model_type == 'SEIR':
+        if len(x0) == 1:
+            x0 = np.concatenate((np.ones(Ng)*x0, np.zeros(Ng), np.zeros(Ng)))
+        elif len(x0) == Ng:
+            x0 = np.concatenate((x0, np.zeros(Ng), np.zeros(Ng)))
+        elif len(x0) == 3*Ng:
+            x0 = x0
+        else:
+            raise ValueError('Something wrong with initial conditions vector!')
+    return x0
 
 def scale_B_opt(B_opt_in, list_scales=None):
     """
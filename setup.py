@@ -4,6 +4,7 @@ import re
 
 from setuptools import find_packages
 from setuptools import setup
+from setuptools.command.build_py import build_py
 
 
 def read(filename):
@@ -13,6 +14,22 @@ def read(filename):
         return re.sub(text_type(r":[a-z]+:`~?(.*?)`"), text_type(r"``\1``"), fd.read())
 
 
+class build_py_mat_bundle(build_py):
+    """Build the package, and pack the mat files of Optimised_B into one bundle."""
+
+    def run(self):
+        build_py.run(self)
+        dir_B_opt = os.path.join(self.build_lib, "mitepid", "Optimised_B")
+        if self.dry_run or not os.path.isdir(dir_B_opt):
+            return
+        try:
+            from mitepid.utils import build_mat_bundle
+            build_mat_bundle(dir_B_opt)
+        except ImportError as err:
+            # the mat files are then parsed with scipy.io
+            print("Not building the bundle of Optimised_B: " + str(err))
+
+
 setup(
     name="MiTepid",
     version="0.0.5",
@@ -25,8 +42,9 @@ setup(
     packages=find_packages(exclude=("tests", "venv")),
     test_suite="nose.collector",
     tests_require=["nose"],
-    package_data={"mitepid": ["requirements.txt"]},
+    package_data={"mitepid": ["requirements.txt", "Optimised_B/*.mat"]},
     include_package_data=True,
+    cmdclass={"build_py": build_py_mat_bundle},
     install_requires=[
     "numpy",
     "scipy",
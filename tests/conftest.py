@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Shared data of the tests: the optimised contact matrix of the SEIR model for one country.
+
+@author: MiTepid contributors
+"""
+import pytest
+
+
+@pytest.fixture(scope='session')
+def seir_data():
+    """Return dict of B, Gamma, Sigma and D = Gamma of the SEIR model (Ti = 5, R0 = 2.95)."""
+    import numpy as np
+    from pathlib import Path
+
+    import mitepid
+    from mitepid.policies import get_B_policy
+    from mitepid.utils import load_mat
+
+    file_B_opt = Path(Path(mitepid.__file__).parent, 'Optimised_B', 'B_opt_SEIR_Ti_5_R0_2.95.mat')
+    Gamma = np.asarray(load_mat(file_B_opt, 'Gamma'), dtype=float)
+    Sigma = np.asarray(load_mat(file_B_opt, 'Sigma'), dtype=float)
+    B = np.asarray(get_B_policy(file_B_opt, 'Iran', 'Uncontained'), dtype=float)
+    return dict(B=B, Gamma=Gamma, Sigma=Sigma, D=Gamma)
+
+
+@pytest.fixture
+def make_sim(seir_data, tmp_path):
+    """Return a function making epid_sim objects of the SEIR model, with keyword overrides."""
+    from mitepid.epid_sim import epid_sim
+
+    def _make_sim(**kwargs):
+        dict_kwargs = dict(model_type='SEIR', B=seir_data['B'], Gamma=seir_data['Gamma'],
+                           Sigma=seir_data['Sigma'], country='Iran', x0=[1e-4]*9,
+                           policy_list=['Uncontained', 1.5], policy_switch_times=[0, 40],
+                           t_end=100, dir_save_plots_main=tmp_path, str_policy='test',
+                           group_labels=None, integrator='RK4', verbose=False)
+        dict_kwargs.update(kwargs)
+        return epid_sim(**dict_kwargs)
+
+    return _make_sim
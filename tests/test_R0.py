@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of mitepid.analysis.R0.
+
+@author: MiTepid contributors
+"""
+import numpy as np
+import pytest
+
+from mitepid.analysis.R0 import R0_engine
+
+
+def _random_scales(Ng, N, seed=0):
+    return np.random.default_rng(seed).uniform(0.05, 1, size=(N, Ng))
+
+
+def test_R0_batch_matches_eigvals(seir_data):
+    B, D = seir_data['B'], seir_data['D']
+    engine = R0_engine(B, q=1 / np.diag(D))
+    list_scales = _random_scales(B.shape[0], 50)
+    rho = engine.R0(list_scales)
+    rho_eig = [np.max(np.abs(np.linalg.eigvals(np.linalg.solve(D, s[:, None] * B))))
+               for s in list_scales]
+    assert rho.shape == (50,)
+    np.testing.assert_allclose(rho, rho_eig, rtol=1e-8)
+
+
+@pytest.mark.parametrize('is_symmetric', [True, False])
+def test_R0_gradient_finite_differences(seir_data, is_symmetric):
+    B, D = seir_data['B'], seir_data['D']
+    if is_symmetric:
+        # the symmetric form, otherwise the left and right Perron vectors
+        B = 0.5 * (B + B.T)
+    engine = R0_engine(B, q=1 / np.diag(D))
+    assert engine.is_symmetric == is_symmetric
+    list_scales = _random_scales(B.shape[0], 5)
+    _, grad = engine.gradient(list_scales)
+    eps = 1e-6
+    for k in range(B.shape[0]):
+        step = np.zeros(B.shape[0])
+        step[k] = eps
+        fd = (engine.R0(list_scales + step) - engine.R0(list_scales - step)) / (2 * eps)
+        np.testing.assert_allclose(grad[:, k], fd, rtol=1e-5, atol=1e-8)
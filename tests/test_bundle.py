@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of the bundle of mat files, see utils.build_mat_bundle.
+
+@author: MiTepid contributors
+"""
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import mitepid
+from mitepid.utils import build_mat_bundle, load_mat_dict, load_mat_from_bundle
+
+dir_B_opt = Path(Path(mitepid.__file__).parent, 'Optimised_B')
+list_files = ['B_opt_SEIR_Ti_5_R0_2.95.mat', 'B_opt_SEIR_Ti_5_R0_2.55.mat']
+
+
+@pytest.fixture
+def dir_bundle(tmp_path):
+    for file in list_files:
+        shutil.copy(Path(dir_B_opt, file), tmp_path)
+    dict_index = build_mat_bundle(tmp_path)
+    assert sorted(dict_index) == sorted(list_files)
+    assert all(set(entry) == {'size', 'sha256', 'vars'} for entry in dict_index.values())
+    return tmp_path
+
+
+def test_bundle_matches_mat_files(dir_bundle):
+    from scipy.io import loadmat
+
+    for file in list_files:
+        data_struct = load_mat_from_bundle(Path(dir_bundle, file))
+        data_mat = loadmat(Path(dir_B_opt, file))
+        assert data_struct is not None
+        for var_name, value in data_struct.items():
+            np.testing.assert_array_equal(value, data_mat[var_name])
+            assert not value.flags.writeable
+
+
+def test_bundle_ignores_modification_time(dir_bundle):
+    # e.g. a fresh checkout or installation
+    file = Path(dir_bundle, list_files[0])
+    os.utime(file, ns=(0, 0))
+    assert load_mat_from_bundle(file) is not None
+
+
+def test_bundle_detects_changed_file(dir_bundle):
+    from scipy.io import loadmat
+
+    # same name and size, other content: only the hash differs
+    file = Path(dir_bundle, list_files[1])
+    file_new = Path(dir_B_opt, 'B_opt_SEIR_Ti_5_R0_3.75.mat')
+    assert file_new.stat().st_size == file.stat().st_size
+    shutil.copy(file_new, file)
+    assert load_mat_from_bundle(file) is None
+    data_struct = load_mat_dict(file)
+    np.testing.assert_array_equal(data_struct['B_opt'], loadmat(file)['B_opt'])
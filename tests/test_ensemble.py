@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of mitepid.epid_ensemble against mitepid.epid_sim.
+
+@author: MiTepid contributors
+"""
+import numpy as np
+import pytest
+
+from mitepid.epid_ensemble import epid_ensemble
+
+
+def test_ensemble_matches_epid_sim(seir_data, make_sim):
+    list_x0 = [[1e-4]*9, [1e-5]*9, [2e-4]*9 + [0.1]*9 + [1e-4]*9]
+    list_policy_list = [['Uncontained', 1.5], ['Uncontained', 'Lockdown', 1.2],
+                        ['Schools_closed']]
+    list_switch_times = [[0, 40], [0, 30, 60], [0]]
+    ens = epid_ensemble(model_type='SEIR', country='Iran', x0=list_x0, B=seir_data['B'],
+                        t_end=100, policy_list=list_policy_list,
+                        policy_switch_times=list_switch_times, Gamma=seir_data['Gamma'],
+                        Sigma=seir_data['Sigma'], integrator='RK4')
+    assert ens.N_scenarios == 3
+    for idx in range(3):
+        sim = make_sim(x0=list_x0[idx], policy_list=list_policy_list[idx],
+                       policy_switch_times=list_switch_times[idx])
+        for key in sim.sol_dict:
+            np.testing.assert_allclose(ens.sol_dict[key][idx], sim.sol_dict[key],
+                                       rtol=0, atol=1e-14)
+            np.testing.assert_allclose(ens.sol_agg_dict[key][idx], sim.sol_agg_dict[key][:, 0],
+                                       rtol=0, atol=1e-14)
+
+
+def test_ensemble_default_odeint(seir_data, make_sim):
+    list_x0 = [[1e-4]*9, [1e-5]*9]
+    ens = epid_ensemble(model_type='SEIR', country='Iran', x0=list_x0, B=seir_data['B'],
+                        t_end=100, policy_list=['Uncontained', 1.5],
+                        policy_switch_times=[0, 40], Gamma=seir_data['Gamma'],
+                        Sigma=seir_data['Sigma'], rtol=1e-10, atol=1e-12)
+    assert all(info['integrator'] == 'odeint' for info in ens.list_solver_info)
+    for idx in range(2):
+        sim = make_sim(x0=list_x0[idx])
+        np.testing.assert_allclose(ens.sol_dict['I'][idx], sim.sol_dict['I'], rtol=0,
+                                   atol=1e-8)
+
+
+def test_ensemble_inconsistent_members(seir_data):
+    with pytest.raises(ValueError):
+        epid_ensemble(model_type='SEIR', country='Iran', x0=[[1e-4]*9, [1e-5]*9],
+                      B=np.stack([seir_data['B']]*3), t_end=10, Gamma=seir_data['Gamma'],
+                      Sigma=seir_data['Sigma'])
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of mitepid.analysis.equilibrium against long integrations.
+
+@author: MiTepid contributors
+"""
+import numpy as np
+import pytest
+
+from mitepid.analysis import final_size, endemic_equilibrium
+
+
+def test_final_size_matches_integration(seir_data, make_sim):
+    sim = make_sim(policy_list=['Uncontained'], policy_switch_times=[0], t_end=1000,
+                   t_step=0.5)
+    R_inf = final_size('SEIR', [1e-4]*9, seir_data['B'], seir_data['Gamma'],
+                       Sigma=seir_data['Sigma'])
+    np.testing.assert_allclose(R_inf, sim.sol_dict['R'][-1], atol=1e-6)
+
+
+def test_final_size_batch(seir_data):
+    scales = np.array([0.2, 0.5, 1.0])
+    array_B = scales[:, None, None] * seir_data['B']
+    R_inf = final_size('SEIR', [1e-4]*9, array_B, seir_data['Gamma'])
+    assert R_inf.shape == (3, 9)
+    for idx, B in enumerate(array_B):
+        np.testing.assert_allclose(R_inf[idx], final_size('SEIR', [1e-4]*9, B,
+                                                          seir_data['Gamma']), rtol=1e-12)
+    # without infections there is no epidemic
+    np.testing.assert_array_equal(final_size('SIR', [0]*18, seir_data['B'],
+                                             seir_data['Gamma']), 0)
+
+
+def test_endemic_equilibrium_matches_integration(seir_data, make_sim):
+    sim = make_sim(model_type='SIS', x0=[1e-4]*9, policy_list=['Uncontained'],
+                   policy_switch_times=[0], t_end=1000, t_step=0.5)
+    I_eq = endemic_equilibrium('SIS', seir_data['B'], seir_data['Gamma'])
+    np.testing.assert_allclose(I_eq, sim.sol_dict['I'][-1], atol=1e-8)
+
+
+@pytest.mark.parametrize('model_type', ['SIS', 'SIR', 'SEIR'])
+def test_endemic_equilibrium_is_steady(seir_data, model_type):
+    from mitepid.models import get_compartments
+
+    Ng = 9
+    Mu = None if model_type == 'SIS' else 0.01 * np.eye(Ng)
+    x_eq = endemic_equilibrium(model_type, seir_data['B'], seir_data['Gamma'], Mu=Mu,
+                               Sigma=seir_data['Sigma'])
+    dict_x = {key: x_eq[idx*Ng:(idx+1)*Ng]
+              for idx, key in enumerate(get_compartments(model_type))}
+    I = dict_x['I']
+    R = dict_x.get('R', 0)
+    E = dict_x.get('E', 0)
+    gamma = np.diag(seir_data['Gamma'])
+    mu = 0 if Mu is None else np.diag(Mu)
+    sigma = np.diag(seir_data['Sigma'])
+    S = 1 - I - R - E
+    assert np.all(I > 0)
+    # right-hand sides of the models
+    new_infections = S * (seir_data['B'] @ I)
+    if model_type == 'SEIR':
+        np.testing.assert_allclose(new_infections - (mu + sigma) * E, 0, atol=1e-12)
+        np.testing.assert_allclose(sigma * E - (mu + gamma) * I, 0, atol=1e-12)
+    else:
+        np.testing.assert_allclose(new_infections - (mu + gamma) * I, 0, atol=1e-12)
+    if model_type != 'SIS':
+        np.testing.assert_allclose(gamma * I - mu * R, 0, atol=1e-12)
+
+
+def test_disease_free_below_threshold(seir_data):
+    from mitepid.policies import spectral_radius
+
+    B = 0.9 * seir_data['B'] / spectral_radius(seir_data['B'], seir_data['Gamma'])
+    np.testing.assert_array_equal(endemic_equilibrium('SIS', B, seir_data['Gamma']), 0)
+
+
+def test_errors(seir_data):
+    with pytest.raises(ValueError):
+        final_size('SIS', [1e-4]*9, seir_data['B'], seir_data['Gamma'])
+    with pytest.raises(ValueError):
+        final_size('SIR', [1e-4]*18, seir_data['B'], seir_data['Gamma'],
+                   Mu=0.01 * np.eye(9))
+    with pytest.raises(ValueError):
+        endemic_equilibrium('SIR', seir_data['B'], seir_data['Gamma'])
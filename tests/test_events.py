@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of mitepid.events in epid_sim.
+
+@author: MiTepid contributors
+"""
+import numpy as np
+import pytest
+
+from mitepid.events import event
+from mitepid.policies import get_pop_weights
+
+
+def t_crossing(sim, threshold):
+    """First time the aggregate I of a simulation reaches the threshold, interpolated."""
+    I_agg = sim.sol_agg_dict['I'][:, 0]
+    t = sim.t_sol[:sim.n_rows]
+    idx = np.argmax(I_agg >= threshold)
+    return np.interp(threshold, I_agg[idx-1:idx+1], t[idx-1:idx+1])
+
+
+def test_locate(make_sim):
+    kwargs = dict(policy_list=['Uncontained'], policy_switch_times=[0], t_end=40)
+    sim = make_sim(**kwargs)
+    # the time step is 1e-3 days, so linear interpolation is accurate enough
+    sim_fine = make_sim(t_step=1e-3, **kwargs)
+    args_find = (sim.t_sol[:sim.n_rows], sim.sol_all[:sim.n_rows], sim.list_segments[0][2])
+    assert sim.find_event(*args_find)[2] is None
+    sim.events = {'lockdown': event('I', 0.01, action='Lockdown')}
+    t_event, x_event, name = sim.find_event(*args_find)
+    assert name == 'lockdown'
+    assert t_event % sim.t_step > 0
+    np.testing.assert_allclose(t_event, t_crossing(sim_fine, 0.01), atol=1e-5)
+    np.testing.assert_allclose(x_event[:9] @ get_pop_weights('Iran'), 0.01, rtol=1e-10)
+
+
+def test_switch_policy(make_sim):
+    from mitepid.integrators import integrate
+
+    kwargs = dict(policy_list=['Uncontained'], policy_switch_times=[0], t_end=150,
+                  integrator='odeint', rtol=1e-11, atol=1e-13)
+    sim = make_sim(events={'lockdown': event('I', 0.01, action='Lockdown')}, **kwargs)
+    (t_event, name, action), = sim.list_events
+    assert (name, action) == ('lockdown', 'Lockdown')
+    assert [info[:2] for info in sim.list_policy_info] == [(0, 'Uncontained'),
+                                                            (t_event, 'Lockdown')]
+    assert sim.n_rows == len(sim.t)
+    # before the event, as without it
+    sim_ref = make_sim(**kwargs)
+    t = sim.t_sol[:sim.n_rows]
+    n_before = np.count_nonzero(t < t_event)
+    np.testing.assert_array_equal(sim.sol_all[:n_before], sim_ref.sol_all[:n_before])
+    # after the event, from the state at the event with the new policy
+    sim_ref.events = sim.events
+    _, x_event, _ = sim_ref.find_event(sim_ref.t_sol[:sim_ref.n_rows],
+                                       sim_ref.sol_all[:sim_ref.n_rows],
+                                       sim_ref.list_segments[0][2])
+    model, _, args = sim.segment_model(sim.list_segments[1][2])
+    sol_after, _ = integrate('odeint', model, x_event, np.concatenate(([t_event], t[n_before:])),
+                             args=args, rtol=1e-11, atol=1e-13)
+    np.testing.assert_allclose(sim.sol_all[n_before:sim.n_rows], sol_after[1:], rtol=0,
+                               atol=1e-9)
+
+
+def test_terminate(make_sim):
+    # starting above the threshold, so the event is after the peak
+    x0 = [0.05]*9 + [0]*9 + [0.01]*9
+    dict_events = {'died_out': event('I', 0.005, direction='down', action='terminate')}
+    sim = make_sim(x0=x0, events=dict_events, t_end=400)
+    (t_event, name, action), = sim.list_events
+    assert action == 'terminate'
+    assert sim.t_stop == t_event
+    t = sim.t_sol[:sim.n_rows]
+    assert t[-1] <= t_event < t[-1] + sim.t_step
+    sim_ref = make_sim(x0=x0, t_end=400)
+    np.testing.assert_array_equal(sim.sol_all[:sim.n_rows], sim_ref.sol_all[:sim.n_rows])
+    I_agg = sim_ref.sol_agg_dict['I'][:, 0]
+    assert I_agg[sim.n_rows - 1] > 0.005 >= I_agg[sim.n_rows]
+
+
+def test_event_at_start(make_sim):
+    dict_events = {'high': event('I', 1e-5, action='Lockdown'),
+                   'stop': event('R', 0.5, action='terminate')}
+    sim = make_sim(events=dict_events, policy_list=['Uncontained'], policy_switch_times=[0])
+    assert sim.list_events[0] == (0, 'high', 'Lockdown')
+    assert sim.list_policy_info[0][1] == 'Lockdown'
+    sim_ref = make_sim(policy_list=['Lockdown'], policy_switch_times=[0])
+    np.testing.assert_array_equal(sim.sol_all[:sim.n_rows], sim_ref.sol_all[:sim_ref.n_rows])
+
+
+@pytest.mark.parametrize('direction', ['up', 'down'])
+def test_condition_sign(direction):
+    x = np.zeros((2, 27))
+    x[1, :9] = 1.0
+    g = event('I', 0.5, direction=direction).condition(x, ['I', 'R', 'E'], 'Iran')
+    np.testing.assert_allclose(g, [-0.5, 0.5] if direction == 'up' else [0.5, -0.5])
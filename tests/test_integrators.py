@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of mitepid.integrators.
+
+@author: MiTepid contributors
+"""
+import numpy as np
+import pytest
+
+from mitepid.integrators import integrate
+
+
+@pytest.mark.parametrize('integrator, atol', [('odeint', 1e-6), ('LSODA', 1e-3), ('BDF', 1e-3),
+                                              ('RK4', 1e-8), ('linearised', 1e-4)])
+def test_backends_match_reference(make_sim, integrator, atol):
+    sim_ref = make_sim(integrator='odeint', rtol=1e-12, atol=1e-14)
+    sim = make_sim(integrator=integrator, rtol=1e-8, atol=1e-10)
+    assert sim.n_rows == sim_ref.n_rows
+    np.testing.assert_allclose(sim.sol_all[:sim.n_rows], sim_ref.sol_all[:sim.n_rows],
+                               rtol=0, atol=atol)
+    assert all(info['integrator'] == integrator for info in sim.list_solver_info)
+    assert all(info['nfev'] > 0 for info in sim.list_solver_info)
+
+
+def test_linearised_exact_for_linear_model():
+    from scipy.linalg import expm
+
+    A = np.array([[-0.3, 0.2], [0.1, 0.05]])
+    c = np.array([0.01, -0.02])
+
+    def model(x, t, out=None):
+        return A @ x + c
+
+    def model_jac(x, t, out=None):
+        return A
+
+    x0 = np.array([1.0, 2.0])
+    t = np.linspace(0, 20, 5)
+    sol, info = integrate('linearised', model, x0, t, model_jac=model_jac)
+    # exact solution of dx/dt = A x + c
+    x_inf = -np.linalg.solve(A, c)
+    sol_exact = np.array([x_inf + expm(A * t_k) @ (x0 - x_inf) for t_k in t])
+    np.testing.assert_allclose(sol, sol_exact, rtol=1e-12)
+    assert info['njev'] == len(t) - 1
+
+
+def test_linearised_needs_jacobian():
+    with pytest.raises(ValueError):
+        integrate('linearised', lambda x, t, out=None: -x, np.ones(2), np.linspace(0, 1, 3))
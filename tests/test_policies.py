@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of the cached policies and their R0, see mitepid.policies.
+
+@author: MiTepid contributors
+"""
+import numpy as np
+
+from mitepid.policies import spectral_radius, get_B_policy_R0
+
+
+def test_spectral_radius(seir_data):
+    B, D = seir_data['B'], seir_data['D']
+    R0 = np.max(np.abs(np.linalg.eigvals(-np.linalg.inv(D) @ B)))
+    assert abs(spectral_radius(B, D) - R0) < 1e-12
+    # a non-diagonal D
+    D_full = D + 0.01 * np.ones(D.shape)
+    R0_full = np.max(np.abs(np.linalg.eigvals(np.linalg.inv(D_full) @ B)))
+    assert abs(spectral_radius(B, D_full) - R0_full) < 1e-12
+    # zero and nilpotent policies
+    assert spectral_radius(np.zeros(B.shape), D) == 0
+    assert spectral_radius(np.triu(B, 1), D) == 0
+
+
+def test_get_B_policy_R0_cached(seir_data):
+    B, D = seir_data['B'], seir_data['D']
+    B_policy, R0, scales = get_B_policy_R0(B, D, 'Iran', 'Lockdown', return_scales=True)
+    np.testing.assert_array_equal(scales, [0.1]*9)
+    np.testing.assert_allclose(B_policy, 0.1 * B)
+    assert R0 == spectral_radius(B_policy, D)
+    assert not B_policy.flags.writeable
+    B_cached, _ = get_B_policy_R0(B, D, 'Iran', 'Lockdown')
+    assert B_cached is B_policy
+    # a float policy is scaled to that R0
+    assert abs(get_B_policy_R0(B, D, 'Iran', 1.2)[1] - 1.2) < 1e-12
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of the reduced precision storage of epid_sim and results_store (dtype).
+
+@author: MiTepid contributors
+"""
+import numpy as np
+import pytest
+
+from mitepid.results_store import results_store
+
+
+def test_epid_sim_float32(make_sim):
+    sim_ref = make_sim()
+    sim = make_sim(dtype=np.float32)
+    assert sim.sol_all.dtype == np.float32
+    dict_report = sim.precision_report()
+    for key in sim.sol_dict:
+        error = np.abs(sim.sol_dict[key].astype(float) - sim_ref.sol_dict[key])
+        # rows after the first segment continue from the rounded state
+        assert np.max(error) < 1e-6
+        assert dict_report[key]['max_abs_error'] <= np.finfo(np.float32).eps
+    assert all(info['max_abs_error'] == 0 for info in sim_ref.precision_report().values())
+
+
+@pytest.mark.parametrize('dtype', ['float32', 'uint16'])
+def test_store_error_report(tmp_path, make_sim, dtype):
+    sim = make_sim()
+    file_store = tmp_path / 'store.zip'
+    with results_store(file_store, mode='w', dtype=dtype) as store:
+        store.append(sim)
+    with results_store(file_store) as store:
+        dict_report = store.error_report()[0]
+        assert set(dict_report) == {'sol/' + key for key in sim.sol_dict} | \
+            {'sol_agg/' + key for key in sim.sol_agg_dict}
+        _, sol_dict, sol_agg_dict, _, _ = store.read(0)
+        for group, dict_read, dict_ref in [('sol/', sol_dict, sim.sol_dict),
+                                           ('sol_agg/', sol_agg_dict, sim.sol_agg_dict)]:
+            for key, value in dict_read.items():
+                assert value.dtype == np.float64
+                error = np.max(np.abs(value - dict_ref[key]))
+                info = dict_report[group + key]
+                assert info['dtype'] == np.dtype(dtype).str
+                np.testing.assert_allclose(error, info['max_abs_error'], rtol=1e-6, atol=1e-15)
+                assert info['max_rel_error'] < (1e-4 if dtype == 'uint16' else 1e-6)
+        # partial reads are restored the same way
+        np.testing.assert_array_equal(store.read_column('sol/I', rows=slice(10, 20))[0],
+                                      sol_dict['I'][10:20])
+
+
+def test_store_rejects_dtype(tmp_path):
+    with pytest.raises(ValueError):
+        results_store(tmp_path / 'store.zip', mode='w', dtype='int16')
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of mitepid.reducers against the full trajectories.
+
+@author: MiTepid contributors
+"""
+import numpy as np
+import pytest
+
+from mitepid.reducers import (peak, final, cumulative_infections, integral, time_above,
+                              threshold_crossing)
+
+
+def get_reducers():
+    w_ICU = np.linspace(0.01, 0.1, 9)
+    return {'peak_I': peak('I'), 'peak_I_groups': peak('I', per_group=True),
+            'final_R': final('R'), 'infected': cumulative_infections(),
+            'ICU': integral('I', weights=w_ICU), 'above': time_above('I', threshold=0.02),
+            'up': threshold_crossing('I', threshold=0.02)}
+
+
+def check_summary(dict_summary, t, sol_dict, sol_agg_dict):
+    """Compare the summary with reductions of the full trajectories of one simulation."""
+    I_agg = sol_agg_dict['I'][:, 0]
+    idx_peak = np.argmax(I_agg)
+    np.testing.assert_allclose(dict_summary['peak_I']['value'], I_agg[idx_peak], rtol=1e-12)
+    assert dict_summary['peak_I']['t'] == t[idx_peak]
+    np.testing.assert_allclose(dict_summary['peak_I_groups']['value'],
+                               np.max(sol_dict['I'], axis=0), rtol=1e-12)
+    np.testing.assert_array_equal(dict_summary['peak_I_groups']['t'],
+                                  t[np.argmax(sol_dict['I'], axis=0)])
+    np.testing.assert_allclose(dict_summary['final_R'], sol_agg_dict['R'][-1, 0], rtol=1e-12)
+    np.testing.assert_allclose(dict_summary['infected'],
+                               sum(sol_agg_dict[key][-1, 0] for key in ['I', 'R', 'E']),
+                               rtol=1e-12)
+    I_ICU = sol_dict['I'] @ np.linspace(0.01, 0.1, 9)
+    np.testing.assert_allclose(dict_summary['ICU'],
+                               np.sum(0.5 * np.diff(t) * (I_ICU[1:] + I_ICU[:-1])), rtol=1e-12)
+    # crossings and the time above, on a fine linear interpolation
+    t_fine = np.linspace(t[0], t[-1], 2000001)
+    I_fine = np.interp(t_fine, t, I_agg)
+    is_above = I_fine >= 0.02
+    np.testing.assert_allclose(dict_summary['above'], np.sum(is_above) * (t_fine[1] - t_fine[0]),
+                               atol=1e-3)
+    t_up = t_fine[np.argmax(is_above)] if np.any(is_above) else np.nan
+    np.testing.assert_allclose(dict_summary['up'], t_up, atol=1e-3)
+
+
+@pytest.mark.parametrize('output_dt', [None, 1.0])
+def test_summary_only_matches_trajectories(make_sim, output_dt):
+    sim_ref = make_sim(t_end=150, output_dt=output_dt)
+    sim = make_sim(t_end=150, output_dt=output_dt, reducers=get_reducers(), summary_only=True)
+    with pytest.raises(ValueError):
+        sim.sol_dict
+    t = sim_ref.t_sol[:sim_ref.n_rows]
+    assert np.max(sim_ref.sol_agg_dict['I']) > 0.02
+    check_summary(sim.summary, t, sim_ref.sol_dict, sim_ref.sol_agg_dict)
+
+
+def test_threshold_crossing_down(make_sim):
+    # starting above the threshold, so the first crossing down is after the peak
+    x0 = [0.05]*9 + [0]*9 + [0.01]*9
+    dict_reducers = {'down': threshold_crossing('I', threshold=0.02, direction='down'),
+                     'never': threshold_crossing('I', threshold=0.9)}
+    sim_ref = make_sim(x0=x0, t_end=150)
+    sim = make_sim(x0=x0, t_end=150, reducers=dict_reducers, summary_only=True)
+    t = sim_ref.t_sol[:sim_ref.n_rows]
+    I_agg = sim_ref.sol_agg_dict['I'][:, 0]
+    idx = np.argmax(I_agg <= 0.02)
+    assert idx > np.argmax(I_agg)
+    t_down = np.interp(0.02, I_agg[[idx, idx-1]], t[[idx, idx-1]])
+    np.testing.assert_allclose(sim.summary['down'], t_down, rtol=1e-12)
+    assert np.isnan(sim.summary['never'])
+
+
+def test_ensemble_reducers(seir_data, make_sim):
+    from mitepid.epid_ensemble import epid_ensemble
+
+    list_x0 = [[1e-4]*9, [1e-5]*9]
+    ens = epid_ensemble(model_type='SEIR', country='Iran', x0=list_x0, B=seir_data['B'],
+                        t_end=150, policy_list=['Uncontained', 1.5],
+                        policy_switch_times=[0, 40], Gamma=seir_data['Gamma'],
+                        Sigma=seir_data['Sigma'], integrator='RK4', reducers=get_reducers(),
+                        summary_only=True)
+    for idx, x0 in enumerate(list_x0):
+        sim_ref = make_sim(x0=x0, t_end=150)
+        dict_summary = {key: {k: v[idx] for k, v in value.items()} if isinstance(value, dict)
+                        else value[idx] for key, value in ens.summary.items()}
+        check_summary(dict_summary, sim_ref.t_sol[:sim_ref.n_rows], sim_ref.sol_dict,
+                      sim_ref.sol_agg_dict)
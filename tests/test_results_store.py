@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of mitepid.results_store.
+
+@author: MiTepid contributors
+"""
+import numpy as np
+import pytest
+
+from mitepid.results_store import results_store
+
+
+@pytest.fixture
+def list_sims(make_sim):
+    return [make_sim(), make_sim(policy_list=['Uncontained', 'Lockdown'])]
+
+
+@pytest.mark.parametrize('chunk_rows', [None, 64])
+def test_round_trip(tmp_path, list_sims, chunk_rows):
+    file_store = tmp_path / 'store.zip'
+    with results_store(file_store, mode='w', chunk_rows=chunk_rows) as store:
+        store.append(list_sims[0], params={'label': 'first'})
+    # append to the existing store
+    with results_store(file_store, mode='a', chunk_rows=chunk_rows) as store:
+        assert store.append(list_sims[1]) == 1
+    with results_store(file_store) as store:
+        assert len(store) == 2
+        for idx, sim in enumerate(list_sims):
+            t, sol_dict, sol_agg_dict, list_policy_info, params = store.read(idx)
+            np.testing.assert_array_equal(t, sim.t[:sim.sol_dict['I'].shape[0]])
+            for key in sim.sol_dict:
+                np.testing.assert_array_equal(sol_dict[key], sim.sol_dict[key])
+                np.testing.assert_array_equal(sol_agg_dict[key], sim.sol_agg_dict[key])
+            assert [info[1] for info in list_policy_info] == sim.policy_list
+            np.testing.assert_array_equal(params['B'], sim.B)
+            assert params['policy_list'] == sim.policy_list
+        assert store.read_params([0])[0]['label'] == 'first'
+        assert store.error_report() == [{}, {}]
+
+
+@pytest.mark.parametrize('chunk_rows', [None, 64])
+def test_partial_reads(tmp_path, list_sims, chunk_rows):
+    file_store = tmp_path / 'store.zip'
+    with results_store(file_store, mode='w', chunk_rows=chunk_rows) as store:
+        for sim in list_sims:
+            store.append(sim)
+    with results_store(file_store) as store:
+        for rows in [slice(0, 10), slice(50, 200), slice(60, 70), slice(900, None),
+                     slice(-5, None), slice(10, 10)]:
+            list_I = store.read_column('sol_agg/I', scenarios=[1], rows=rows)
+            np.testing.assert_array_equal(list_I[0], list_sims[1].sol_agg_dict['I'][rows])
+        array_I = store.read_column('sol/I', stack=True)
+        np.testing.assert_array_equal(array_I, [sim.sol_dict['I'] for sim in list_sims])
+
+
+def test_errors(tmp_path, list_sims):
+    file_store = tmp_path / 'store.zip'
+    with pytest.raises(ValueError):
+        results_store(file_store, mode='w', chunk_rows=0)
+    with results_store(file_store, mode='w') as store:
+        store.append(list_sims[0])
+    with results_store(file_store) as store:
+        with pytest.raises(RuntimeError):
+            store.append(list_sims[1])
+        with pytest.raises(ValueError):
+            store.read_column('sol/I', rows=slice(0, 10, 2))
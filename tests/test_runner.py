@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of mitepid.runner.
+
+@author: MiTepid contributors
+"""
+import numpy as np
+import pytest
+
+from mitepid.runner import run_scenarios, result_to_dicts
+
+
+@pytest.fixture
+def list_specs(seir_data):
+    spec = dict(model_type='SEIR', B=seir_data['B'], Gamma=seir_data['Gamma'],
+                Sigma=seir_data['Sigma'], country='Iran', x0=[1e-4]*9, t_end=100,
+                integrator='RK4')
+    return [dict(spec, policy_list=['Uncontained'], policy_switch_times=[0]),
+            dict(spec, policy_list=['Uncontained', 1.5], policy_switch_times=[0, 40])]
+
+
+def test_run_scenarios_matches_epid_sim(list_specs, make_sim):
+    list_results = run_scenarios(list_specs, max_workers=2)
+    for spec, result in zip(list_specs, list_results):
+        sim = make_sim(policy_list=spec['policy_list'],
+                       policy_switch_times=spec['policy_switch_times'])
+        sol_dict, sol_agg_dict = result_to_dicts(result)
+        np.testing.assert_array_equal(result['t'], sim.t_sol[:sim.n_rows])
+        for key in sim.sol_dict:
+            np.testing.assert_array_equal(sol_dict[key], sim.sol_dict[key])
+            np.testing.assert_array_equal(sol_agg_dict[key], sim.sol_agg_dict[key])
+        assert [x[1] for x in result['list_policy_info']] == spec['policy_list']
+
+
+def test_run_scenarios_returns_errors(list_specs):
+    # steady_tol is only allowed with RK4, so this scenario raises ValueError in its worker
+    spec_bad = dict(list_specs[0], integrator='odeint', steady_tol=1e-6)
+    list_results = run_scenarios([spec_bad, list_specs[0]], max_workers=2)
+    assert isinstance(list_results[0], ValueError)
+    assert isinstance(list_results[1], dict)
+
+
+def test_run_scenarios_reducers(list_specs):
+    from mitepid.reducers import peak
+
+    list_results = run_scenarios(list_specs, max_workers=2, reducers={'peak': peak('I')})
+    for result in list_results:
+        assert 'sol' not in result
+        assert result['summary']['peak']['value'] > 0
+
+
+def test_run_scenarios_timeout(list_specs):
+    spec_slow = dict(list_specs[0], t_end=1e6)
+    list_results = run_scenarios([spec_slow, list_specs[1]], max_workers=2, timeout=3)
+    assert isinstance(list_results[0], TimeoutError)
+    assert isinstance(list_results[1], dict)
+    np.testing.assert_array_equal(list_results[1]['sol'],
+                                  run_scenarios([list_specs[1]], max_workers=1)[0]['sol'])
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of mitepid.scenario_tree against flat epid_sim runs.
+
+@author: MiTepid contributors
+"""
+import numpy as np
+import pytest
+
+from mitepid.scenario_tree import scenario_tree
+
+
+@pytest.fixture
+def kwargs_tree(seir_data):
+    return dict(model_type='SEIR', B=seir_data['B'], Gamma=seir_data['Gamma'],
+                Sigma=seir_data['Sigma'], country='Iran', x0=[1e-4]*9, t_end=120,
+                integrator='RK4')
+
+
+def test_tree_matches_flat_runs(kwargs_tree, make_sim):
+    list_switch_times = [[0, 40], [0, 40, 80], [0, 40, 80], [0, 60]]
+    list_policy_list = [['Uncontained', 1.5], ['Uncontained', 1.5, 'Lockdown'],
+                        ['Uncontained', 1.5, 1.2], ['Uncontained', 1.2]]
+    list_xternal = [{}, {}, {90: [1e-4]*9}, {}]
+    tree = scenario_tree(list_switch_times, list_policy_list, list_xternal, **kwargs_tree)
+    list_leaves = tree.run()
+    # the first two segments are shared by the first three schedules
+    assert tree.N_segments < tree.N_segments_flat
+    for idx, leaf in enumerate(list_leaves):
+        sim = make_sim(policy_list=list_policy_list[idx],
+                       policy_switch_times=list_switch_times[idx],
+                       xternal_inputs=list_xternal[idx], t_end=120)
+        for key in sim.sol_dict:
+            np.testing.assert_array_equal(leaf.sol_dict[key], sim.sol_dict[key])
+
+
+@pytest.mark.parametrize('key, value', [('steady_tol', 1e-6),
+                                        ('events', {'e': ('I', 0.01, 'up', 'Lockdown')})])
+def test_tree_rejects_early_stops(kwargs_tree, key, value):
+    with pytest.raises(ValueError):
+        scenario_tree([[0]], [['Uncontained']], **{key: value}, **kwargs_tree)
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of mitepid.analysis.schedule.
+
+@author: MiTepid contributors
+"""
+import numpy as np
+import pytest
+
+from mitepid.analysis import schedule
+from mitepid.analysis.schedule import (optimise_schedule, evaluate_schedules, schedule_cost,
+                                       policy_costs)
+
+LIST_POLICIES = ['Uncontained', 1.5, 1.2, 'Lockdown']
+
+
+@pytest.fixture
+def dict_model(seir_data):
+    return dict(model_type='SEIR', country='Iran', x0=[1e-4]*9, B=seir_data['B'], t_end=200,
+                Gamma=seir_data['Gamma'], Sigma=seir_data['Sigma'], rtol=1e-10, atol=1e-12)
+
+
+def objective_epid_sim(make_sim, schedule_in, objective, threshold=None):
+    """Objective of a schedule from the full trajectory of epid_sim."""
+    sim = make_sim(policy_switch_times=schedule_in[0], policy_list=schedule_in[1], t_end=200)
+    I_agg = sim.sol_agg_dict['I'][:, 0]
+    t = sim.t_sol[:sim.n_rows]
+    if objective == 'peak':
+        return np.max(I_agg)
+    if objective == 'integral':
+        return np.sum(0.5 * np.diff(t) * (I_agg[1:] + I_agg[:-1]))
+    t_fine = np.linspace(0, t[-1], 200001)
+    return np.sum(np.interp(t_fine, t, I_agg) >= threshold) * (t_fine[1] - t_fine[0])
+
+
+@pytest.mark.parametrize('objective', ['peak', 'integral', 'days_above'])
+def test_evaluate_schedules(dict_model, make_sim, objective):
+    list_schedules = [([0., 30., 80.], ['Uncontained', 'Lockdown', 1.2]),
+                      ([0., 50.], [1.5, 'Uncontained']),
+                      ([0.], ['Uncontained'])]
+    obj = evaluate_schedules(list_schedules, dict_model, objective, threshold=0.02)
+    for idx, schedule_in in enumerate(list_schedules):
+        np.testing.assert_allclose(obj[idx], objective_epid_sim(make_sim, schedule_in, objective,
+                                                                threshold=0.02),
+                                   rtol=1e-6, atol=2e-3 if objective == 'days_above' else 0)
+    with pytest.raises(ValueError):
+        evaluate_schedules(list_schedules, dict_model, 'final')
+
+
+def test_schedule_cost(dict_model):
+    list_cost = policy_costs(dict_model, LIST_POLICIES)
+    assert list_cost[0] == 0
+    np.testing.assert_allclose(list_cost[1:3], [1 - 1.5 / 2.95, 1 - 1.2 / 2.95], rtol=1e-6)
+    assert schedule_cost([0, 10, 50], [3, 0, 1], np.array(list_cost), 100) == \
+        pytest.approx(10 * list_cost[3] + 50 * list_cost[1])
+
+
+def test_optimise_schedule(dict_model, make_sim):
+    res = optimise_schedule(dict_model, LIST_POLICIES, budget=40, N_switch=2, N_pop=16,
+                            N_generations=6, seed=0, verbose=False)
+    assert res['cost'] <= 40
+    assert res['policy_switch_times'][0] == 0
+    assert res['history'].shape == (6, 2)
+    # the best schedule survives each generation
+    assert np.all(np.diff(res['history'][:, 0]) <= 0)
+    schedule_best = (res['policy_switch_times'], res['policy_list'])
+    np.testing.assert_allclose(res['objective'], objective_epid_sim(make_sim, schedule_best,
+                                                                    'peak'), rtol=1e-6)
+    # better than no restrictions
+    assert res['objective'] < objective_epid_sim(make_sim, ([0.], ['Uncontained']), 'peak')
+
+
+def test_optimise_schedule_workers(dict_model, monkeypatch):
+    kwargs = dict(budget=40, N_switch=2, N_pop=9, N_generations=3, seed=1, verbose=False)
+    res = optimise_schedule(dict_model, LIST_POLICIES, max_workers=1, **kwargs)
+    # chunks of 4 schedules on 2 workers
+    monkeypatch.setattr(schedule, 'min_schedules_per_worker', 4)
+    res_pool = optimise_schedule(dict_model, LIST_POLICIES, max_workers=2, **kwargs)
+    assert res_pool['policy_switch_times'] == res['policy_switch_times']
+    assert res_pool['policy_list'] == res['policy_list']
+    # adaptive steps are shared by the schedules of a chunk, so the objectives differ slightly
+    np.testing.assert_allclose(res_pool['history'], res['history'], rtol=1e-8)
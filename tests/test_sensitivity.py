@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of the gradients of epid_sim, see mitepid.sensitivity.
+
+@author: MiTepid contributors
+"""
+import numpy as np
+import pytest
+
+# policies with fixed scales, a float policy would rescale B to its R0 when B changes
+SCALES = 0.5
+POLICY_LIST = ['Uncontained', [SCALES]*9]
+
+
+def _final_R(sim):
+    return sim.sol_agg_dict['R'][-1, 0]
+
+
+@pytest.fixture
+def sim_sens(make_sim):
+    sim = make_sim(lazy=True, policy_list=POLICY_LIST)
+    sim.calc_sol(sensitivity=True)
+    return sim
+
+
+def test_sensitivity_keeps_solution(make_sim, sim_sens):
+    sim = make_sim(policy_list=POLICY_LIST)
+    np.testing.assert_array_equal(sim_sens.sol_all[:sim_sens.n_rows], sim.sol_all[:sim.n_rows])
+
+
+@pytest.mark.parametrize('objective, compartment', [('peak', 'I'), ('final', 'R')])
+def test_forward_matches_adjoint(sim_sens, objective, compartment):
+    grad = sim_sens.gradient(objective, compartment, mode='forward')
+    grad_adjoint = sim_sens.gradient(objective, compartment, mode='adjoint')
+    for key in grad.dtype.names:
+        np.testing.assert_allclose(grad_adjoint[key], grad[key], rtol=0,
+                                   atol=1e-7 * np.max(np.abs(grad[key])))
+
+
+def test_forward_finite_differences(seir_data, make_sim, sim_sens):
+    grad = sim_sens.gradient('final', 'R')
+    eps = 1e-6
+
+    def _fd(**kwargs_plus_minus):
+        list_sims = []
+        for idx in range(2):
+            dict_kwargs = dict(policy_list=POLICY_LIST)
+            dict_kwargs.update({key: val[idx] for key, val in kwargs_plus_minus.items()})
+            list_sims.append(make_sim(**dict_kwargs))
+        return (_final_R(list_sims[0]) - _final_R(list_sims[1])) / (2 * eps)
+
+    list_B = [seir_data['B'].copy() for _ in range(2)]
+    list_B[0][3, 4] += eps
+    list_B[1][3, 4] -= eps
+    assert grad['B'][3, 4] == pytest.approx(_fd(B=list_B), rel=1e-5)
+    list_Gamma = [seir_data['Gamma'].copy() for _ in range(2)]
+    list_Gamma[0][2, 2] += eps
+    list_Gamma[1][2, 2] -= eps
+    assert grad['Gamma'][2] == pytest.approx(_fd(Gamma=list_Gamma), rel=1e-5)
+    list_x0 = [[1e-4]*9 for _ in range(2)]
+    list_x0[0][1] += eps
+    list_x0[1][1] -= eps
+    assert grad['x0'][1] == pytest.approx(_fd(x0=list_x0), rel=1e-5)
+    list_scales = [[SCALES]*9 for _ in range(2)]
+    list_scales[0][4] += eps
+    list_scales[1][4] -= eps
+    assert grad['scales'][1, 4] == pytest.approx(
+        _fd(policy_list=[['Uncontained', x] for x in list_scales]), rel=1e-5)
+
+
+def test_extend_keeps_sensitivities(make_sim):
+    sim = make_sim(lazy=True, policy_list=POLICY_LIST)
+    sim.calc_sol(sensitivity=True)
+    sim.extend([80], ['Lockdown'], t_end=150)
+    sim.run()
+    sim_full = make_sim(lazy=True, policy_list=POLICY_LIST + ['Lockdown'],
+                        policy_switch_times=[0, 40, 80], t_end=150)
+    sim_full.calc_sol(sensitivity=True)
+    assert sim.n_rows == sim_full.n_rows
+    np.testing.assert_array_equal(sim.sens_all[:sim.n_rows], sim_full.sens_all[:sim.n_rows])
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of the early termination of epid_sim at a steady state (steady_tol).
+
+@author: MiTepid contributors
+"""
+import numpy as np
+import pytest
+
+
+def test_steady_state_held(make_sim):
+    kwargs = dict(policy_list=['Uncontained'], policy_switch_times=[0], t_end=540)
+    sim_ref = make_sim(**kwargs)
+    sim = make_sim(steady_tol=1e-8, **kwargs)
+    assert 0 < sim.t_steady < 540
+    assert sim.n_rows == sim_ref.n_rows
+    t = sim.t_sol[:sim.n_rows]
+    np.testing.assert_array_equal(t, sim_ref.t_sol[:sim_ref.n_rows])
+    n_steady = np.count_nonzero(t <= sim.t_steady + 1e-9)
+    # the same solution up to the steady state, held afterwards
+    np.testing.assert_allclose(sim.sol_all[:n_steady], sim_ref.sol_all[:n_steady], rtol=0,
+                               atol=1e-15)
+    np.testing.assert_array_equal(sim.sol_all[n_steady:sim.n_rows],
+                                  np.broadcast_to(sim.sol_all[n_steady-1],
+                                                  (sim.n_rows - n_steady, sim.sol_all.shape[1])))
+    # which is close to the full solution
+    np.testing.assert_allclose(sim.sol_all[:sim.n_rows], sim_ref.sol_all[:sim_ref.n_rows],
+                               rtol=0, atol=1e-6)
+    assert np.max(sim.sol_agg_dict['I'][n_steady-1]) < 1e-7
+    # about half of the steps were integrated
+    assert sum(info['nfev'] for info in sim.list_solver_info) < \
+        0.6 * sum(info['nfev'] for info in sim_ref.list_solver_info)
+
+
+def test_steady_state_not_reached(make_sim):
+    sim_ref = make_sim()
+    sim = make_sim(steady_tol=1e-8)
+    assert sim.t_steady is None
+    np.testing.assert_allclose(sim.sol_all[:sim.n_rows], sim_ref.sol_all[:sim_ref.n_rows],
+                               rtol=0, atol=1e-15)
+
+
+def test_steady_state_needs_rk4(make_sim):
+    with pytest.raises(ValueError):
+        make_sim(steady_tol=1e-8, integrator='odeint')
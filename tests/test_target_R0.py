@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of mitepid.analysis.R0.target_R0_scales.
+
+@author: MiTepid contributors
+"""
+import numpy as np
+import pytest
+
+from mitepid.analysis import R0
+from mitepid.analysis.R0 import target_R0_scales
+from mitepid.policies import spectral_radius
+
+
+@pytest.mark.parametrize('R0_target', [0.8, 1.2, 2.0])
+def test_target_R0_scales(seir_data, R0_target):
+    B, D = seir_data['B'], seir_data['D']
+    weights = np.array([17.4, 13.9, 15.5, 20.0, 13.6, 9.7, 6.2, 2.7, 1.0])
+    list_scales = target_R0_scales(B, D, R0_target, weights)
+    assert np.all(list_scales > 0) and np.all(list_scales <= 1)
+    assert spectral_radius(list_scales[:, None] * B, D) == pytest.approx(R0_target, rel=1e-8)
+    # no more disruptive than reducing all contacts by the same factor
+    scale_uniform = R0_target / spectral_radius(B, D)
+    cost = np.sum(weights * np.log(list_scales)**2)
+    cost_uniform = np.sum(weights * np.log(scale_uniform)**2)
+    assert cost <= cost_uniform * (1 + 1e-9)
+
+
+def test_target_R0_scales_above_R0(seir_data):
+    B, D = seir_data['B'], seir_data['D']
+    np.testing.assert_array_equal(target_R0_scales(B, D, 10.0), np.ones(B.shape[0]))
+
+
+def test_target_R0_cache(seir_data, monkeypatch):
+    B, D = seir_data['B'], seir_data['D']
+    monkeypatch.setattr(R0, 'target_R0_cache_size', 2)
+    monkeypatch.setattr(R0, 'dict_target_R0_cache', {})
+    list_scales = target_R0_scales(B, D, 1.5)
+    assert not list_scales.flags.writeable
+    assert target_R0_scales(B, D, 1.5) is list_scales
+    list_scales_2 = target_R0_scales(B, D, 1.2)
+    assert target_R0_scales(B, D, 1.5) is list_scales
+    # 1.5 was used last, so 1.2 is evicted
+    target_R0_scales(B, D, 1.0)
+    assert len(R0.dict_target_R0_cache) == 2
+    assert target_R0_scales(B, D, 1.5) is list_scales
+    assert target_R0_scales(B, D, 1.2) is not list_scales_2
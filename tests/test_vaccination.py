@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of mitepid.analysis.vaccination.
+
+@author: MiTepid contributors
+"""
+import numpy as np
+import pytest
+
+from mitepid.analysis.vaccination import (optimise_allocation, allocation_objective,
+                                          project_allocation)
+from mitepid.policies import get_pop_weights
+
+X0 = np.array([1e-5]*9 + [0]*9 + [1e-5]*9)
+
+
+@pytest.fixture
+def rates(seir_data):
+    B = seir_data['B']
+    return B, np.diag(seir_data['Gamma']), np.zeros(9), np.diag(seir_data['Sigma'])
+
+
+@pytest.mark.parametrize('objective', ['final_size', 'peak'])
+def test_gradient_finite_differences(rates, objective):
+    weights = get_pop_weights('Iran')
+    arr_R = np.random.default_rng(0).uniform(0.05, 0.5, (3, 9))
+    kwargs = dict(objective=objective, weights=weights, t_end=300)
+    f, grad = allocation_objective('SEIR', arr_R, X0, *rates, **kwargs)
+    f_only, grad_none = allocation_objective('SEIR', arr_R, X0, *rates, return_grad=False,
+                                             **kwargs)
+    np.testing.assert_array_equal(f_only, f)
+    assert grad_none is None
+    eps = 1e-6
+    for k in range(9):
+        step = np.zeros(9)
+        step[k] = eps
+        f_plus, _ = allocation_objective('SEIR', arr_R + step, X0, *rates, **kwargs)
+        f_minus, _ = allocation_objective('SEIR', arr_R - step, X0, *rates, **kwargs)
+        np.testing.assert_allclose(grad[:, k], (f_plus - f_minus) / (2 * eps), rtol=1e-4,
+                                   atol=1e-6 * np.max(np.abs(grad)))
+
+
+def test_peak_matches_epid_sim(rates, make_sim):
+    weights = get_pop_weights('Iran')
+    arr_R = np.random.default_rng(1).uniform(0.05, 0.5, (2, 9))
+    f, _ = allocation_objective('SEIR', arr_R, X0, *rates, objective='peak', weights=weights,
+                                t_end=300, t_step=0.1, return_grad=False)
+    for idx, R in enumerate(arr_R):
+        x0 = np.array(X0)
+        x0[9:18] = R
+        sim = make_sim(x0=list(x0), policy_list=['Uncontained'], policy_switch_times=[0],
+                       t_end=300, integrator='odeint', rtol=1e-11, atol=1e-14)
+        np.testing.assert_allclose(f[idx], np.max(sim.sol_agg_dict['I']), rtol=1e-7)
+
+
+@pytest.mark.parametrize('objective', ['final_size', 'peak'])
+def test_optimise_allocation(seir_data, rates, objective):
+    pop = get_pop_weights('Iran')
+    kwargs = dict(model_type='SEIR', x0=list(X0), B=seir_data['B'], Gamma=seir_data['Gamma'],
+                  total=0.15, Sigma=seir_data['Sigma'], country='Iran', objective=objective,
+                  R_min=0.05, R_max=0.95, t_end=300, seed=0)
+    res = optimise_allocation(**kwargs)
+    res_worst = optimise_allocation(worst=True, **kwargs)
+    for x0R in [res['x0R'], res_worst['x0R']]:
+        assert pop @ x0R == pytest.approx(0.15, rel=1e-9)
+        assert np.all(x0R >= 0.05 - 1e-12) and np.all(x0R <= 0.95 + 1e-12)
+    np.testing.assert_array_equal(res['x0'][9:18], res['x0R'])
+    # better, and worse, than any feasible allocation
+    lower, upper = np.full(9, 0.05), np.full(9, 0.95)
+    arr_R = np.random.default_rng(2).uniform(0.05, 0.95, (32, 9))
+    arr_R = project_allocation(np.vstack([np.full(9, 0.15), arr_R]), pop, 0.15, lower, upper)
+    f, _ = allocation_objective('SEIR', arr_R, X0, *rates, objective=objective, weights=pop,
+                                t_end=300, return_grad=False)
+    assert res['objective'] <= np.min(f) * (1 + 1e-9)
+    assert res_worst['objective'] >= np.max(f) * (1 - 1e-9)
+
+
+def test_total_out_of_bounds(seir_data):
+    with pytest.raises(ValueError):
+        optimise_allocation('SEIR', list(X0), seir_data['B'], seir_data['Gamma'], total=0.96,
+                            Sigma=seir_data['Sigma'], country='Iran', R_max=0.95)